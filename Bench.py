@@ -0,0 +1,196 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import resource
+import statistics
+import sys
+import time
+
+# Bộ benchmark chuẩn cho simulator: các workload assembly trong benchmarks/ được dịch bằng
+# RISCV_asembler.py rồi chạy trên RISCV_ISS và engine cũ RISCV_simulator.py.
+# Mỗi (workload, engine) chạy trong một process riêng để đo peak RSS, kết quả in ra
+# dạng bảng và JSON (--json) để so sánh trước/sau mỗi thay đổi hiệu năng.
+
+BENCH_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks")
+MEM_SIZE = 0x10000
+
+# name -> (file, giá trị x10 mong đợi khi chạy đúng)
+WORKLOADS = {
+    "dhrystone": ("dhrystone.s", 3466508),
+    "list": ("list.s", 4583550),
+    "matrix": ("matrix.s", 111616),
+    "statemachine": ("statemachine.s", 2062),
+    "memcpy": ("memcpy.s", 97920),
+    "bubblesort": ("bubblesort.s", 93736),
+    "quicksort": ("quicksort.s", 307682),
+    "crc32": ("crc32.s", 2001605520),
+    "ecall": ("ecall.s", 2000),
+    "context_switch": ("context_switch.s", 12001),
+}
+ENGINES = ("iss", "legacy")
+
+
+def assemble_workload(name):
+    """Dịch workload bằng RISCV_asembler.assemble_file (trong bộ nhớ), trả về danh sách word 32 bit."""
+    import RISCV_asembler as asm
+    image = asm.assemble_file(os.path.join(BENCH_DIR, WORKLOADS[name][0]))
+    if image.errors:
+        raise ValueError(f"{name}: {image.errors[0]}")
+    return image.words()
+
+
+def run_iss(words, max_instructions):
+    from ISS import RISCV_ISS
+    iss = RISCV_ISS(MEM_SIZE)
+    iss.verbose = False
+    iss.load_program_words(words)
+    iss.privilege_level = 0b01  # Giống engine cũ: khởi động ở S-mode
+    start = time.perf_counter()
+    executed = iss.run(max_instructions)
+    elapsed = time.perf_counter() - start
+    return executed, elapsed, iss.regs[10] & 0xFFFFFFFF, iss.halted, None
+
+
+def run_legacy(words, max_instructions):
+    # simulate() đọc ./text.bin và dừng sau 100 lệnh, nên vòng lặp của nó được gọi trực tiếp qua step()
+    import RISCV_simulator as sim
+    sim.reset_state()
+    instructions = [f"{word:032b}\n" for word in words]
+    end = 4 * len(instructions)
+    executed = 0
+    completed = False
+    error = None
+    start = time.perf_counter()
+    try:
+        while executed < max_instructions:
+            if not 0 <= sim.pc < end:
+                completed = True
+                break
+            sim.step(instructions)
+            executed += 1
+    except SystemExit:
+        completed = True
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    elapsed = time.perf_counter() - start
+    return executed, elapsed, sim.registerFiles["10"] & 0xFFFFFFFF, completed, error
+
+
+RUNNERS = {"iss": run_iss, "legacy": run_legacy}
+
+
+def run_workload(name, engine, repeat=5, max_instructions=2000000):
+    """Chạy một workload repeat lần trên một engine (trong process hiện tại), trả về dict kết quả."""
+    words = assemble_workload(name)
+    runner = RUNNERS[engine]
+    times = []
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(repeat):
+            executed, elapsed, checksum, completed, error = runner(words, max_instructions)
+            times.append(elapsed)
+            if error is not None:
+                break
+    seconds = statistics.median(times)
+    expected = WORKLOADS[name][1]
+    return {
+        "workload": name,
+        "engine": engine,
+        "instructions": executed,
+        "seconds": seconds,
+        "seconds_min": min(times),
+        "repeat": len(times),
+        "mips": executed / seconds / 1e6 if seconds > 0 else 0.0,
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "completed": completed,
+        "checksum": checksum,
+        "checksum_ok": completed and checksum == expected,
+        "error": error,
+    }
+
+
+def _run_isolated(args):
+    return run_workload(*args)
+
+
+def host_info():
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def run_suite(workloads=None, engines=ENGINES, repeat=5, max_instructions=2000000,
+              legacy_max_instructions=200000, isolate=True):
+    """Chạy tuần tự từng (workload, engine); isolate=True: mỗi lần một process mới để đo peak RSS."""
+    from concurrent.futures import ProcessPoolExecutor
+    results = []
+    for name in workloads or WORKLOADS:
+        for engine in engines:
+            limit = legacy_max_instructions if engine == "legacy" else max_instructions
+            task = (name, engine, repeat, limit)
+            if isolate:
+                with ProcessPoolExecutor(max_workers=1) as pool:
+                    results.append(pool.submit(_run_isolated, task).result())
+            else:
+                results.append(run_workload(*task))
+    return {"host": host_info(), "timestamp": time.time(), "results": results}
+
+
+def format_results(report):
+    lines = [f"{'workload':16} {'engine':7} {'instret':>10} {'seconds':>9} {'MIPS':>7} {'RSS MiB':>8}  status"]
+    for r in report["results"]:
+        if r["error"]:
+            status = r["error"]
+        elif not r["completed"]:
+            status = "instruction limit"
+        else:
+            status = "ok" if r["checksum_ok"] else f"checksum 0x{r['checksum']:08x}"
+        lines.append(f"{r['workload']:16} {r['engine']:7} {r['instructions']:10d} {r['seconds']:9.4f} "
+                     f"{r['mips']:7.3f} {r['peak_rss_kb'] / 1024:8.1f}  {status}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Guest benchmark suite for RISCV_ISS and RISCV_simulator")
+    parser.add_argument("workloads", nargs="*", help=f"subset of: {', '.join(WORKLOADS)}")
+    parser.add_argument("--engine", choices=ENGINES + ("both",), default="both")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per workload (median is reported)")
+    parser.add_argument("--max-instructions", type=int, default=2000000)
+    parser.add_argument("--legacy-max-instructions", type=int, default=200000)
+    parser.add_argument("--no-isolate", action="store_true", help="run everything in this process")
+    parser.add_argument("--json", default=None, help="write results as JSON ('-' for stdout)")
+    parser.add_argument("--list", action="store_true", help="list workloads and exit")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for name, (source, _) in WORKLOADS.items():
+            print(f"{name:16} benchmarks/{source}")
+        return 0
+    unknown = [name for name in args.workloads if name not in WORKLOADS]
+    if unknown:
+        parser.error(f"unknown workload(s): {', '.join(unknown)}")
+
+    engines = ENGINES if args.engine == "both" else (args.engine,)
+    report = run_suite(args.workloads, engines, args.repeat, args.max_instructions,
+                       args.legacy_max_instructions, not args.no_isolate)
+    if args.json == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        print(format_results(report))
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(report, f, indent=2)
+    # Workload nào chạy sai trên RISCV_ISS thì trả về lỗi (engine cũ chỉ để tham khảo)
+    failed = [r for r in report["results"] if r["engine"] == "iss" and not r["checksum_ok"]]
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
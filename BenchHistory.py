@@ -0,0 +1,242 @@
+import argparse
+import hashlib
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Lịch sử kết quả benchmark (Bench.py + MicroBench.py) và phát hiện hồi quy hiệu năng.
+#
+# Mỗi lần chạy được nối thêm một dòng JSON vào file lịch sử (mặc định bench_history.jsonl):
+#   {"commit", "dirty", "host", "host_info", "timestamp", "metrics": {key: giá trị},
+#    "failures": [key]}
+# key là "bench:<workload>" (giây, median) hoặc "micro:<case>" (ns/op); mọi metric đều là
+# "càng nhỏ càng tốt". host là fingerprint của máy (hash của host_info), chỉ các lần chạy
+# cùng host mới được so sánh với nhau.
+#
+# check so sánh lần chạy hiện tại với baseline cuộn: --window lần chạy gần nhất cùng host
+# (working tree sạch, khác commit hiện tại). Một metric bị coi là hồi quy khi chậm hơn
+# median baseline quá --threshold và quá --sigma lần độ nhiễu (MAD chuẩn hoá) của
+# baseline; khi đó exit 1. Workload có checksum sai không có thời gian (kết quả sai thì
+# thời gian không có nghĩa) mà nằm trong "failures", và check cũng exit 1.
+
+DEFAULT_HISTORY = "bench_history.jsonl"
+MAD_SCALE = 1.4826   # MAD -> độ lệch chuẩn với phân phối chuẩn
+MIN_BASELINE = 3     # Ít hơn số lần chạy này thì chưa đủ dữ liệu để kết luận
+
+
+def git_commit(path="."):
+    """(commit, dirty) của working tree, (None, False) nếu không phải git repo."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=path, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=path,
+                                capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None, False
+    return commit, bool(status.strip())
+
+
+def host_fingerprint(info):
+    key = json.dumps(info, sort_keys=True).encode()
+    return hashlib.sha1(key).hexdigest()[:12]
+
+
+def collect(suite="all", repeat=5, micro_repeat=9):
+    """Chạy benchmark, trả về (host_info, metrics, failures: các key có checksum sai)."""
+    from Bench import host_info
+    metrics = {}
+    failures = []
+    if suite in ("all", "bench"):
+        from Bench import run_suite
+        for r in run_suite(engines=("iss",), repeat=repeat)["results"]:
+            if r["checksum_ok"]:
+                metrics[f"bench:{r['workload']}"] = r["seconds"]
+            else:
+                failures.append(f"bench:{r['workload']}")
+    if suite in ("all", "micro"):
+        from MicroBench import run_cases
+        for name, r in run_cases(repeat=micro_repeat)["results"].items():
+            metrics[f"micro:{name}"] = r["ns_per_op"]
+    return host_info(), metrics, failures
+
+
+def metrics_from_report(report):
+    """
+    Chuyển một file JSON của Bench.py (--json) hoặc MicroBench.py (--save) thành
+    (metrics, failures).
+    """
+    results = report["results"]
+    if isinstance(results, dict):
+        return {f"micro:{name}": r["ns_per_op"] for name, r in results.items()}, []
+    results = [r for r in results if r["engine"] == "iss"]
+    return ({f"bench:{r['workload']}": r["seconds"] for r in results if r["checksum_ok"]},
+            [f"bench:{r['workload']}" for r in results if not r["checksum_ok"]])
+
+
+def make_entry(info, metrics, commit=None, dirty=False, failures=()):
+    return {
+        "commit": commit,
+        "dirty": dirty,
+        "host": host_fingerprint(info),
+        "host_info": info,
+        "timestamp": time.time(),
+        "metrics": metrics,
+        "failures": sorted(failures),
+    }
+
+
+def load_history(path):
+    entries = []
+    if not os.path.exists(path):
+        return entries
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                entries.append(json.loads(line))
+    return entries
+
+
+def append_history(path, entry):
+    with open(path, "a") as f:
+        f.write(json.dumps(entry, sort_keys=True) + "\n")
+
+
+def baseline_entries(history, entry, window=10):
+    """
+    window lần chạy gần nhất cùng host trên working tree sạch. Lần chạy của chính commit đang
+    kiểm tra bị bỏ qua, trừ khi working tree hiện tại có thay đổi chưa commit.
+    """
+    same = [e for e in history if e["host"] == entry["host"] and not e["dirty"]
+            and (entry["dirty"] or entry["commit"] is None or e["commit"] != entry["commit"])]
+    return same[-window:]
+
+
+def check(entry, baseline, threshold=0.10, sigma=3.0):
+    """
+    So sánh metrics của entry với baseline.
+    Trả về danh sách dict: key, current, median, noise, ratio, status ("ok" | "regression" |
+    "improvement" | "insufficient" | "failed"); "failed" là workload có checksum sai.
+    """
+    rows = [{"key": key, "current": None, "median": None, "noise": None, "ratio": None,
+             "status": "failed"} for key in entry.get("failures", ())]
+    for key, current in sorted(entry["metrics"].items()):
+        values = [e["metrics"][key] for e in baseline if key in e["metrics"]]
+        if len(values) < MIN_BASELINE:
+            rows.append({"key": key, "current": current, "median": None, "noise": None,
+                         "ratio": None, "status": "insufficient"})
+            continue
+        median = statistics.median(values)
+        noise = MAD_SCALE * statistics.median(abs(v - median) for v in values)
+        ratio = current / median if median > 0 else 1.0
+        limit = max(median * threshold, sigma * noise)
+        if current > median + limit:
+            status = "regression"
+        elif current < median - limit:
+            status = "improvement"
+        else:
+            status = "ok"
+        rows.append({"key": key, "current": current, "median": median, "noise": noise,
+                     "ratio": ratio, "status": status})
+    return rows
+
+
+def format_check(rows):
+    lines = [f"{'metric':36} {'current':>12} {'baseline':>12} {'noise':>10} {'change':>8}  status"]
+    for r in rows:
+        if r["current"] is None:
+            lines.append(f"{r['key']:36} {'-':>12} {'-':>12} {'-':>10} {'-':>8}  {r['status']}")
+            continue
+        if r["median"] is None:
+            lines.append(f"{r['key']:36} {r['current']:12.6g} {'-':>12} {'-':>10} {'-':>8}  {r['status']}")
+            continue
+        lines.append(f"{r['key']:36} {r['current']:12.6g} {r['median']:12.6g} {r['noise']:10.3g} "
+                     f"{(r['ratio'] - 1) * 100:+7.1f}%  {r['status']}")
+    return "\n".join(lines)
+
+
+def _current_entry(args):
+    commit, dirty = git_commit(os.path.dirname(os.path.abspath(__file__)))
+    if args.from_json:
+        from Bench import host_info
+        metrics = {}
+        failures = []
+        for path in args.from_json:
+            with open(path) as f:
+                report = json.load(f)
+            report_metrics, report_failures = metrics_from_report(report)
+            metrics.update(report_metrics)
+            failures += report_failures
+        # Dùng host_info trong file nếu có để fingerprint khớp máy đã chạy
+        info = report.get("host") or host_info()
+    else:
+        info, metrics, failures = collect(args.suite, args.repeat, args.micro_repeat)
+    return make_entry(info, metrics, commit, dirty, failures)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark history and performance-regression check")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def add_run_options(p):
+        p.add_argument("--history", default=DEFAULT_HISTORY)
+        p.add_argument("--suite", choices=("all", "bench", "micro"), default="all")
+        p.add_argument("--repeat", type=int, default=5, help="runs per guest workload")
+        p.add_argument("--micro-repeat", type=int, default=9, help="samples per microbenchmark")
+        p.add_argument("--from-json", nargs="+", default=None,
+                       help="use existing Bench.py/MicroBench.py JSON results instead of running")
+
+    p_record = sub.add_parser("record", help="run benchmarks and append the result to the history")
+    add_run_options(p_record)
+
+    p_check = sub.add_parser("check", help="run benchmarks and compare against the rolling baseline")
+    add_run_options(p_check)
+    p_check.add_argument("--window", type=int, default=10, help="baseline runs (same host)")
+    p_check.add_argument("--threshold", type=float, default=0.10, help="minimum relative slowdown")
+    p_check.add_argument("--sigma", type=float, default=3.0, help="slowdown must also exceed this many noise units")
+    p_check.add_argument("--record", action="store_true", help="append this run to the history after checking")
+
+    p_show = sub.add_parser("show", help="list history entries")
+    p_show.add_argument("--history", default=DEFAULT_HISTORY)
+    p_show.add_argument("metric", nargs="?", help="print this metric for every entry")
+    args = parser.parse_args(argv)
+
+    if args.command == "show":
+        for e in load_history(args.history):
+            stamp = time.strftime("%Y-%m-%d %H:%M", time.localtime(e["timestamp"]))
+            commit = (e["commit"] or "-")[:10] + ("+" if e["dirty"] else "")
+            value = e["metrics"].get(args.metric) if args.metric else f"{len(e['metrics'])} metrics"
+            print(f"{stamp}  {commit:11} host={e['host']}  {value}")
+        return 0
+
+    entry = _current_entry(args)
+    if args.command == "record":
+        append_history(args.history, entry)
+        print(f"Recorded {len(entry['metrics'])} metrics for {entry['commit'] or '-'} (host {entry['host']})")
+        if entry["failures"]:
+            print(f"Checksum failure in {len(entry['failures'])} workload(s): {', '.join(entry['failures'])}")
+            return 1
+        return 0
+
+    baseline = baseline_entries(load_history(args.history), entry, args.window)
+    rows = check(entry, baseline, args.threshold, args.sigma)
+    print(f"Baseline: {len(baseline)} run(s) on host {entry['host']}")
+    print(format_check(rows))
+    if args.record:
+        append_history(args.history, entry)
+    status = 0
+    if entry["failures"]:
+        print(f"Checksum failure in {len(entry['failures'])} workload(s): {', '.join(entry['failures'])}")
+        status = 1
+    regressions = [r["key"] for r in rows if r["status"] == "regression"]
+    if regressions:
+        print(f"Performance regression in {len(regressions)} metric(s): {', '.join(regressions)}")
+        status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
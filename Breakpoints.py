@@ -0,0 +1,169 @@
+import re
+
+# Breakpoint (có điều kiện) cho RISCV_ISS.
+#
+# Điều kiện được viết theo cú pháp kiểu C và dịch một lần thành hàm Python, ví dụ:
+#   x10 == 0x40 && hitcount > 100
+#   a0 != 0 || (sp & 0xF) != 0
+#   mem(0x8000) == 5 && priv == 1
+# Tên dùng được: x0..x31, tên ABI (zero, ra, sp, a0, t0, s0/fp, ...), pc, priv, instret,
+# hitcount (số lần pc chạm breakpoint, tính cả lần này) và mem(addr) (đọc word 32 bit).
+# Giá trị thanh ghi là số không dấu 32 bit.
+
+ABI_NAMES = {
+    "zero": 0, "ra": 1, "sp": 2, "gp": 3, "tp": 4, "t0": 5, "t1": 6, "t2": 7,
+    "s0": 8, "fp": 8, "s1": 9, "a0": 10, "a1": 11, "a2": 12, "a3": 13, "a4": 14,
+    "a5": 15, "a6": 16, "a7": 17, "s2": 18, "s3": 19, "s4": 20, "s5": 21, "s6": 22,
+    "s7": 23, "s8": 24, "s9": 25, "s10": 26, "s11": 27, "t3": 28, "t4": 29, "t5": 30,
+    "t6": 31,
+}
+VARIABLES = {
+    "pc": "iss.pc",
+    "priv": "iss.privilege_level",
+    "instret": "iss.instret",
+    "hitcount": "hitcount",
+    "mem": "iss.load_word",
+}
+# Toán tử hai ngôi theo độ ưu tiên của C, từ thấp tới cao
+BINARY_LEVELS = (("||",), ("&&",), ("|",), ("^",), ("&",), ("==", "!="), ("<", "<=", ">", ">="),
+                 ("<<", ">>"), ("+", "-"), ("*", "/", "%"))
+UNARY = {"!": "not ", "~": "~", "-": "-", "+": "+"}
+
+TOKEN = re.compile(r"\s*(?:(0[xX][0-9a-fA-F]+|0[bB][01]+|\d+)|([A-Za-z_]\w*)|"
+                   r"(==|!=|<=|>=|<<|>>|&&|\|\||[-+*/%&|^~!<>()]))")
+
+
+def _tokenize(text):
+    tokens = []
+    pos = 0
+    while pos < len(text):
+        m = TOKEN.match(text, pos)
+        if m is None or m.end() == pos:
+            if not text[pos:].strip():
+                break
+            raise ValueError(f"Invalid breakpoint condition near: {text[pos:]!r}")
+        number, name, op = m.groups()
+        pos = m.end()
+        if number is not None:
+            tokens.append(("number", str(int(number, 0))))
+        elif name is not None:
+            if name in VARIABLES:
+                tokens.append(("name", VARIABLES[name]))
+            elif name in ABI_NAMES or re.fullmatch(r"x([0-9]|[12][0-9]|3[01])", name):
+                index = ABI_NAMES[name] if name in ABI_NAMES else int(name[1:])
+                tokens.append(("name", f"(iss.regs[{index}] & 0xFFFFFFFF)"))
+            else:
+                raise ValueError(f"Unknown name in breakpoint condition: {name}")
+        else:
+            tokens.append(("op", op))
+    return tokens
+
+
+class _Parser:
+    """
+    Dịch Token sang biểu thức Python theo độ ưu tiên của C: mỗi phép toán hai ngôi được đặt
+    trong ngoặc nên không bị áp độ ưu tiên và phép so sánh nối chuỗi của Python
+    (x10 < 3 == 0 là (x10 < 3) == 0 như trong C).
+    """
+
+    def __init__(self, tokens, text):
+        self.tokens = tokens
+        self.text = text
+        self.pos = 0
+
+    def error(self):
+        return ValueError(f"Invalid breakpoint condition: {self.text}")
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def take(self):
+        token = self.peek()
+        if token[0] is None:
+            raise self.error()
+        self.pos += 1
+        return token
+
+    def parse(self):
+        source = self.binary(0)
+        if self.pos != len(self.tokens):
+            raise self.error()
+        return source
+
+    def binary(self, level):
+        if level == len(BINARY_LEVELS):
+            return self.unary()
+        left = self.binary(level + 1)
+        while True:
+            kind, op = self.peek()
+            if kind != "op" or op not in BINARY_LEVELS[level]:
+                return left
+            self.pos += 1
+            right = self.binary(level + 1)
+            if op in ("&&", "||"):
+                left = f"(bool({left}) {'and' if op == '&&' else 'or'} bool({right}))"
+            else:
+                left = f"({left} {'//' if op == '/' else op} {right})"
+
+    def unary(self):
+        kind, value = self.take()
+        if kind == "op" and value in UNARY:
+            return f"({UNARY[value]}{self.unary()})"
+        if kind == "op" and value == "(":
+            inner = self.binary(0)
+            if self.take() != ("op", ")"):
+                raise self.error()
+            return inner
+        if kind == "name" and value == VARIABLES["mem"]:
+            # mem(addr): gọi hàm, đối số là một biểu thức trong ngoặc
+            if self.take() != ("op", "("):
+                raise self.error()
+            address = self.binary(0)
+            if self.take() != ("op", ")"):
+                raise self.error()
+            return f"{value}({address})"
+        if kind in ("number", "name"):
+            return value
+        raise self.error()
+
+
+def compile_condition(text):
+    """Dịch biểu thức điều kiện thành hàm f(iss, hitcount) -> bool. Lỗi cú pháp -> ValueError."""
+    text = text.strip()
+    source = _Parser(_tokenize(text), text).parse()
+    try:
+        code = compile(f"lambda iss, hitcount: bool({source})", "<breakpoint>", "eval")
+    except SyntaxError as e:
+        raise ValueError(f"Invalid breakpoint condition: {text}") from e
+    return eval(code, {"__builtins__": {}, "bool": bool})
+
+
+class Breakpoint:
+    """Breakpoint tại một pc, có thể kèm điều kiện đã dịch sẵn."""
+
+    def __init__(self, pc, condition=None):
+        self.pc = pc
+        self.condition = condition                # Chuỗi gốc (để hiển thị)
+        self.predicate = compile_condition(condition) if condition else None
+        self.hitcount = 0                         # Số lần pc chạm breakpoint
+        self.enabled = True
+        self.error = None                         # Lỗi khi tính điều kiện ở lần dừng gần nhất
+
+    def hit(self, iss):
+        """Gọi khi hart sắp chạy lệnh tại self.pc; trả về True nếu phải dừng."""
+        if not self.enabled:
+            return False
+        self.hitcount += 1
+        self.error = None
+        if self.predicate is None:
+            return True
+        try:
+            return self.predicate(iss, self.hitcount)
+        except (ArithmeticError, IndexError) as e:
+            # Chia cho 0, mem() ngoài bộ nhớ: dừng tại breakpoint và báo lỗi thay vì làm hỏng run()
+            self.error = f"{type(e).__name__}: {e}"
+            return True
+
+    def __repr__(self):
+        cond = f" if {self.condition}" if self.condition else ""
+        return f"Breakpoint(0x{self.pc:08x}{cond}, hits={self.hitcount})"
@@ -0,0 +1,374 @@
+import argparse
+import sys
+
+# Entry point dòng lệnh cho assembler, simulator và debugger:
+#   python CLI.py assemble|link|simulate|debug|script|gdbserver|jtag ...
+# hoặc sau khi cài đặt (pyproject.toml): riscv-assemble, riscv-link, riscv-simulate,
+# riscv-debug, riscv-script, riscv-gdbserver, riscv-jtag.
+# Các module nặng (ISS, DebugModule, RISCV_simulator, RISCV_asembler) chỉ được import
+# khi lệnh tương ứng chạy, nên import CLI không tốn thời gian và không đụng tới file nào.
+
+PRIVILEGE_LEVELS = {"user": 0b00, "supervisor": 0b01}
+
+
+def _address(text):
+    return int(text, 0)
+
+
+def add_assemble_arguments(parser):
+    parser.add_argument("source", help="assembly source (.s)")
+    parser.add_argument("-o", "--output", default="text.bin", help="text section output (default: text.bin)")
+    parser.add_argument("--data", default="data.bin", help="data section output (default: data.bin)")
+    parser.add_argument("--object", metavar="PATH", help="write a relocatable object for riscv-link instead")
+
+
+def add_link_arguments(parser):
+    parser.add_argument("inputs", nargs="+", help="assembly sources (.s) and objects (.o), in memory order")
+    parser.add_argument("-o", "--output", default="text.bin",
+                        help="text section output (default: text.bin); FILE.img writes a loadable image "
+                             "that keeps the section addresses and the entry point")
+    parser.add_argument("--data", default="data.bin", help="data section output (default: data.bin)")
+    parser.add_argument("-T", "--map", metavar="FILE", help="memory map: '.text = ADDR', '.data = ADDR', 'ENTRY = SYMBOL'")
+    parser.add_argument("--cache", metavar="DIR", help="object cache directory (default: ~/.cache/riscv-objects)")
+    parser.add_argument("--no-cache", action="store_true", help="assemble every source, keep nothing")
+
+
+def add_simulate_arguments(parser):
+    parser.add_argument("image", help="text.bin program image, linked .img or .s source")
+    parser.add_argument("--engine", choices=("iss", "legacy"), default="iss")
+    parser.add_argument("--priv", choices=PRIVILEGE_LEVELS, default="supervisor")
+    parser.add_argument("--mem-size", type=_address, default=0x10000)
+    parser.add_argument("--max-instructions", type=int, default=None)
+    parser.add_argument("-v", "--verbose", action="store_true", help="print every executed instruction")
+
+
+def add_debug_arguments(parser):
+    parser.add_argument("image", help="text.bin program image, linked .img or .s source")
+    parser.add_argument("--priv", choices=PRIVILEGE_LEVELS, default="supervisor")
+    parser.add_argument("--mem-size", type=_address, default=0x10000)
+    parser.add_argument("-b", "--break", dest="breakpoints", type=_address, action="append", default=[],
+                        metavar="ADDR", help="set a breakpoint (repeatable)")
+    parser.add_argument("-w", "--watch", dest="watchpoints", type=_address, action="append", default=[],
+                        metavar="ADDR", help="halt before any store to the word at ADDR (repeatable)")
+    parser.add_argument("--run", action="store_true", help="start running instead of halting at reset")
+    parser.add_argument("--record", nargs="?", type=int, const=0, default=None, metavar="INTERVAL",
+                        help="record execution for reverse debugging (snapshot every INTERVAL instructions)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="print every executed instruction")
+
+
+def _dump_range(text):
+    addr, _, count = text.partition(":")
+    return int(addr, 0), int(count, 0) if count else 16
+
+
+def add_script_arguments(parser):
+    parser.add_argument("image", help="text.bin program image, linked .img or .s source")
+    parser.add_argument("--priv", choices=PRIVILEGE_LEVELS, default="supervisor")
+    parser.add_argument("--mem-size", type=_address, default=0x10000)
+    parser.add_argument("-c", "--commands", default="", help="debug commands separated by ';'")
+    parser.add_argument("-f", "--file", help="file with one debug command per line")
+    parser.add_argument("-b", "--break", dest="breakpoints", type=_address, action="append", default=[],
+                        metavar="ADDR", help="set a breakpoint before the script runs (repeatable)")
+    parser.add_argument("--dump", dest="dumps", type=_dump_range, action="append", default=[],
+                        metavar="ADDR:N", help="dump N memory words at the end (repeatable)")
+    parser.add_argument("--max-instructions", type=int, default=None,
+                        help="instruction limit when no commands are given")
+    parser.add_argument("--stop-on-error", action="store_true")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+
+
+def add_gdbserver_arguments(parser):
+    parser.add_argument("image", help="text.bin program image, linked .img or .s source")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3333)
+    parser.add_argument("--priv", choices=PRIVILEGE_LEVELS, default="supervisor")
+    parser.add_argument("--mem-size", type=_address, default=0x10000)
+    parser.add_argument("--record", nargs="?", type=int, const=0, default=None, metavar="INTERVAL",
+                        help="record execution so GDB can reverse-step/continue")
+
+
+def add_jtag_arguments(parser):
+    parser.add_argument("image", help="text.bin program image, linked .img or .s source")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9824)
+    parser.add_argument("--priv", choices=PRIVILEGE_LEVELS, default="supervisor")
+    parser.add_argument("--mem-size", type=_address, default=0x10000)
+
+
+def assemble(args):
+    import RISCV_asembler as asm
+    if args.object:
+        import os
+        from Linker import save_object
+        with open(args.source) as f:
+            obj = asm.assemble_object(f.read(), os.path.basename(args.source))
+        save_object(obj, args.object)
+        errors = obj.errors
+    else:
+        errors = asm.assemble_file(args.source, args.output, args.data).errors
+    for line in errors:
+        print(line, file=sys.stderr)
+    return 1 if errors else 0
+
+
+def link(args):
+    import RISCV_asembler as asm
+    from Linker import (DEFAULT_CACHE_DIR, IMAGE_SUFFIX, LinkError, ObjectCache, build, default_data_base,
+                        parse_memory_map, save_image)
+    cache = ObjectCache(None if args.no_cache else args.cache or DEFAULT_CACHE_DIR)
+    try:
+        memory_map = None
+        if args.map:
+            with open(args.map) as f:
+                memory_map = parse_memory_map(f.read())
+        image = build(args.inputs, cache, memory_map)
+    except LinkError as e:
+        print(e, file=sys.stderr)
+        return 1
+    if args.output.endswith(IMAGE_SUFFIX):
+        save_image(image, args.output)
+    elif image.text_base or image.entry or \
+            (image.data and image.data_base != default_data_base(image.text_base, len(image.text))):
+        # text.bin được nạp tại 0 và chạy từ 0, data.bin không mang địa chỉ
+        print(f"text.bin/data.bin cannot keep .text at 0x{image.text_base:x}, .data at 0x{image.data_base:x} "
+              f"and entry 0x{image.entry:x}; write a loadable image with -o FILE{IMAGE_SUFFIX}", file=sys.stderr)
+        return 1
+    else:
+        with open(args.output, "w") as f:
+            f.write("".join(f"{word:032b}\n" for word in image.words()))
+        with open(args.data, "w") as f:
+            f.write("".join(word + "\n" for word in asm.pack_data_words(image.data)))
+    print(f"Linked {len(args.inputs)} input(s): {cache.assembled} assembled, {cache.reused} from cache; "
+          f".text at 0x{image.text_base:x}, .data at 0x{image.data_base:x}, entry 0x{image.entry:x}", file=sys.stderr)
+    return 0
+
+
+def _read_image(path):
+    # File .s được dịch thẳng trong bộ nhớ (không tạo text.bin), .img là image do "link" ghi ra;
+    # None với text.bin
+    if path.endswith(".s"):
+        import RISCV_asembler as asm
+        return asm.assemble_file(path)
+    if path.endswith(".img"):
+        import Linker
+        return Linker.load_image(path)
+    return None
+
+
+def _load_program(iss, path):
+    image = _read_image(path)
+    if image is not None:
+        iss.load_image(image)
+    else:
+        iss.load_program_from_binary_file(path)
+
+
+def _print_registers(regs):
+    for i in range(0, 32, 4):
+        print("  ".join(f"x{j:02} = 0x{regs[j] & 0xFFFFFFFF:08x}" for j in range(i, i + 4)))
+
+
+def _simulate_legacy(args):
+    import contextlib
+    import os
+    import RISCV_simulator as sim
+    sim.reset_state()
+    image = _read_image(args.image)
+    if image is None:
+        with open(args.image) as f:
+            instructions = [line for line in f if line.strip()]
+    else:
+        # RISCV_simulator chỉ chạy danh sách lệnh từ địa chỉ 0
+        if image.errors:
+            print(f"{args.image}: {len(image.errors)} error(s): {image.errors[0]}", file=sys.stderr)
+            return 1
+        if image.text_base or image.entry:
+            print(f"The legacy engine runs code from address 0; {args.image} has .text at "
+                  f"0x{image.text_base:x} and entry 0x{image.entry:x}", file=sys.stderr)
+            return 1
+        instructions = [f"{word:032b}" for word in image.words()]
+    sim.SUPERVISOR_MODE = args.priv == "supervisor"
+    executed = 0
+    limit = args.max_instructions
+    with contextlib.ExitStack() as stack:
+        if not args.verbose:
+            stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, "w"))))
+        try:
+            while 0 <= sim.pc < 4 * len(instructions) and executed != limit:
+                sim.step(instructions)
+                executed += 1
+        except SystemExit:
+            pass
+    print(f"Retired {executed} instruction(s), pc = 0x{sim.pc & 0xFFFFFFFF:08x}")
+    _print_registers([sim.registerFiles[str(i)] for i in range(32)])
+    return 0
+
+
+def simulate(args):
+    if args.engine == "legacy":
+        return _simulate_legacy(args)
+    from DebugModule import sigint_requests_halt
+    from ISS import RISCV_ISS
+    iss = RISCV_ISS(args.mem_size)
+    iss.verbose = args.verbose
+    _load_program(iss, args.image)
+    iss.privilege_level = PRIVILEGE_LEVELS[args.priv]
+    with sigint_requests_halt(iss):  # Ctrl-C dừng ở ranh giới block và in trạng thái
+        executed = iss.run(args.max_instructions)
+    stop = "" if iss.halted else " (interrupted)" if iss.haltreq_hit else " (instruction limit)"
+    print(f"Retired {executed} instruction(s), pc = 0x{iss.pc & 0xFFFFFFFF:08x}{stop}")
+    _print_registers(iss.regs)
+    return 0
+
+
+def debug(args):
+    from DebugModule import DebugModule, sigint_requests_halt
+    from ISS import RISCV_ISS
+    iss = RISCV_ISS(args.mem_size)
+    iss.verbose = args.verbose
+    _load_program(iss, args.image)
+    iss.privilege_level = PRIVILEGE_LEVELS[args.priv]
+    dm = DebugModule(iss)
+    for addr in args.breakpoints:
+        dm.set_breakpoint(addr)
+    for addr in args.watchpoints:
+        dm.triggers.watch(addr, addr + 4)
+    if args.record is not None:
+        dm.start_recording(args.record)
+    if not args.run:
+        dm.enter_debug_mode("Reset-haltreq")
+    # Chạy bằng run() (block cache), chỉ vào debug mode khi chạm breakpoint/trigger hoặc Ctrl-C
+    while not iss.halted:
+        with sigint_requests_halt(iss):
+            dm.run()
+        cause = "Trigger"
+        if iss.breakpoint_hit is not None:
+            print(f"[DEBUG] Breakpoint hit at 0x{iss.pc:08x}")
+        elif iss.trigger_hit is not None:
+            print(f"[DEBUG] Trigger hit: {iss.trigger_hit!r} at 0x{iss.pc:08x}")
+        elif iss.haltreq_hit:
+            print(f"[DEBUG] Halt requested at 0x{iss.pc:08x}")
+            cause = "Reset-haltreq"
+        else:
+            break
+        dm.enter_debug_mode(cause)
+    print("Simulation completed!")
+    return 0
+
+
+def script(args):
+    import json
+    from DebugModule import DebugModule
+    from DebugScript import DebugScript, format_result
+    from ISS import RISCV_ISS
+    iss = RISCV_ISS(args.mem_size)
+    iss.verbose = False
+    _load_program(iss, args.image)
+    iss.privilege_level = PRIVILEGE_LEVELS[args.priv]
+    runner = DebugScript(DebugModule(iss), stop_on_error=args.stop_on_error)
+    if not args.file and not args.commands:
+        # Không có lệnh: chạy tới breakpoint (hoặc hết) rồi lấy toàn bộ trạng thái
+        state = runner.run_until_stop(args.breakpoints, args.max_instructions, args.dumps)
+        print(json.dumps(state) if args.json else format_result({"command": "run", **state}))
+        return 1 if "error" in state else 0
+    commands = [f"break 0x{addr:x}" for addr in args.breakpoints]
+    if args.file:
+        with open(args.file) as f:
+            commands.append(f.read())
+    commands.append(args.commands)
+    commands += [f"dump 0x{addr:x} {count}" for addr, count in args.dumps]
+    results = runner.run("\n".join(commands))
+    if args.json:
+        print(json.dumps(results))
+    else:
+        for result in results:
+            print(format_result(result))
+    return 1 if any("error" in result for result in results) else 0
+
+
+def gdbserver(args):
+    from DebugModule import DebugModule
+    from GdbServer import GdbServer
+    from ISS import RISCV_ISS
+    iss = RISCV_ISS(args.mem_size)
+    iss.verbose = False
+    _load_program(iss, args.image)
+    iss.privilege_level = PRIVILEGE_LEVELS[args.priv]
+    dm = DebugModule(iss)
+    if args.record is not None:
+        dm.start_recording(args.record)
+    GdbServer(dm, args.host, args.port).serve()
+    return 0
+
+
+def jtag(args):
+    from DebugModule import DebugModule
+    from ISS import RISCV_ISS
+    from Jtag import JtagServer
+    iss = RISCV_ISS(args.mem_size)
+    iss.verbose = False
+    _load_program(iss, args.image)
+    iss.privilege_level = PRIVILEGE_LEVELS[args.priv]
+    JtagServer(DebugModule(iss), args.host, args.port).serve()
+    return 0
+
+
+COMMANDS = {
+    "assemble": (assemble, add_assemble_arguments, "assemble a source file into text.bin/data.bin"),
+    "link": (link, add_link_arguments, "assemble (through the object cache) and link several sources into text.bin/data.bin"),
+    "simulate": (simulate, add_simulate_arguments, "run a program image to completion"),
+    "debug": (debug, add_debug_arguments, "run a program image under the interactive debug module"),
+    "script": (script, add_script_arguments, "run debug commands non-interactively and report the results"),
+    "gdbserver": (gdbserver, add_gdbserver_arguments, "serve a program image to GDB over the remote serial protocol"),
+    "jtag": (jtag, add_jtag_arguments, "serve a program image through a JTAG DTM over OpenOCD remote_bitbang"),
+}
+
+
+def _command_main(name, argv=None):
+    handler, add_arguments, description = COMMANDS[name]
+    parser = argparse.ArgumentParser(prog=f"riscv-{name}", description=description)
+    add_arguments(parser)
+    return handler(parser.parse_args(argv))
+
+
+def assemble_main(argv=None):
+    return _command_main("assemble", argv)
+
+
+def link_main(argv=None):
+    return _command_main("link", argv)
+
+
+def simulate_main(argv=None):
+    return _command_main("simulate", argv)
+
+
+def debug_main(argv=None):
+    return _command_main("debug", argv)
+
+
+def script_main(argv=None):
+    return _command_main("script", argv)
+
+
+def gdbserver_main(argv=None):
+    return _command_main("gdbserver", argv)
+
+
+def jtag_main(argv=None):
+    return _command_main("jtag", argv)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="RISC-V assembler, simulator and debugger")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name, (handler, add_arguments, description) in COMMANDS.items():
+        p = sub.add_parser(name, help=description, description=description)
+        add_arguments(p)
+        p.set_defaults(handler=handler)
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -51,6 +51,21 @@ Environment_call_from_Smode = 9
 Instruction_page_fault = 12
 Load_page_fault = 13
 StoreAMO_page_fault= 15
+
+# Địa chỉ CSR (lệnh csrr*) -> tên thanh ghi
+CSR_ADDRESSES = {
+    0x100: "sstatus",
+    0x104: "sie",
+    0x105: "stvec",
+    0x106: "scounteren",
+    0x10A: "senvcfg",
+    0x140: "sscratch",
+    0x141: "sepc",
+    0x142: "scause",
+    0x143: "stval",
+    0x144: "sip",
+    0x180: "satp",
+}
 class CSR32:
     def __init__(self, name, reset_value="0" * 32):
         self.name = name
@@ -146,11 +161,12 @@ class STVec(CSR32):
         val = int(self.read(), 2)
         return val & ~0b11  # Clear 2 bit thấp nhất
 
-    def set_pc(self, scause_code):
+    def set_pc(self, scause_code, interrupt=False):
         """
         Tính địa chỉ PC handler dựa vào giá trị stvec và scause.
+        Chế độ vectored chỉ áp dụng cho ngắt; exception luôn vào BASE.
         """
-        if self.mode == 1:
+        if self.mode == 1 and interrupt:
             return self.base + 4 * scause_code  # vectored
         else:
             return self.base  # direct
@@ -422,20 +438,26 @@ class DScratch1(CSR32):
     def __init__(self):
         super().__init__("dscratch1")
 
-sstatus = SStatus()
-stvec = STVec()
-stvec.write(handler_base_addr)
-sip = SIP()
-sie = SIE()
-scounteren = SCOUNTEREN()
-sscratch = SSCRATCH()
-sepc = SEPC()
-scause = SCause()
-stval = STval()
-senvcfg = SENVCFG()
-satp = SATP()
-
-dcsr = DCSR()
-dpc = DPC()
-dscratch0 = DScratch0()
-dscratch1 = DScratch1()
\ No newline at end of file
+# Debug CSR (Debug spec): chỉ truy cập được từ debug mode (DebugModule.dcsrs)
+DEBUG_CSR_ADDRESSES = {
+    0x7B0: "dcsr",
+    0x7B1: "dpc",
+    0x7B2: "dscratch0",
+    0x7B3: "dscratch1",
+}
+
+# Trigger module (Debug spec): debugger truy cập qua DebugModule, không qua lệnh csrr*
+TRIGGER_CSR_ADDRESSES = {
+    0x7A0: "tselect",
+    0x7A1: "tdata1",
+    0x7A2: "tdata2",
+}
+class TSelect(CSR32):
+    def __init__(self):
+        super().__init__("tselect")
+class TData1(CSR32):
+    def __init__(self):
+        super().__init__("tdata1")
+class TData2(CSR32):
+    def __init__(self):
+        super().__init__("tdata2")
@@ -0,0 +1,201 @@
+import argparse
+import sys
+from collections import deque
+from itertools import zip_longest
+
+from Trace import (RD_WRITE_OPCODES, OPCODE_LOAD, STORE_SIZES,
+                   REC_RD_WRITE, REC_MEM_READ, REC_MEM_WRITE, REC_TRAP, TraceReader)
+
+# Commit log theo định dạng "spike --log-commits" dùng cho co-simulation với RTL:
+#   core   0: 3 0x80000000 (0x00000297) x5  0x80000000
+#   core   0: 3 0x800000e8 (0x00112623) mem 0x80000f8c 0x00000000
+#   core   0: 3 0x800000ec (0x00c12703) x14 0x00000001 mem 0x80000f8c
+# Như Spike, lệnh gây exception (ecall, load/store lệch biên, CSR không hợp lệ) không commit
+# nên không có dòng nào.
+
+
+def format_commit(core_id, priv, pc, instr, rd=None, rd_value=0,
+                  mem_addr=None, mem_data=None, mem_size=4):
+    line = f"core {core_id:3d}: {priv} 0x{pc:08x} (0x{instr:08x})"
+    if rd is not None:
+        line += f" x{rd:<2d} 0x{rd_value & 0xFFFFFFFF:08x}"
+    if mem_addr is not None:
+        line += f" mem 0x{mem_addr:08x}"
+        if mem_data is not None:
+            line += f" 0x{mem_data & ((1 << (8 * mem_size)) - 1):0{2 * mem_size}x}"
+    return line
+
+
+class CommitLogWriter:
+    """
+    Ghi commit log dạng Spike cho RISCV_ISS (gắn vào iss.tracer như TraceWriter).
+
+    Các dòng được gom lại và ghi ra file theo lô (flush_lines dòng một lần).
+    """
+
+    def __init__(self, path, core_id=0, flush_lines=4096):
+        self.file = open(path, "w") if isinstance(path, str) else path
+        self.owns_file = isinstance(path, str)
+        self.core_id = core_id
+        self.flush_lines = flush_lines
+        self.lines = []
+
+    def attach(self, iss):
+        iss.tracer = self
+        return self
+
+    def detach(self, iss):
+        if iss.tracer is self:
+            iss.tracer = None
+        self.close()
+
+    def record(self, iss, pc, instr, priv):
+        if iss.trapped:
+            return
+        opcode = instr & 0x7F
+        rd = None
+        rd_value = 0
+        mem_addr = None
+        mem_data = None
+        mem_size = 4
+        if opcode in RD_WRITE_OPCODES:
+            rd = (instr >> 7) & 0x1F
+            if rd == 0:
+                rd = None  # Spike không ghi lại các lần ghi vào x0
+            else:
+                rd_value = iss.regs[rd]
+        if iss.mem_valid:
+            mem_addr = iss.mem_addr
+            if opcode != OPCODE_LOAD:
+                mem_data = iss.mem_data
+                mem_size = min(STORE_SIZES.get((instr >> 12) & 0x7, 4), 4)
+        lines = self.lines
+        lines.append(format_commit(self.core_id, priv, pc, instr, rd, rd_value,
+                                   mem_addr, mem_data, mem_size))
+        if len(lines) >= self.flush_lines:
+            self.flush()
+
+    def flush(self):
+        if self.lines:
+            self.file.write("\n".join(self.lines))
+            self.file.write("\n")
+            self.lines = []
+
+    def close(self):
+        self.flush()
+        if self.owns_file:
+            self.file.close()
+
+
+def trace_to_commit_log(trace_path, out_path, core_id=0):
+    """Chuyển file trace nhị phân (Trace.py) sang commit log dạng Spike."""
+    writer = CommitLogWriter(out_path, core_id)
+    for rec in TraceReader(trace_path).records():
+        _, pc, instr, rd_value, mem_addr, mem_data, rd, priv, flags, mem_size = rec
+        if flags & REC_TRAP:
+            continue
+        writer.lines.append(format_commit(
+            core_id, priv, pc, instr,
+            rd if flags & REC_RD_WRITE and rd != 0 else None, rd_value,
+            mem_addr if flags & (REC_MEM_READ | REC_MEM_WRITE) else None,
+            mem_data if flags & REC_MEM_WRITE else None, min(mem_size, 4) or 4))
+        if len(writer.lines) >= writer.flush_lines:
+            writer.flush()
+    writer.close()
+
+
+def parse_commit(line):
+    """
+    Tách một dòng commit log thành tuple so sánh được.
+
+    Các số hex được đổi sang int để log RV64 (PC 16 chữ số) hay log dùng
+    độ rộng khác vẫn so khớp được. Trả về None nếu không phải dòng commit.
+    """
+    tokens = line.split()
+    if len(tokens) < 4 or tokens[0] != "core":
+        return None
+    fields = []
+    for tok in tokens[2:]:
+        tok = tok.strip("()")
+        if tok.startswith("0x"):
+            fields.append(int(tok, 16))
+        else:
+            fields.append(tok)
+    return (tokens[1].rstrip(":"),) + tuple(fields)
+
+
+def _commit_lines(f):
+    for lineno, line in enumerate(f, 1):
+        parsed = parse_commit(line)
+        if parsed is not None:
+            yield lineno, line.rstrip("\n"), parsed
+
+
+class Divergence:
+    def __init__(self, index, ref, dut, context):
+        self.index = index      # Số thứ tự lệnh commit (từ 0)
+        self.ref = ref          # (lineno, line) hoặc None nếu log ref đã hết
+        self.dut = dut
+        self.context = context  # Các dòng commit khớp ngay trước đó
+
+    def report(self):
+        lines = [f"Divergence at commit #{self.index}"]
+        for ref_line in self.context:
+            lines.append(f"    {ref_line}")
+        lines.append(f"REF {self.ref[0] if self.ref else '-':>6}: {self.ref[1] if self.ref else '<end of log>'}")
+        lines.append(f"DUT {self.dut[0] if self.dut else '-':>6}: {self.dut[1] if self.dut else '<end of log>'}")
+        return "\n".join(lines)
+
+
+def compare_logs(ref_path, dut_path, context=10, ignore_priv=False):
+    """
+    So sánh hai commit log theo từng dòng, dừng ở chỗ lệch đầu tiên.
+
+    Chỉ giữ lại `context` dòng gần nhất nên bộ nhớ dùng không phụ thuộc độ dài log.
+    Trả về (số lệnh khớp, Divergence hoặc None).
+    """
+    history = deque(maxlen=context)
+    count = 0
+    with open(ref_path) as ref_file, open(dut_path) as dut_file:
+        for ref, dut in zip_longest(_commit_lines(ref_file), _commit_lines(dut_file)):
+            if ref is None or dut is None:
+                return count, Divergence(count, ref and ref[:2], dut and dut[:2], list(history))
+            ref_key, dut_key = ref[2], dut[2]
+            if ignore_priv:
+                ref_key, dut_key = ref_key[:1] + ref_key[2:], dut_key[:1] + dut_key[2:]
+            if ref_key != dut_key:
+                return count, Divergence(count, ref[:2], dut[:2], list(history))
+            history.append(ref[1])
+            count += 1
+    return count, None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Spike-compatible commit logs")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("compare", help="diff an ISS commit log against an RTL log")
+    p.add_argument("ref")
+    p.add_argument("dut")
+    p.add_argument("--context", type=int, default=10)
+    p.add_argument("--ignore-priv", action="store_true")
+
+    p = sub.add_parser("from-trace", help="convert a binary trace to a commit log")
+    p.add_argument("trace")
+    p.add_argument("out")
+
+    args = parser.parse_args(argv)
+    if args.command == "from-trace":
+        trace_to_commit_log(args.trace, args.out)
+        return 0
+
+    count, divergence = compare_logs(args.ref, args.dut, args.context, args.ignore_priv)
+    if divergence is None:
+        print(f"Logs match ({count} commits)")
+        return 0
+    print(divergence.report())
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
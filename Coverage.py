@@ -0,0 +1,375 @@
+import argparse
+import contextlib
+import os
+import struct
+import sys
+import zlib
+from array import array
+
+from CSR import CSR_ADDRESSES, SCause
+from ISS import RISCV_ISS, PRIV_TRANSITION_SLOTS, XRET_CAUSE, transition_index
+
+# Functional coverage cho RISCV_ISS.
+#
+# Mọi bộ đếm là bitmap/array cấp phát sẵn. Khi chạy bằng RISCV_ISS.run(), coverage chỉ
+# được cập nhật một lần cho mỗi block đã decode (block_executed), và chỉ decode lại
+# các lệnh của block khi có phần block chưa từng chạy tới; trap và chuyển privilege
+# được đọc từ bộ đếm có sẵn của ISS khi harvest().
+#
+# File .cov (little-endian):
+#   header : magic(8s) version(H) mnemonic_count(H) runs(I)
+#   payload: zlib(bitmap lệnh | rd | rs1 | rs2 | operand bằng nhau | CSR | trap_counts | transitions)
+
+COVERAGE_MAGIC = b"RVCOV\0\0\0"
+COVERAGE_VERSION = 1
+COVERAGE_HEADER = struct.Struct("<8sHHI")
+
+OPCODE_LUI = 0b0110111
+OPCODE_AUIPC = 0b0010111
+OPCODE_JAL = 0b1101111
+OPCODE_OP = 0b0110011
+OPCODE_OP_IMM = 0b0010011
+OPCODE_SYSTEM = 0b1110011
+
+# (mnemonic, opcode, funct3, variant, toán hạng thanh ghi: d = rd, 1 = rs1, 2 = rs2)
+MNEMONICS = (
+    ("add", 0b0110011, 0b000, 0, "d12"), ("sub", 0b0110011, 0b000, 1, "d12"),
+    ("sll", 0b0110011, 0b001, 0, "d12"), ("slt", 0b0110011, 0b010, 0, "d12"),
+    ("sltu", 0b0110011, 0b011, 0, "d12"), ("xor", 0b0110011, 0b100, 0, "d12"),
+    ("srl", 0b0110011, 0b101, 0, "d12"), ("sra", 0b0110011, 0b101, 1, "d12"),
+    ("or", 0b0110011, 0b110, 0, "d12"), ("and", 0b0110011, 0b111, 0, "d12"),
+    ("addi", 0b0010011, 0b000, 0, "d1"), ("slti", 0b0010011, 0b010, 0, "d1"),
+    ("sltiu", 0b0010011, 0b011, 0, "d1"), ("xori", 0b0010011, 0b100, 0, "d1"),
+    ("ori", 0b0010011, 0b110, 0, "d1"), ("andi", 0b0010011, 0b111, 0, "d1"),
+    ("slli", 0b0010011, 0b001, 0, "d1"), ("srli", 0b0010011, 0b101, 0, "d1"),
+    ("srai", 0b0010011, 0b101, 1, "d1"),
+    ("lb", 0b0000011, 0b000, 0, "d1"), ("lh", 0b0000011, 0b001, 0, "d1"),
+    ("lw", 0b0000011, 0b010, 0, "d1"), ("lbu", 0b0000011, 0b100, 0, "d1"),
+    ("lhu", 0b0000011, 0b101, 0, "d1"),
+    ("sb", 0b0100011, 0b000, 0, "12"), ("sh", 0b0100011, 0b001, 0, "12"),
+    ("sw", 0b0100011, 0b010, 0, "12"),
+    ("beq", 0b1100011, 0b000, 0, "12"), ("bne", 0b1100011, 0b001, 0, "12"),
+    ("blt", 0b1100011, 0b100, 0, "12"), ("bge", 0b1100011, 0b101, 0, "12"),
+    ("bltu", 0b1100011, 0b110, 0, "12"), ("bgeu", 0b1100011, 0b111, 0, "12"),
+    ("lui", 0b0110111, 0, 0, "d"), ("auipc", 0b0010111, 0, 0, "d"),
+    ("jal", 0b1101111, 0, 0, "d"), ("jalr", 0b1100111, 0b000, 0, "d1"),
+    ("csrrw", 0b1110011, 0b001, 0, "d1"), ("csrrs", 0b1110011, 0b010, 0, "d1"),
+    ("csrrc", 0b1110011, 0b011, 0, "d1"), ("csrrwi", 0b1110011, 0b101, 0, "d"),
+    ("csrrsi", 0b1110011, 0b110, 0, "d"), ("csrrci", 0b1110011, 0b111, 0, "d"),
+    ("ecall", 0b1110011, 0b000, 0, ""), ("ebreak", 0b1110011, 0b000, 1, ""),
+    ("sret", 0b1110011, 0b000, 2, ""), ("wfi", 0b1110011, 0b000, 3, ""),
+    ("sfence.vma", 0b1110011, 0b000, 4, "12"),
+    ("<other>", 0, 0, 0, ""),
+)
+N_MNEMONICS = len(MNEMONICS)
+OTHER = N_MNEMONICS - 1
+
+# Lệnh SYSTEM funct3 = 0: imm12 -> variant
+SYSTEM_VARIANTS = {0x000: 0, 0x001: 1, 0x102: 2, 0x105: 3}
+
+KEY_BITS = 13  # opcode(7) | funct3(3) | variant(3)
+KEY_TO_INDEX = bytearray([OTHER]) * (1 << KEY_BITS)
+for _i, (_name, _opcode, _funct3, _variant, _) in enumerate(MNEMONICS[:OTHER]):
+    KEY_TO_INDEX[_opcode | (_funct3 << 7) | (_variant << 10)] = _i
+OPERANDS = tuple(("d" in f, "1" in f, "2" in f) for _, _, _, _, f in MNEMONICS)
+
+PRIV_NAMES = {0: "U", 1: "S", 3: "M"}
+
+# Bit trong bitmap "operand bằng nhau"
+EQ_RD_RS1 = 1
+EQ_RD_RS2 = 2
+EQ_RS1_RS2 = 4
+
+
+def insn_key(instr):
+    """Khóa lệnh đã chuẩn hóa (bỏ các bit immediate lẫn vào funct3/bit 30)."""
+    opcode = instr & 0x7F
+    if opcode in (OPCODE_LUI, OPCODE_AUIPC, OPCODE_JAL):
+        return opcode
+    funct3 = (instr >> 12) & 0x7
+    variant = 0
+    if opcode == OPCODE_OP or (opcode == OPCODE_OP_IMM and funct3 & 0b11 == 0b01):
+        variant = (instr >> 30) & 1
+    elif opcode == OPCODE_SYSTEM and funct3 == 0:
+        variant = 4 if instr >> 25 == 0b0001001 else SYSTEM_VARIANTS.get(instr >> 20, 7)
+    return opcode | (funct3 << 7) | (variant << 10)
+
+
+class BlockRecorder:
+    """
+    Gốc chung của các bộ đếm gắn vào iss.coverage: lớp con chỉ cần cài record(instr, priv),
+    mỗi lệnh của block chỉ được record một lần cho tới khi blocks bị xóa.
+    """
+
+    def __init__(self):
+        self.blocks = {}  # (pc << 2 | priv) -> (block, số lệnh đầu block đã đánh dấu)
+
+    def record(self, instr, priv):
+        raise NotImplementedError
+
+    def block_executed(self, pc, block, executed, priv):
+        """Gọi từ RISCV_ISS.run() sau mỗi block: executed là số lệnh đầu block đã retire."""
+        key = (pc << 2) | priv
+        seen = self.blocks.get(key)
+        start = 0
+        if seen is not None and seen[0] is block:
+            start = seen[1]
+            if executed <= start:
+                return
+        for _, instr in block[start:executed]:
+            self.record(instr, priv)
+        self.blocks[key] = (block, executed)
+
+
+class Coverage(BlockRecorder):
+    """
+    Bộ đếm functional coverage: lệnh x privilege, toán hạng thanh ghi, CSR,
+    trap cause và chuyển privilege (U->S qua trap, S->U qua sret).
+
+    Dùng: cov.attach(iss); iss.run(); cov.detach(iss). Các Coverage có thể gộp với merge().
+    """
+
+    def __init__(self):
+        self.insns = bytearray(N_MNEMONICS * 4)      # mnemonic x privilege
+        self.rd = bytearray(N_MNEMONICS * 32)
+        self.rs1 = bytearray(N_MNEMONICS * 32)
+        self.rs2 = bytearray(N_MNEMONICS * 32)
+        self.equal = bytearray(N_MNEMONICS * 8)      # mnemonic x tổ hợp EQ_*
+        self.csrs = bytearray(1 << 12)
+        self.trap_counts = array("Q", [0]) * 32
+        self.transitions = array("Q", [0]) * PRIV_TRANSITION_SLOTS
+        self.runs = 0
+        super().__init__()
+
+    def attach(self, iss):
+        iss.coverage = self
+        return self
+
+    def detach(self, iss):
+        self.harvest(iss)
+        if iss.coverage is self:
+            iss.coverage = None
+
+    def harvest(self, iss):
+        """Cộng bộ đếm trap / chuyển privilege của ISS vào coverage (gọi một lần cho mỗi lần chạy)."""
+        for i, count in enumerate(iss.trap_counts):
+            self.trap_counts[i] += count
+        for i, count in enumerate(iss.priv_transitions):
+            if count:
+                self.transitions[i] += count
+        self.blocks.clear()
+        self.runs += 1
+
+    def record(self, instr, priv):
+        idx = KEY_TO_INDEX[insn_key(instr)]
+        self.insns[idx * 4 + priv] = 1
+        has_rd, has_rs1, has_rs2 = OPERANDS[idx]
+        rd = (instr >> 7) & 0x1F
+        rs1 = (instr >> 15) & 0x1F
+        rs2 = (instr >> 20) & 0x1F
+        eq = 0
+        if has_rd:
+            self.rd[idx * 32 + rd] = 1
+        if has_rs1:
+            self.rs1[idx * 32 + rs1] = 1
+            if has_rd and rd == rs1:
+                eq |= EQ_RD_RS1
+        if has_rs2:
+            self.rs2[idx * 32 + rs2] = 1
+            if has_rd and rd == rs2:
+                eq |= EQ_RD_RS2
+            if has_rs1 and rs1 == rs2:
+                eq |= EQ_RS1_RS2
+        self.equal[idx * 8 + eq] = 1
+        if instr & 0x7F == OPCODE_SYSTEM and (instr >> 12) & 0x7:
+            self.csrs[instr >> 20] = 1
+
+    def merge(self, other):
+        for name in ("insns", "rd", "rs1", "rs2", "equal", "csrs"):
+            a, b = getattr(self, name), getattr(other, name)
+            merged = int.from_bytes(a, "little") | int.from_bytes(b, "little")
+            a[:] = merged.to_bytes(len(a), "little")
+        for i, count in enumerate(other.trap_counts):
+            self.trap_counts[i] += count
+        for i, count in enumerate(other.transitions):
+            self.transitions[i] += count
+        self.runs += other.runs
+        return self
+
+    # Serialize
+    def to_bytes(self):
+        payload = b"".join((self.insns, self.rd, self.rs1, self.rs2, self.equal, self.csrs,
+                            self.trap_counts.tobytes(), self.transitions.tobytes()))
+        return COVERAGE_HEADER.pack(COVERAGE_MAGIC, COVERAGE_VERSION, N_MNEMONICS, self.runs) + \
+            zlib.compress(payload)
+
+    @classmethod
+    def from_bytes(cls, data):
+        magic, version, n_mnemonics, runs = COVERAGE_HEADER.unpack_from(data, 0)
+        if magic != COVERAGE_MAGIC or version != COVERAGE_VERSION or n_mnemonics != N_MNEMONICS:
+            raise ValueError("Not a compatible coverage file")
+        payload = memoryview(zlib.decompress(data[COVERAGE_HEADER.size:]))
+        cov = cls()
+        pos = 0
+        for name in ("insns", "rd", "rs1", "rs2", "equal", "csrs"):
+            buf = getattr(cov, name)
+            buf[:] = payload[pos:pos + len(buf)]
+            pos += len(buf)
+        for name in ("trap_counts", "transitions"):
+            arr = getattr(cov, name)
+            size = len(arr) * arr.itemsize
+            arr[:] = array("Q")
+            arr.frombytes(payload[pos:pos + size])
+            pos += size
+        cov.runs = runs
+        return cov
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
+
+    # Báo cáo
+    def report(self, missing_only=False):
+        lines = [f"Coverage over {self.runs} run(s)", "", "Instructions (U S  rd rs1 rs2  rd=rs1 rd=rs2 rs1=rs2):"]
+        hit = 0
+        for idx, (name, _, _, _, fields) in enumerate(MNEMONICS):
+            privs = self.insns[idx * 4:idx * 4 + 4]
+            if any(privs):
+                hit += idx != OTHER
+            elif idx == OTHER:
+                continue
+            if missing_only and any(privs):
+                continue
+            has_rd, has_rs1, has_rs2 = OPERANDS[idx]
+            cols = [f"  {name:11}", "U" if privs[0] else ".", "S" if privs[1] else "."]
+            for present, bitmap in ((has_rd, self.rd), (has_rs1, self.rs1), (has_rs2, self.rs2)):
+                cols.append(f"{sum(bitmap[idx * 32:idx * 32 + 32]):2d}/32" if present else "   -  ")
+            eq = 0
+            for combo in range(8):
+                if self.equal[idx * 8 + combo]:
+                    eq |= combo
+            cols.append(" ".join(flag if eq & bit else "." * len(flag) for bit, flag in
+                                 ((EQ_RD_RS1, "rd=rs1"), (EQ_RD_RS2, "rd=rs2"), (EQ_RS1_RS2, "rs1=rs2"))))
+            lines.append(" ".join(cols))
+        lines.append(f"  {hit}/{OTHER} instructions hit")
+
+        lines += ["", "CSRs:"]
+        for addr, name in sorted(CSR_ADDRESSES.items()):
+            if self.csrs[addr] and missing_only:
+                continue
+            lines.append(f"  0x{addr:03x} {name:11} {'hit' if self.csrs[addr] else 'MISSING'}")
+        others = [addr for addr in range(len(self.csrs)) if self.csrs[addr] and addr not in CSR_ADDRESSES]
+        if others:
+            lines.append("  unimplemented CSRs accessed: " + ", ".join(f"0x{a:03x}" for a in others))
+
+        causes = SCause().cause_mapping
+        lines += ["", "Trap causes:"]
+        for cause, desc in sorted(causes.items()):
+            count = self.trap_counts[cause]
+            if count and missing_only:
+                continue
+            lines.append(f"  {cause:2d} {desc:32} {count if count else 'MISSING'}")
+
+        lines += ["", "Privilege transitions:"]
+        for from_priv in (0, 1):
+            for cause in list(causes) + [XRET_CAUSE]:
+                to_priv = 0 if cause == XRET_CAUSE else 1
+                count = self.transitions[transition_index(from_priv, to_priv, cause)]
+                if count:
+                    what = "sret" if cause == XRET_CAUSE else causes[cause]
+                    lines.append(f"  {PRIV_NAMES[from_priv]}->{PRIV_NAMES[to_priv]} {what:32} {count}")
+        for from_priv, to_priv, cause, what in ((0, 1, 8, "ecall"), (1, 0, XRET_CAUSE, "sret")):
+            if not self.transitions[transition_index(from_priv, to_priv, cause)]:
+                lines.append(f"  {PRIV_NAMES[from_priv]}->{PRIV_NAMES[to_priv]} {what:32} MISSING")
+        return "\n".join(lines)
+
+
+def collect_program(path, max_steps=1000000, mem_size=0x10000):
+    """Chạy một file text.bin trên RISCV_ISS (S-mode) và trả về Coverage của lần chạy đó."""
+    iss = RISCV_ISS(mem_size)
+    iss.verbose = False
+    iss.load_program_from_binary_file(path)
+    iss.privilege_level = 0b01
+    cov = Coverage().attach(iss)
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            iss.run(max_steps)
+    finally:
+        cov.detach(iss)
+    return cov
+
+
+def _collect_file(args):
+    path, max_steps, out_dir = args
+    try:
+        cov = collect_program(path, max_steps)
+    except Exception as e:
+        return path, None, f"{type(e).__name__}: {e}"
+    data = cov.to_bytes()
+    if out_dir is not None:
+        with open(os.path.join(out_dir, os.path.basename(path) + ".cov"), "wb") as f:
+            f.write(data)
+    return path, data, None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Functional coverage for RISCV_ISS regressions")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("run", help="run text.bin programs and collect coverage")
+    p.add_argument("programs", nargs="+")
+    p.add_argument("-o", "--output", default="coverage.cov", help="merged coverage file")
+    p.add_argument("--per-run", default=None, help="directory for per-program .cov files")
+    p.add_argument("-j", "--jobs", type=int, default=None)
+    p.add_argument("--max-steps", type=int, default=1000000)
+
+    p = sub.add_parser("merge", help="merge .cov files")
+    p.add_argument("output")
+    p.add_argument("inputs", nargs="+")
+
+    p = sub.add_parser("report", help="print a coverage report")
+    p.add_argument("coverage")
+    p.add_argument("--missing", action="store_true", help="only list uncovered items")
+
+    args = parser.parse_args(argv)
+    if args.command == "report":
+        print(Coverage.load(args.coverage).report(args.missing))
+        return 0
+
+    if args.command == "merge":
+        total = Coverage()
+        for path in args.inputs:
+            total.merge(Coverage.load(path))
+        total.save(args.output)
+        print(f"Merged {len(args.inputs)} file(s), {total.runs} run(s) -> {args.output}")
+        return 0
+
+    if args.per_run is not None:
+        os.makedirs(args.per_run, exist_ok=True)
+    tasks = [(path, args.max_steps, args.per_run) for path in args.programs]
+    if args.jobs == 1 or len(tasks) == 1:
+        results = [_collect_file(task) for task in tasks]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+            results = list(pool.map(_collect_file, tasks))
+    total = Coverage()
+    failures = 0
+    for path, data, error in results:
+        if error is not None:
+            failures += 1
+            print(f"{path}: {error}")
+        else:
+            total.merge(Coverage.from_bytes(data))
+    total.save(args.output)
+    print(total.report())
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,495 @@
+from CSR import CSR_ADDRESSES, DEBUG_CSR_ADDRESSES, TRIGGER_CSR_ADDRESSES
+from ISS import CODE_PAGE_SHIFT
+
+# Debug Module Interface (RISC-V Debug spec 0.13) cho DebugModule: mô hình các thanh ghi
+# DMI mà debugger (GDB/OpenOCD qua JTAG DTM) nhìn thấy, thay cho các hàm Python.
+#
+#   dmcontrol/dmstatus    halt, resume, ackhavereset (một hart, hartsel = 0)
+#   abstractcs/command    abstract command: access register (GPR 0x1000-0x101f, CSR,
+#                         debug CSR, trigger CSR), access memory; postexec chạy progbuf
+#   data0-1, abstractauto autoexecdata/autoexecprogbuf: đọc/ghi data0 chạy lại command,
+#                         cùng aarpostincrement/aampostincrement để quét nhiều thanh ghi
+#                         hoặc nhiều word mà không phải ghi lại command
+#   progbuf0-7            chạy trên hart đang halt, kết thúc bằng ebreak (impebreak = 1)
+#   sbcs/sbaddress0/sbdata0  system bus access với sbreadonaddr, sbreadondata,
+#                         sbautoincrement: dump/ghi N word tốn N + 4 lần truy cập DMI
+#
+# Mỗi read()/write() là một lần truy cập DMI (được đếm trong accesses). Hart chỉ chạy khi
+# gọi run() (mô phỏng đơn luồng), ví dụ giữa các packet của transport.
+# Không hỗ trợ: hartreset/ndmreset (đọc là 0), quick access (cmderr = 2), authentication.
+
+DATA0 = 0x04
+DATA1 = 0x05
+DMCONTROL = 0x10
+DMSTATUS = 0x11
+HARTINFO = 0x12
+ABSTRACTCS = 0x16
+COMMAND = 0x17
+ABSTRACTAUTO = 0x18
+PROGBUF0 = 0x20
+SBCS = 0x38
+SBADDRESS0 = 0x39
+SBDATA0 = 0x3C
+
+DATA_COUNT = 2
+PROGBUF_SIZE = 8
+
+# dmcontrol
+DMCONTROL_HALTREQ = 1 << 31
+DMCONTROL_RESUMEREQ = 1 << 30
+DMCONTROL_ACKHAVERESET = 1 << 28
+DMCONTROL_DMACTIVE = 1 << 0
+
+# dmstatus
+DMSTATUS_IMPEBREAK = 1 << 22
+DMSTATUS_ALLHAVERESET = 1 << 19
+DMSTATUS_ANYHAVERESET = 1 << 18
+DMSTATUS_ALLRESUMEACK = 1 << 17
+DMSTATUS_ANYRESUMEACK = 1 << 16
+DMSTATUS_ALLRUNNING = 1 << 11
+DMSTATUS_ANYRUNNING = 1 << 10
+DMSTATUS_ALLHALTED = 1 << 9
+DMSTATUS_ANYHALTED = 1 << 8
+DMSTATUS_AUTHENTICATED = 1 << 7
+DMSTATUS_VERSION = 2     # Debug spec 0.13
+
+# abstractcs
+ABSTRACTCS_PROGBUFSIZE_SHIFT = 24
+ABSTRACTCS_CMDERR_SHIFT = 8
+ABSTRACTCS_CMDERR_MASK = 0x7
+
+CMDERR_NONE = 0
+CMDERR_NOT_SUPPORTED = 2
+CMDERR_EXCEPTION = 3
+CMDERR_HALT_RESUME = 4
+CMDERR_BUS = 5
+
+# command
+CMDTYPE_ACCESS_REGISTER = 0
+CMDTYPE_QUICK_ACCESS = 1
+CMDTYPE_ACCESS_MEMORY = 2
+COMMAND_SIZE_SHIFT = 20          # aarsize / aamsize
+COMMAND_POSTINCREMENT = 1 << 19  # aarpostincrement / aampostincrement
+COMMAND_POSTEXEC = 1 << 18
+COMMAND_TRANSFER = 1 << 17
+COMMAND_WRITE = 1 << 16
+COMMAND_REGNO_MASK = 0xFFFF
+REGNO_GPR = 0x1000
+
+ABSTRACTAUTO_PROGBUF_SHIFT = 16
+
+# sbcs
+SBCS_SBVERSION = 1 << 29
+SBCS_SBBUSYERROR = 1 << 22
+SBCS_SBREADONADDR = 1 << 20
+SBCS_SBACCESS_SHIFT = 17
+SBCS_SBAUTOINCREMENT = 1 << 16
+SBCS_SBREADONDATA = 1 << 15
+SBCS_SBERROR_SHIFT = 12
+SBCS_SBASIZE = 32 << 5
+SBCS_SBACCESS_SUPPORTED = 0b111  # sbaccess8/16/32
+SBCS_WRITABLE = SBCS_SBREADONADDR | (0x7 << SBCS_SBACCESS_SHIFT) | SBCS_SBAUTOINCREMENT | SBCS_SBREADONDATA
+
+SBERROR_NONE = 0
+SBERROR_BAD_ADDRESS = 2
+SBERROR_ALIGNMENT = 3
+SBERROR_SIZE = 4
+
+SIZE_WORD = 2    # sbaccess/aamsize/aarsize = 2: 32 bit
+
+EBREAK = 0x00100073
+
+
+class ProgbufException(Exception):
+    """Lệnh trong program buffer gây exception (abstractcs.cmderr = 3)."""
+
+
+class DebugModuleInterface:
+    """
+    Thanh ghi DMI của DebugModule dm.
+
+    Args:
+        dm: DebugModule của hart; halt/resume và truy cập GPR đi qua dm như REPL.
+    """
+
+    def __init__(self, dm):
+        self.dm = dm
+        self.iss = dm.iss
+        self.accesses = 0  # Số lần truy cập DMI (read + write)
+        self.readers = {
+            DMCONTROL: self.read_dmcontrol,
+            DMSTATUS: self.read_dmstatus,
+            HARTINFO: lambda: 0,
+            ABSTRACTCS: self.read_abstractcs,
+            COMMAND: lambda: 0,
+            ABSTRACTAUTO: lambda: self.abstractauto,
+            SBCS: self.read_sbcs,
+            SBADDRESS0: lambda: self.sbaddress,
+            SBDATA0: self.read_sbdata,
+        }
+        self.writers = {
+            DMCONTROL: self.write_dmcontrol,
+            ABSTRACTCS: self.write_abstractcs,
+            COMMAND: self.write_command,
+            ABSTRACTAUTO: self.write_abstractauto,
+            SBCS: self.write_sbcs,
+            SBADDRESS0: self.write_sbaddress,
+            SBDATA0: self.write_sbdata,
+        }
+        self.reset()
+
+    def reset(self):
+        """dmactive = 0: đưa mọi thanh ghi của DM về giá trị reset."""
+        self.dmactive = False
+        self.haltreq = False
+        self.resumeack = False
+        self.havereset = True
+        self.data = [0] * DATA_COUNT
+        self.progbuf = [0] * PROGBUF_SIZE
+        self.command = 0
+        self.cmderr = CMDERR_NONE
+        self.abstractauto = 0
+        self.sbcs = SIZE_WORD << SBCS_SBACCESS_SHIFT
+        self.sberror = SBERROR_NONE
+        self.sbaddress = 0
+        self.sbdata = 0
+
+    # Truy cập DMI
+
+    def read(self, address):
+        self.accesses += 1
+        if DATA0 <= address < DATA0 + DATA_COUNT:
+            index = address - DATA0
+            value = self.data[index]
+            if self.abstractauto >> index & 1:
+                self.execute_command()  # autoexecdata: đọc data trả kết quả cũ rồi chạy tiếp
+            return value
+        if PROGBUF0 <= address < PROGBUF0 + PROGBUF_SIZE:
+            index = address - PROGBUF0
+            value = self.progbuf[index]
+            if self.abstractauto >> (ABSTRACTAUTO_PROGBUF_SHIFT + index) & 1:
+                self.execute_command()
+            return value
+        reader = self.readers.get(address)
+        return reader() if reader is not None else 0
+
+    def write(self, address, value):
+        self.accesses += 1
+        value &= 0xFFFFFFFF
+        if address == DMCONTROL:
+            self.write_dmcontrol(value)
+        elif not self.dmactive:
+            return  # DM đang reset: chỉ dmcontrol.dmactive ghi được
+        elif DATA0 <= address < DATA0 + DATA_COUNT:
+            index = address - DATA0
+            self.data[index] = value
+            if self.abstractauto >> index & 1:
+                self.execute_command()
+        elif PROGBUF0 <= address < PROGBUF0 + PROGBUF_SIZE:
+            index = address - PROGBUF0
+            self.progbuf[index] = value
+            if self.abstractauto >> (ABSTRACTAUTO_PROGBUF_SHIFT + index) & 1:
+                self.execute_command()
+        else:
+            writer = self.writers.get(address)
+            if writer is not None:
+                writer(value)
+
+    def read_block(self, address, count):
+        """count lần read(address) liên tiếp (transport có thể gộp thành một round trip)."""
+        return [self.read(address) for _ in range(count)]
+
+    # Điều khiển hart
+
+    def halted(self):
+        return self.dm.in_debug_mode
+
+    def read_dmcontrol(self):
+        return (DMCONTROL_HALTREQ if self.haltreq else 0) | (DMCONTROL_DMACTIVE if self.dmactive else 0)
+
+    def write_dmcontrol(self, value):
+        if not value & DMCONTROL_DMACTIVE:
+            self.reset()
+            return
+        self.dmactive = True
+        self.haltreq = bool(value & DMCONTROL_HALTREQ)
+        if value & DMCONTROL_ACKHAVERESET:
+            self.havereset = False
+        if self.haltreq and not self.halted():
+            self.dm.halt_hart()
+            self.dm.dcsrs["dcsr"].set_debug_cause("Reset-haltreq")  # cause 3 = haltreq
+        elif value & DMCONTROL_RESUMEREQ and not self.haltreq:
+            self.resumeack = False
+            if self.halted():
+                self.dm.resume_hart()
+            self.resumeack = True
+
+    def read_dmstatus(self):
+        value = DMSTATUS_VERSION | DMSTATUS_AUTHENTICATED | DMSTATUS_IMPEBREAK
+        if self.halted():
+            value |= DMSTATUS_ALLHALTED | DMSTATUS_ANYHALTED
+        else:
+            value |= DMSTATUS_ALLRUNNING | DMSTATUS_ANYRUNNING
+        if self.resumeack:
+            value |= DMSTATUS_ALLRESUMEACK | DMSTATUS_ANYRESUMEACK
+        if self.havereset:
+            value |= DMSTATUS_ALLHAVERESET | DMSTATUS_ANYHAVERESET
+        return value
+
+    def run(self, max_instructions=None):
+        """
+        Cho hart đang chạy (sau resumereq) retire tối đa max_instructions lệnh; chạm
+        breakpoint/trigger thì hart halt (cause = Trigger), dừng do request_halt() thì
+        halt với cause = haltreq. Trả về số lệnh đã retire.
+        """
+        if self.halted() or self.iss.halted:
+            return 0
+        executed = self.dm.run(max_instructions)
+        if self.iss.breakpoint_hit is not None or self.iss.trigger_hit is not None:
+            self.dm.halt_hart()
+            self.dm.dcsrs["dcsr"].set_debug_cause("Trigger")
+        elif self.iss.haltreq_hit:
+            self.dm.halt_hart()
+            self.dm.dcsrs["dcsr"].set_debug_cause("Reset-haltreq")
+        return executed
+
+    # Abstract command
+
+    def read_abstractcs(self):
+        return (PROGBUF_SIZE << ABSTRACTCS_PROGBUFSIZE_SHIFT) | (self.cmderr << ABSTRACTCS_CMDERR_SHIFT) | DATA_COUNT
+
+    def write_abstractcs(self, value):
+        self.cmderr &= ~(value >> ABSTRACTCS_CMDERR_SHIFT) & ABSTRACTCS_CMDERR_MASK  # W1C
+
+    def write_abstractauto(self, value):
+        mask = ((1 << PROGBUF_SIZE) - 1) << ABSTRACTAUTO_PROGBUF_SHIFT | ((1 << DATA_COUNT) - 1)
+        self.abstractauto = value & mask
+
+    def write_command(self, value):
+        if self.cmderr != CMDERR_NONE:
+            return  # Lệnh bị bỏ qua tới khi debugger xoá cmderr
+        self.command = value
+        self.execute_command()
+
+    def execute_command(self):
+        if self.cmderr != CMDERR_NONE:
+            return
+        cmdtype = self.command >> 24
+        try:
+            if cmdtype == CMDTYPE_ACCESS_REGISTER:
+                self.access_register(self.command)
+            elif cmdtype == CMDTYPE_ACCESS_MEMORY:
+                self.access_memory(self.command)
+            else:
+                self.cmderr = CMDERR_NOT_SUPPORTED
+        except ProgbufException:
+            self.cmderr = CMDERR_EXCEPTION
+
+    def access_register(self, command):
+        if not self.halted():
+            self.cmderr = CMDERR_HALT_RESUME
+            return
+        regno = command & COMMAND_REGNO_MASK
+        if command & COMMAND_TRANSFER:
+            if (command >> COMMAND_SIZE_SHIFT) & 0x7 != SIZE_WORD:
+                self.cmderr = CMDERR_NOT_SUPPORTED
+                return
+            if command & COMMAND_WRITE:
+                self.write_register(regno, self.data[0])
+            else:
+                self.data[0] = self.read_register(regno)
+        if command & COMMAND_POSTEXEC:
+            self.execute_progbuf()
+        if command & COMMAND_POSTINCREMENT:
+            regno = (regno + 1) & COMMAND_REGNO_MASK
+            self.command = (command & ~COMMAND_REGNO_MASK) | regno
+
+    def _csr(self, regno):
+        """Trả về CSR32 của regno (CSR S-mode, debug CSR) hoặc tên trigger CSR."""
+        if regno in CSR_ADDRESSES:
+            return self.iss.csrs[CSR_ADDRESSES[regno]]
+        if regno in DEBUG_CSR_ADDRESSES:
+            return self.dm.dcsrs[DEBUG_CSR_ADDRESSES[regno]]
+        if regno in TRIGGER_CSR_ADDRESSES:
+            return TRIGGER_CSR_ADDRESSES[regno]
+        raise ProgbufException(f"No register 0x{regno:04x}")
+
+    def read_register(self, regno):
+        if REGNO_GPR <= regno < REGNO_GPR + 32:
+            return self.dm.read_gpr(regno - REGNO_GPR) & 0xFFFFFFFF
+        csr = self._csr(regno)
+        if isinstance(csr, str):
+            return self.dm.triggers.read_csr(csr)
+        return int(csr.read(), 2)
+
+    def write_register(self, regno, value):
+        if REGNO_GPR <= regno < REGNO_GPR + 32:
+            self.dm.write_gpr(regno - REGNO_GPR, value)
+            return
+        csr = self._csr(regno)
+        if isinstance(csr, str):
+            self.dm.triggers.write_csr(csr, value)
+        else:
+            csr.write(f"{value:032b}")
+        self._state_changed()
+
+    def access_memory(self, command):
+        size = 1 << ((command >> COMMAND_SIZE_SHIFT) & 0x7)
+        if size > 4:
+            self.cmderr = CMDERR_NOT_SUPPORTED
+            return
+        addr = self.data[1]
+        try:
+            if command & COMMAND_WRITE:
+                self.bus_write(addr, size, self.data[0])
+            else:
+                self.data[0] = self.bus_read(addr, size)
+        except IndexError:
+            self.cmderr = CMDERR_BUS
+            return
+        if command & COMMAND_POSTINCREMENT:
+            self.data[1] = (addr + size) & 0xFFFFFFFF
+
+    def execute_progbuf(self):
+        """
+        Chạy progbuf trên hart đang halt tới ebreak (hoặc impebreak sau progbuf cuối).
+        Exception không vào trap handler (không đổi sepc/stval/privilege) mà thành
+        cmderr = 3; lệnh nhảy cũng bị coi là exception. pc và instret không đổi.
+        """
+        iss = self.iss
+        pc, priv = iss.pc, iss.privilege_level
+        scause = iss.csrs["scause"].value
+        watchpoints, iss.watchpoints = iss.watchpoints, ()  # Trigger không khớp trong debug mode
+        verbose, iss.verbose = iss.verbose, False
+
+        def trapped(cause_code, faulting_address=None, epc=None, interrupt=False):
+            raise ProgbufException(f"Exception {cause_code} in program buffer")
+
+        hooked_enter_trap = iss.__dict__.get("enter_trap")  # Override của HookRegistry (nếu có)
+        iss.enter_trap = trapped
+        try:
+            for i, instr in enumerate(self.progbuf):
+                if instr == EBREAK:
+                    break
+                handler = iss.dispatch.get(instr & 0x7F)
+                if handler is None:
+                    raise ProgbufException(f"Illegal instruction 0x{instr:08x} in program buffer")
+                iss.pc = next_pc = pc + 4 * (i + 1)
+                try:
+                    handler(instr)
+                except (IndexError, NotImplementedError) as e:
+                    # Truy cập ngoài bộ nhớ hoặc funct3 chưa hỗ trợ: cũng là exception (cmderr = 3)
+                    raise ProgbufException(f"{type(e).__name__} in program buffer: {e}") from e
+                if iss.pc != next_pc:
+                    raise ProgbufException("Control transfer in program buffer")
+        except ProgbufException:
+            iss.csrs["scause"].value = scause
+            iss.privilege_level = priv
+            raise
+        finally:
+            if hooked_enter_trap is not None:
+                iss.enter_trap = hooked_enter_trap
+            else:
+                del iss.enter_trap
+            iss.watchpoints = watchpoints
+            iss.verbose = verbose
+            iss.pc = pc
+            self._state_changed()
+
+    # System bus access
+
+    def _state_changed(self):
+        if self.dm.recorder is not None:
+            self.dm.recorder.truncate()  # Tương lai đã ghi không còn đúng
+
+    def bus_read(self, addr, size):
+        if addr + size > len(self.iss.memory):
+            raise IndexError(f"Address 0x{addr:08x} out of range")
+        return int.from_bytes(self.iss.memory[addr:addr + size], "little")
+
+    def bus_write(self, addr, size, value):
+        if addr + size > len(self.iss.memory):
+            raise IndexError(f"Address 0x{addr:08x} out of range")
+        self.iss.memory[addr:addr + size] = (value & ((1 << (8 * size)) - 1)).to_bytes(size, "little")
+        if (addr >> CODE_PAGE_SHIFT) in self.iss.code_pages:
+            self.iss.invalidate_blocks()  # Ghi đè lên code đã decode
+        self._state_changed()
+
+    def read_sbcs(self):
+        return (SBCS_SBVERSION | self.sbcs | (self.sberror << SBCS_SBERROR_SHIFT)
+                | SBCS_SBASIZE | SBCS_SBACCESS_SUPPORTED)
+
+    def write_sbcs(self, value):
+        self.sbcs = value & SBCS_WRITABLE
+        self.sberror &= ~(value >> SBCS_SBERROR_SHIFT) & 0x7  # W1C
+
+    def write_sbaddress(self, value):
+        self.sbaddress = value
+        if self.sbcs & SBCS_SBREADONADDR:
+            self.sb_access(write=False)
+
+    def read_sbdata(self):
+        value = self.sbdata
+        if self.sbcs & SBCS_SBREADONDATA:
+            self.sb_access(write=False)  # Đọc trước word kế tiếp cho lần đọc sbdata0 sau
+        return value
+
+    def write_sbdata(self, value):
+        self.sbdata = value
+        self.sb_access(write=True)
+
+    def sb_access(self, write):
+        if self.sberror != SBERROR_NONE:
+            return
+        sbaccess = (self.sbcs >> SBCS_SBACCESS_SHIFT) & 0x7
+        if sbaccess > SIZE_WORD:
+            self.sberror = SBERROR_SIZE
+            return
+        size = 1 << sbaccess
+        addr = self.sbaddress
+        if addr % size:
+            self.sberror = SBERROR_ALIGNMENT
+            return
+        try:
+            if write:
+                self.bus_write(addr, size, self.sbdata)
+            else:
+                self.sbdata = self.bus_read(addr, size)
+        except IndexError:
+            self.sberror = SBERROR_BAD_ADDRESS
+            return
+        if self.sbcs & SBCS_SBAUTOINCREMENT:
+            self.sbaddress = (addr + size) & 0xFFFFFFFF
+
+
+# Trình tự phía debugger, dùng được với mọi object có read(address), read_block(address,
+# count) và write(address, value) (DebugModuleInterface trực tiếp hoặc Jtag.JtagClient).
+
+def read_memory(dmi, addr, count):
+    """Đọc count word từ addr bằng system bus: count + 4 lần truy cập DMI."""
+    sbcs = SBCS_SBREADONADDR | SBCS_SBAUTOINCREMENT | (SIZE_WORD << SBCS_SBACCESS_SHIFT)
+    if count <= 0:
+        return []
+    dmi.write(SBCS, sbcs | SBCS_SBREADONDATA)
+    dmi.write(SBADDRESS0, addr)
+    words = dmi.read_block(SBDATA0, count - 1)
+    dmi.write(SBCS, sbcs)  # Lần đọc cuối không đọc trước word sau vùng cần dump
+    words.append(dmi.read(SBDATA0))
+    _check_sberror(dmi)
+    return words
+
+
+def write_memory(dmi, addr, words):
+    """Ghi các word vào addr bằng system bus: len(words) + 3 lần truy cập DMI."""
+    dmi.write(SBCS, SBCS_SBAUTOINCREMENT | (SIZE_WORD << SBCS_SBACCESS_SHIFT))
+    dmi.write(SBADDRESS0, addr)
+    for word in words:
+        dmi.write(SBDATA0, word)
+    _check_sberror(dmi)
+
+
+def _check_sberror(dmi):
+    sberror = (dmi.read(SBCS) >> SBCS_SBERROR_SHIFT) & 0x7
+    if sberror != SBERROR_NONE:
+        dmi.write(SBCS, sberror << SBCS_SBERROR_SHIFT)
+        raise ValueError(f"System bus error {sberror}")
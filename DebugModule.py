@@ -1,11 +1,34 @@
-from ISS import RISCV_ISS
+import contextlib
+import signal
+import threading
+
+from ISS import RISCV_ISS, DebugHalt
 from CSR import CSR32, DCSR, DPC, DScratch0, DScratch1
+from Triggers import TriggerModule
+from DMI import DebugModuleInterface, DMCONTROL, DMCONTROL_DMACTIVE, read_memory
+
+
+@contextlib.contextmanager
+def sigint_requests_halt(iss):
+    """Trong khối with, Ctrl-C gọi iss.request_halt() thay vì KeyboardInterrupt (chỉ main thread)."""
+    if threading.current_thread() is not threading.main_thread():
+        yield
+        return
+    previous = signal.signal(signal.SIGINT, lambda signum, frame: iss.request_halt())
+    try:
+        yield
+    finally:
+        signal.signal(signal.SIGINT, previous)
+
 
 class DebugModule:
     def __init__(self, iss: RISCV_ISS):
         self.iss = iss  # Instance of ISS (1 hart)
         self.in_debug_mode = False
-        self.breakpoints = set()
+        self.breakpoints = {}  # pc -> Breakpoint (Breakpoints.py)
+        self.triggers = TriggerModule(iss)  # tselect/tdata1/tdata2: watchpoint, icount
+        self.recorder = None  # Replay.Recorder khi đang ghi (reverse debugging)
+        self.dmi = DebugModuleInterface(self)  # Thanh ghi DMI cho debugger bên ngoài (JTAG)
         # Debug CSRs
         self.dcsrs = {
             "dcsr": DCSR(),
@@ -32,13 +55,112 @@ class DebugModule:
                     try:
                         run_count = int(debug_command.split()[1])
                         for i in range(run_count):
-                            self.iss.step()
+                            try:
+                                if self.recorder is not None:
+                                    self.recorder.run(1)  # Ghi snapshot/đầu vào như khi chạy c
+                                    if self.iss.trigger_hit is not None:
+                                        raise DebugHalt(self.iss.trigger_hit)
+                                elif self.iss.trigger_pc == self.iss.pc:
+                                    self.iss.step_over_trigger()
+                                else:
+                                    self.iss.step()
+                            except DebugHalt:
+                                print(f"[DEBUG] Trigger hit: {self.iss.trigger_hit!r} at 0x{self.iss.pc:08x}")
+                                break
                             if self.check_breakpoint():
                                 break
                         print(f"[DEBUG] Stepped {run_count} instruction(s).")
                     except ValueError:
                         print("Invalid format. Use: r N (e.g., r 5)")
 
+                elif debug_command in ("c", "continue") or debug_command.startswith(("c ", "continue ")):
+                    # Chạy bằng RISCV_ISS.run() (block cache), chỉ dừng ở breakpoint
+                    try:
+                        parts = debug_command.split()
+                        limit = int(parts[1]) if len(parts) > 1 else None
+                    except ValueError:
+                        print("Invalid format. Use: c [N] (e.g., c 1000000)")
+                        continue
+                    with sigint_requests_halt(self.iss):  # Ctrl-C dừng hart thay vì thoát
+                        self.report_stop(self.run(limit))
+
+                elif debug_command == "record" or debug_command.startswith("record "):
+                    try:
+                        parts = debug_command.split()
+                        self.start_recording(int(parts[1], 0) if len(parts) > 1 else None)
+                    except ValueError as e:
+                        print(e)
+                        print("Usage: record [snapshot interval]")
+
+                elif debug_command in ("rs", "reverse-step") or debug_command.startswith(("rs ", "reverse-step ")):
+                    if self.recorder is None:
+                        print("Not recording. Use: record")
+                        continue
+                    try:
+                        parts = debug_command.split()
+                        self.recorder.reverse_step(int(parts[1], 0) if len(parts) > 1 else 1)
+                    except ValueError as e:
+                        print(e)
+                        continue
+                    print(f"[DEBUG] At instret {self.iss.instret}, PC=0x{self.iss.pc:08x}")
+                    self.dcsrs["dpc"].save_pc(self.iss.pc)
+
+                elif debug_command in ("rc", "reverse-continue"):
+                    if self.recorder is None:
+                        print("Not recording. Use: record")
+                        continue
+                    if self.recorder.reverse_continue() is None:
+                        print(f"[DEBUG] No earlier stop, at start of recording (instret {self.iss.instret})")
+                    else:
+                        self.report_stop(None)
+                    self.dcsrs["dpc"].save_pc(self.iss.pc)
+
+                elif debug_command.startswith("goto "):
+                    if self.recorder is None:
+                        print("Not recording. Use: record")
+                        continue
+                    try:
+                        self.recorder.goto(int(debug_command.split()[1], 0))
+                    except (IndexError, ValueError) as e:
+                        print(e)
+                        print("Usage: goto <instret>")
+                        continue
+                    print(f"[DEBUG] At instret {self.iss.instret}, PC=0x{self.iss.pc:08x}")
+                    self.dcsrs["dpc"].save_pc(self.iss.pc)
+
+                elif debug_command.startswith("dump "):
+                    # dump ADDR [N]: đọc N word qua system bus của DMI (N + 4 lần truy cập DMI)
+                    try:
+                        parts = debug_command.split()
+                        addr = int(parts[1], 0)
+                        count = int(parts[2], 0) if len(parts) > 2 else 16
+                        if not self.dmi.dmactive:
+                            self.dmi.write(DMCONTROL, DMCONTROL_DMACTIVE)
+                        before = self.dmi.accesses
+                        words = read_memory(self.dmi, addr, count)
+                    except (IndexError, ValueError) as e:
+                        print(e)
+                        print("Usage: dump ADDR [N]")
+                        continue
+                    for i in range(0, len(words), 4):
+                        print(f"0x{addr + 4 * i:08x}: " + " ".join(f"{w:08x}" for w in words[i:i + 4]))
+                    print(f"[DEBUG] {count} word(s) in {self.dmi.accesses - before} DMI access(es)")
+
+                elif debug_command.startswith("dmi "):
+                    # dmi ADDR: đọc thanh ghi DMI, dmi ADDR VALUE: ghi
+                    try:
+                        args = [int(x, 0) for x in debug_command.split()[1:]]
+                        if len(args) > 1:
+                            self.dmi.write(args[0], args[1])  # Đọc lại có thể có tác dụng phụ (sbdata0, data0)
+                        else:
+                            print(f"DMI[0x{args[0]:02x}] = 0x{self.dmi.read(args[0]):08x}")
+                    except (IndexError, ValueError) as e:
+                        print(e)
+                        print("Usage: dmi ADDR [VALUE]")
+
+                elif debug_command == "info record":
+                    print(self.recorder.describe() if self.recorder is not None else "Not recording.")
+
                 elif debug_command == "resume":
                     self.exit_debug_mode()
                     break
@@ -100,16 +222,87 @@ class DebugModule:
                 
                 elif debug_command.startswith("break "):
                     try:
-                        addr_str = debug_command.split()[1]
-                        addr = int(addr_str, 0)  # Cho phép 0x... hoặc thập phân
-                        self.set_breakpoint(addr)
+                        location, _, condition = debug_command[6:].partition(" if ")
+                        addr = int(location.strip(), 0)  # Cho phép 0x... hoặc thập phân
+                        self.set_breakpoint(addr, condition.strip() or None)
+                    except ValueError as e:
+                        print(e)
+                        print("Usage: break <address> [if <condition>]. Example: break 0x100 if x10 == 0x40 && hitcount > 100")
+
+                elif debug_command.startswith("delete "):
+                    try:
+                        self.remove_breakpoint(int(debug_command.split()[1], 0))
                     except (IndexError, ValueError):
-                        print("Usage: break <address>. Example: break 0x100")
+                        print("Usage: delete <address>")
+
+                elif debug_command == "info break":
+                    for bp in self.breakpoints.values():
+                        print(bp)
+
+                elif debug_command.startswith("watch "):
+                    # watch <addr> [<end>] [r|w|rw]: dừng trước load/store chạm vào [addr, end)
+                    try:
+                        args = debug_command.split()[1:]
+                        access = args.pop() if args[-1] in ("r", "w", "rw") else "w"
+                        start = int(args[0], 0)
+                        end = int(args[1], 0) if len(args) > 1 else None
+                        indices = self.triggers.watch(start, end, load="r" in access, store="w" in access)
+                        print(f"[DEBUG] Watchpoint set using trigger(s) {indices}")
+                    except (IndexError, ValueError) as e:
+                        print(e)
+                        print("Usage: watch <address> [<end>] [r|w|rw]. Example: watch 0x8000 0x8100 w")
+
+                elif debug_command.startswith("icount "):
+                    try:
+                        index = self.triggers.icount(int(debug_command.split()[1], 0))
+                        print(f"[DEBUG] icount trigger {index} armed, use 'c' to run")
+                    except (IndexError, ValueError) as e:
+                        print(e)
+                        print("Usage: icount N (then c)")
+
+                elif debug_command.startswith("tdelete "):
+                    try:
+                        index = int(debug_command.split()[1])
+                        self.triggers.clear(index)
+                        print(f"[DEBUG] Trigger {index} cleared")
+                    except (IndexError, ValueError):
+                        print("Usage: tdelete <trigger index>")
+
+                elif debug_command == "info triggers":
+                    for line in self.triggers.describe():
+                        print(line)
+
+                elif debug_command == "tcsr" or debug_command.startswith("tcsr "):
+                    # tcsr: in tselect/tdata1/tdata2, tcsr <name> <value>: ghi
+                    args = debug_command.split()[1:]
+                    try:
+                        if args:
+                            self.triggers.write_csr(args[0], int(args[1], 0))
+                        for name in ("tselect", "tdata1", "tdata2"):
+                            print(f"{name.upper()}: 0x{self.triggers.read_csr(name):08x}")
+                    except (IndexError, ValueError) as e:
+                        print(e)
+                        print("Usage: tcsr [tselect|tdata1|tdata2 <value>]")
 
                 elif debug_command == "help":
                     print("Available debug commands:")
-                    print("  break        - Place a breakpoint")
+                    print("  break        - Place a breakpoint (break ADDR [if COND])")
+                    print("  delete       - Remove a breakpoint (delete ADDR)")
+                    print("  info break   - List breakpoints and hit counts")
+                    print("  watch        - Watch loads/stores (watch ADDR [END] [r|w|rw])")
+                    print("  icount N     - Halt after N more instructions (then c)")
+                    print("  info triggers - List trigger module state")
+                    print("  tdelete N    - Clear trigger N")
+                    print("  tcsr         - Read/write tselect, tdata1, tdata2 (tcsr NAME VALUE)")
+                    print("  c [N]        - Continue at full speed until a breakpoint (or N instructions, Ctrl-C halts)")
                     print("  r N          - Run next N instructions")
+                    print("  record [N]   - Record execution with a snapshot every N instructions")
+                    print("  rs [N]       - Reverse-step N instructions (needs record)")
+                    print("  rc           - Reverse-continue to the previous breakpoint/trigger stop")
+                    print("  goto N       - Go to instret N (past or future)")
+                    print("  info record  - Show recording state")
+                    print("  dump ADDR [N] - Dump N memory words through DMI system bus access")
+                    print("  dmi ADDR [V] - Read/write a DMI register (dmcontrol 0x10, sbcs 0x38, ...)")
                     print("  resume       - Resume normal execution")
                     print("  reg xN       - Print register xN (e.g., reg x10)")
                     print("  reg xN =     - Write register xN (e.g., reg x10 = 46)")
@@ -127,8 +320,8 @@ class DebugModule:
     def exit_debug_mode(self):
         if self.in_debug_mode:
             self.in_debug_mode = False
-            self.iss.pc = self.dcsrs["dpc"].read()
-            print(f"[DEBUG] Exiting debug mode, resuming at PC=0x{int(self.iss.pc, 2):08x}")
+            self.iss.pc = self.dcsrs["dpc"].restore_pc()
+            print(f"[DEBUG] Exiting debug mode, resuming at PC=0x{self.iss.pc:08x}")
             
     # Requirement 1: Debugger gets implementation info
     def get_implementation_info(self):
@@ -176,14 +369,69 @@ class DebugModule:
             raise ValueError("Register index out of range")
         if reg_index != 0:  # x0 is always zero
             self.iss.regs[reg_index] = value & 0xFFFFFFFF  # enforce 32-bit
+            if self.recorder is not None:
+                self.recorder.truncate()  # Tương lai đã ghi không còn đúng
+
+    def start_recording(self, interval=None):
+        from Replay import Recorder, DEFAULT_INTERVAL
+        self.recorder = Recorder(self.iss, interval or DEFAULT_INTERVAL)
+        print(f"[DEBUG] Recording from instret {self.iss.instret}, snapshot every {self.recorder.interval} instructions")
+
+    def request_halt(self):
+        """haltreq bất đồng bộ: gọi được từ thread khác hoặc signal handler trong lúc run()."""
+        self.iss.request_halt()
+
+    def run(self, max_instructions=None):
+        """
+        Chạy hart bằng run() (qua Recorder nếu đang ghi); trả về số lệnh đã retire. Dừng do
+        request_halt() thì dcsr.cause = haltreq.
+        """
+        if self.recorder is not None:
+            executed = self.recorder.run(max_instructions)
+        else:
+            executed = self.iss.run(max_instructions)
+        if self.iss.haltreq_hit:
+            self.dcsrs["dcsr"].set_debug_cause("Reset-haltreq")
+        return executed
+
+    def report_stop(self, executed):
+        """In lý do run() dừng; executed = None khi dừng do đi lùi."""
+        after = f" after {executed} instruction(s)" if executed is not None else f" (instret {self.iss.instret})"
+        if self.iss.breakpoint_hit is not None:
+            bp = self.iss.breakpoint_hit
+            print(f"[DEBUG] Breakpoint hit at 0x{bp.pc:08x} (hit {bp.hitcount}){after}")
+            if bp.error:
+                print(f"[DEBUG] Breakpoint condition failed: {bp.error}")
+        elif self.iss.trigger_hit is not None:
+            print(f"[DEBUG] Trigger hit: {self.iss.trigger_hit!r} at 0x{self.iss.pc:08x}{after}")
+        elif self.iss.haltreq_hit:
+            print(f"[DEBUG] Halt requested, stopped at 0x{self.iss.pc:08x}{after}")
+        elif self.iss.halted:
+            print(f"[DEBUG] Program finished{after}")
+        else:
+            print(f"[DEBUG] Ran {executed} instruction(s).")
+        self.dcsrs["dpc"].save_pc(self.iss.pc)
+
+    def set_breakpoint(self, addr: int, condition=None):
+        from Breakpoints import Breakpoint
+        bp = Breakpoint(addr, condition)  # Điều kiện sai cú pháp -> ValueError
+        self.breakpoints[addr] = bp
+        self.iss.set_breakpoint(addr, bp)
+        print(f"[DEBUG] Breakpoint set at 0x{addr:08x}" + (f" if {condition}" if condition else ""))
 
-    def set_breakpoint(self, addr: int):
-        self.breakpoints.add(addr)
-        print(f"[DEBUG] Breakpoint set at 0x{addr:08x}")
+    def remove_breakpoint(self, addr: int):
+        if self.breakpoints.pop(addr, None) is None:
+            print(f"[DEBUG] No breakpoint at 0x{addr:08x}")
+            return
+        self.iss.remove_breakpoint(addr)
+        print(f"[DEBUG] Breakpoint removed at 0x{addr:08x}")
 
     def check_breakpoint(self):
-        if self.iss.pc in self.breakpoints:
+        bp = self.breakpoints.get(self.iss.pc)
+        if bp is not None and bp.hit(self.iss):
             print(f"[DEBUG] Breakpoint hit at 0x{self.iss.pc:08x}")
-            self.enter_debug_mode("Breakpoint")
+            if bp.error:
+                print(f"[DEBUG] Breakpoint condition failed: {bp.error}")
+            self.enter_debug_mode("Trigger")  # Breakpoint phần cứng = trigger
             return True
         return False
@@ -0,0 +1,267 @@
+import contextlib
+import json
+import os
+
+from DMI import DMCONTROL, DMCONTROL_DMACTIVE, read_memory
+
+# Chạy lệnh debug không tương tác cho DebugModule: cùng cú pháp với REPL của
+# enter_debug_mode() nhưng đọc từ chuỗi/file thay vì input(), không in gì ra console và
+# trả về kết quả có cấu trúc (dict, xuất được ra JSON) cho từng lệnh.
+#
+#   script = DebugScript(dm)
+#   results = script.run("break 0x40; c; reg all; dump 0x1000 16")
+#   state = script.run_until_stop(breakpoints=[0x40], dumps=[(0x1000, 16)])
+#
+# Lệnh cách nhau bởi xuống dòng hoặc ';', '#' bắt đầu chú thích:
+#   break ADDR [if COND], delete ADDR, watch ADDR [END] [r|w|rw], icount N,
+#   c [N] / continue [N], r N, resume (chạy tới hết), reg xN, reg xN = V, reg all, pc,
+#   csr, dcsr, dump ADDR [N] (qua DMI system bus), state (toàn bộ trạng thái hart)
+
+DEFAULT_DUMP_WORDS = 16
+DECIMAL_FIELDS = frozenset(("executed", "instret", "privilege", "trigger", "triggers"))
+
+
+class HartError(Exception):
+    """Exception do ISS ném ra trong lúc hart chạy (__cause__ là exception gốc)."""
+
+
+def split_commands(text):
+    """Tách script thành danh sách lệnh (bỏ dòng trống và chú thích '#')."""
+    commands = []
+    for line in text.splitlines():
+        line = line.split("#", 1)[0]
+        commands.extend(part.strip() for part in line.split(";") if part.strip())
+    return commands
+
+
+class DebugScript:
+    """
+    Thực thi lệnh debug trên hart đang halt của dm.
+
+    Args:
+        dm: DebugModule; hart được đưa vào debug mode (halt) khi tạo DebugScript.
+        stop_on_error: Dừng script ở lệnh lỗi đầu tiên thay vì chạy tiếp.
+    """
+
+    def __init__(self, dm, stop_on_error=False):
+        self.dm = dm
+        self.iss = dm.iss
+        self.stop_on_error = stop_on_error
+        self.handlers = {
+            "break": self.cmd_break,
+            "delete": self.cmd_delete,
+            "watch": self.cmd_watch,
+            "icount": self.cmd_icount,
+            "c": self.cmd_continue,
+            "continue": self.cmd_continue,
+            "r": self.cmd_step,
+            "resume": self.cmd_resume,
+            "reg": self.cmd_reg,
+            "pc": lambda args: {"pc": self.iss.pc},
+            "csr": lambda args: {"csrs": self.csrs()},
+            "dcsr": lambda args: {"dcsrs": self.dcsrs()},
+            "dump": self.cmd_dump,
+            "state": lambda args: self.state(),
+        }
+        with self._quiet():
+            dm.halt_hart()
+
+    @contextlib.contextmanager
+    def _quiet(self):
+        """DebugModule/ISS in thông báo bằng print(): bỏ hết trong lúc chạy script."""
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            yield
+
+    # Chạy script
+
+    def run(self, script):
+        """
+        Chạy script (chuỗi hoặc danh sách lệnh); trả về danh sách kết quả theo thứ tự.
+        Script luôn dừng sau lệnh làm ISS ném exception (stop = "exception").
+        """
+        commands = split_commands(script) if isinstance(script, str) else list(script)
+        results = []
+        with self._quiet():
+            for command in commands:
+                result = self.execute(command)
+                results.append(result)
+                if "error" in result and (self.stop_on_error or result.get("stop") == "exception"):
+                    break
+        return results
+
+    def run_file(self, path):
+        with open(path) as f:
+            return self.run(f.read())
+
+    def execute(self, command):
+        """Một lệnh -> {"command": ..., <kết quả>} hoặc {"command": ..., "error": ...}."""
+        name, _, args = command.strip().partition(" ")
+        handler = self.handlers.get(name)
+        result = {"command": command}
+        if handler is None:
+            result["error"] = f"Unknown command: {name}"
+            return result
+        try:
+            result.update(handler(args.strip()))
+        except HartError as e:
+            result.update(self._exception_state(e.__cause__))
+        except (IndexError, ValueError) as e:
+            result["error"] = str(e) or f"Invalid arguments for {name}"
+        except Exception as e:
+            result.update(self._exception_state(e))
+        return result
+
+    def run_until_stop(self, breakpoints=(), max_instructions=None, dumps=()):
+        """
+        Đặt breakpoint, chạy tới breakpoint/trigger/kết thúc (hoặc max_instructions) rồi trả
+        về state() kèm các vùng nhớ dumps = [(addr, count), ...] trong một lần gọi.
+        """
+        with self._quiet():
+            for addr in breakpoints:
+                self.dm.set_breakpoint(addr)
+            instret = self.iss.instret
+            try:
+                executed = self._run(max_instructions)
+            except HartError as e:
+                state = self._exception_state(e.__cause__)
+                state["executed"] = self.iss.instret - instret
+                return state
+            state = self.state()
+            state["executed"] = executed
+            state["memory"] = {f"0x{addr:08x}": self.dump(addr, count) for addr, count in dumps}
+        return state
+
+    def _run(self, max_instructions=None):
+        # Mọi exception trong lúc hart chạy (truy cập ngoài bộ nhớ, NotImplementedError, ...)
+        # là lỗi của chương trình, không phải của tham số lệnh
+        try:
+            return self.dm.run(max_instructions)
+        except Exception as e:
+            raise HartError(str(e)) from e
+
+    def _exception_state(self, error):
+        state = self.state()
+        state["stop"] = "exception"
+        state["error"] = f"{type(error).__name__}: {error}"
+        return state
+
+    # Trạng thái
+
+    def stop_reason(self):
+        if self.iss.breakpoint_hit is not None:
+            return "breakpoint"
+        if self.iss.trigger_hit is not None:
+            return "trigger"
+        if self.iss.haltreq_hit:
+            return "haltreq"
+        if self.iss.halted:
+            return "finished"
+        return "limit"  # Đủ số lệnh yêu cầu (r N, c N)
+
+    def csrs(self):
+        return {name: int(csr.read(), 2) for name, csr in self.iss.csrs.items()}
+
+    def dcsrs(self):
+        return {name: int(csr.read(), 2) for name, csr in self.dm.dcsrs.items()}
+
+    def state(self):
+        iss = self.iss
+        return {
+            "stop": self.stop_reason(),
+            "pc": iss.pc,
+            "instret": iss.instret,
+            "privilege": iss.privilege_level,
+            "regs": [value & 0xFFFFFFFF for value in iss.regs],
+            "csrs": self.csrs(),
+            "dcsrs": self.dcsrs(),
+        }
+
+    def dump(self, addr, count):
+        dmi = self.dm.dmi
+        if not dmi.dmactive:
+            dmi.write(DMCONTROL, DMCONTROL_DMACTIVE)
+        return read_memory(dmi, addr, count)
+
+    def _stopped(self, executed):
+        self.dm.dcsrs["dpc"].save_pc(self.iss.pc)
+        return {"stop": self.stop_reason(), "executed": executed, "pc": self.iss.pc, "instret": self.iss.instret}
+
+    # Lệnh
+
+    def cmd_break(self, args):
+        location, _, condition = args.partition(" if ")
+        addr = int(location.strip(), 0)
+        self.dm.set_breakpoint(addr, condition.strip() or None)
+        return {"breakpoint": addr}
+
+    def cmd_delete(self, args):
+        addr = int(args.split()[0], 0)
+        if addr not in self.dm.breakpoints:
+            raise ValueError(f"No breakpoint at 0x{addr:08x}")
+        self.dm.remove_breakpoint(addr)
+        return {"deleted": addr}
+
+    def cmd_watch(self, args):
+        args = args.split()
+        access = args.pop() if args[-1] in ("r", "w", "rw") else "w"
+        start = int(args[0], 0)
+        end = int(args[1], 0) if len(args) > 1 else None
+        return {"triggers": self.dm.triggers.watch(start, end, load="r" in access, store="w" in access)}
+
+    def cmd_icount(self, args):
+        return {"trigger": self.dm.triggers.icount(int(args.split()[0], 0))}
+
+    def cmd_continue(self, args):
+        count = int(args, 0) if args else None
+        return self._stopped(self._run(count))
+
+    def cmd_step(self, args):
+        count = int(args.split()[0], 0)
+        return self._stopped(self._run(count))
+
+    def cmd_resume(self, args):
+        # Chạy tới hết chương trình, bỏ qua breakpoint/trigger (như resume rồi không quay lại)
+        total = 0
+        while not self.iss.halted:
+            total += self._run()
+            if self.iss.breakpoint_hit is None and self.iss.trigger_hit is None:
+                break
+        return self._stopped(total)
+
+    def cmd_reg(self, args):
+        if args == "all":
+            return {"regs": [value & 0xFFFFFFFF for value in self.iss.regs]}
+        lhs, eq, rhs = args.partition("=")
+        name = lhs.strip()
+        if not name.startswith("x"):
+            raise ValueError("Use: reg xN, reg xN = VALUE or reg all")
+        index = int(name[1:])
+        if not 0 <= index <= 31:
+            raise ValueError("Register number must be between 0 and 31")
+        if eq:
+            self.dm.write_gpr(index, int(rhs.strip(), 0))
+        return {name: self.iss.regs[index] & 0xFFFFFFFF}
+
+    def cmd_dump(self, args):
+        args = args.split()
+        addr = int(args[0], 0)
+        count = int(args[1], 0) if len(args) > 1 else DEFAULT_DUMP_WORDS
+        return {"address": addr, "words": self.dump(addr, count)}
+
+
+def format_result(result):
+    """Một dòng văn bản cho kết quả của một lệnh (khi không xuất JSON)."""
+    fields = []
+    for key, value in result.items():
+        if key == "command":
+            continue
+        if key in DECIMAL_FIELDS:
+            value = " ".join(map(str, value)) if isinstance(value, list) else value
+        elif isinstance(value, int):
+            value = f"0x{value:08x}"
+        elif isinstance(value, list):
+            value = " ".join(f"{v:08x}" for v in value)
+        elif isinstance(value, dict):
+            value = json.dumps(value)
+        fields.append(f"{key}={value}")
+    return f"{result['command']}: " + ", ".join(fields)
@@ -0,0 +1,250 @@
+import argparse
+import contextlib
+import os
+import sys
+
+from ISS import RISCV_ISS
+from Trace import RetireCapture, REC_MEM_WRITE
+
+# Differential testing giữa hai engine:
+#   - RISCV_ISS (ISS.py): class, bộ nhớ dạng bytearray
+#   - RISCV_simulator.py: engine cũ dùng biến toàn cục, dataMemory lưu theo word
+# Cả hai chạy cùng một chương trình trong cùng process, trạng thái kiến trúc được
+# so sánh sau mỗi lệnh (hoặc mỗi block N lệnh) và báo lại chỗ lệch đầu tiên.
+
+S_MODE_CSRS = ("sstatus", "stvec", "sip", "sie", "scounteren", "sscratch",
+               "sepc", "scause", "stval", "senvcfg", "satp")
+
+
+def load_words(path):
+    """Đọc file text.bin (mỗi dòng một lệnh 32 bit dạng chuỗi '0'/'1')."""
+    words = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                words.append(int(line, 2))
+    return words
+
+
+class IssEngine:
+    name = "ISS"
+
+    def __init__(self, words, stvec):
+        self.iss = RISCV_ISS()
+        self.iss.verbose = False
+        for i, word in enumerate(words):
+            self.iss.store_word(4 * i, word)
+        self.end = 4 * len(words)
+        self.iss.csrs["stvec"].write(stvec)
+        self.iss.privilege_level = 0b01  # Engine cũ khởi động ở S-mode
+        self.capture = RetireCapture()
+        self.iss.tracer = self.capture
+        self.stores = set()
+
+    def done(self):
+        pc = self.iss.pc
+        return not (0 <= pc < self.end) or self.iss.load_word(pc) == 0
+
+    def step(self):
+        self.iss.step()
+        if self.capture.flags & REC_MEM_WRITE:
+            self.stores.add(self.capture.mem_addr)
+
+    def state(self):
+        iss = self.iss
+        return {
+            "pc": iss.pc & 0xFFFFFFFF,
+            "regs": tuple(r & 0xFFFFFFFF for r in iss.regs),
+            "priv": iss.privilege_level,
+            "csrs": tuple(iss.csrs[name].read() for name in S_MODE_CSRS),
+        }
+
+    def read_word(self, addr):
+        if 0 <= addr and addr + 3 < len(self.iss.memory):
+            return self.iss.load_word(addr)
+        return None
+
+
+class LegacyEngine:
+    name = "RISCV_simulator"
+
+    def __init__(self, words):
+        import RISCV_simulator as sim
+        self.sim = sim
+        sim.reset_state()
+        self.instructions = [f"{word:032b}" for word in words]
+        self.exited = False
+        self.devnull = open(os.devnull, "w")
+
+    def done(self):
+        return self.exited or not (0 <= self.sim.pc < 4 * len(self.instructions))
+
+    def step(self):
+        with contextlib.redirect_stdout(self.devnull):
+            try:
+                self.sim.step(self.instructions)
+            except SystemExit:
+                self.exited = True  # ecall EXIT
+
+    def state(self):
+        sim = self.sim
+        return {
+            "pc": sim.pc & 0xFFFFFFFF,
+            "regs": tuple(sim.registerFiles[str(i)] & 0xFFFFFFFF for i in range(32)),
+            "priv": 0b01 if sim.SUPERVISOR_MODE else 0b00,
+            "csrs": tuple(sim.csrs[name].read() for name in S_MODE_CSRS),
+        }
+
+    def stores(self):
+        return self.sim.dataMemory
+
+    def close(self):
+        self.devnull.close()
+
+
+class Divergence:
+    def __init__(self, program, index, pc, instr, fields, iss_state, legacy_state, note=""):
+        self.program = program
+        self.index = index          # Số lệnh đã chạy trước khi lệch
+        self.pc = pc
+        self.instr = instr
+        self.fields = fields        # Danh sách (tên, giá trị ISS, giá trị engine cũ)
+        self.iss_state = iss_state
+        self.legacy_state = legacy_state
+        self.note = note
+
+    def report(self):
+        lines = [f"{self.program}: divergence after instruction #{self.index} "
+                 f"(pc=0x{self.pc:08x}, instr=0x{self.instr:08x}){' - ' + self.note if self.note else ''}"]
+        for name, a, b in self.fields:
+            a = f"0x{a:08x}" if isinstance(a, int) else a
+            b = f"0x{b:08x}" if isinstance(b, int) else b
+            lines.append(f"    {name:10} ISS={a}  RISCV_simulator={b}")
+        return "\n".join(lines)
+
+
+def _diff_states(iss_engine, legacy_engine, check_csrs, check_priv):
+    a = iss_engine.state()
+    b = legacy_engine.state()
+    fields = []
+    if a["pc"] != b["pc"]:
+        fields.append(("pc", a["pc"], b["pc"]))
+    for i, (x, y) in enumerate(zip(a["regs"], b["regs"])):
+        if x != y:
+            fields.append((f"x{i}", x, y))
+    if check_priv and a["priv"] != b["priv"]:
+        fields.append(("priv", a["priv"], b["priv"]))
+    if check_csrs:
+        for name, x, y in zip(S_MODE_CSRS, a["csrs"], b["csrs"]):
+            if x != y:
+                fields.append((name, x, y))
+    # Bộ nhớ: so sánh theo word tại mọi địa chỉ mà một trong hai engine đã ghi
+    legacy_mem = legacy_engine.stores()
+    for addr in sorted(iss_engine.stores.union(legacy_mem)):
+        x = iss_engine.read_word(addr)
+        y = legacy_mem.get(addr)
+        y = None if y is None else y & 0xFFFFFFFF
+        if y is None and x == 0:
+            continue
+        if x != y:
+            fields.append((f"mem[0x{addr:08x}]", x if x is not None else "-", y if y is not None else "-"))
+    return fields, a, b
+
+
+def run_program(words, program="<program>", block=1, max_steps=100000,
+                check_csrs=True, check_priv=True):
+    """
+    Chạy chương trình trên cả hai engine, so sánh sau mỗi `block` lệnh.
+
+    Trả về (số lệnh đã chạy, Divergence hoặc None). Khi block > 1 và phát hiện
+    lệch, chương trình được chạy lại từng lệnh để xác định chính xác lệnh đầu tiên gây lệch.
+    """
+    legacy = LegacyEngine(words)
+    iss = IssEngine(words, legacy.sim.stvec.read())
+    steps = 0
+    divergence = None
+    try:
+        while steps < max_steps:
+            iss_done, legacy_done = iss.done(), legacy.done()
+            if iss_done or legacy_done:
+                if iss_done != legacy_done:
+                    fields, a, b = _diff_states(iss, legacy, check_csrs, check_priv)
+                    divergence = Divergence(program, steps, a["pc"], 0, fields or [("pc", a["pc"], b["pc"])],
+                                            a, b, "one engine stopped early")
+                break
+            pc = iss.iss.pc
+            instr = iss.iss.load_word(pc)
+            try:
+                iss.step()
+            except Exception as e:
+                divergence = Divergence(program, steps, pc, instr, [], iss.state(), legacy.state(),
+                                        f"ISS raised {type(e).__name__}: {e}")
+                break
+            try:
+                legacy.step()
+            except Exception as e:
+                divergence = Divergence(program, steps, pc, instr, [], iss.state(), legacy.state(),
+                                        f"RISCV_simulator raised {type(e).__name__}: {e}")
+                break
+            steps += 1
+            if steps % block == 0:
+                fields, a, b = _diff_states(iss, legacy, check_csrs, check_priv)
+                if fields:
+                    divergence = Divergence(program, steps, pc, instr, fields, a, b)
+                    break
+        if divergence is None and steps % block != 0:
+            # Block cuối chưa đủ N lệnh
+            fields, a, b = _diff_states(iss, legacy, check_csrs, check_priv)
+            if fields:
+                divergence = Divergence(program, steps, a["pc"], 0, fields, a, b)
+    finally:
+        legacy.close()
+
+    if divergence is not None and block > 1:
+        # Thu hẹp về lệnh đầu tiên gây lệch
+        exact_steps, exact = run_program(words, program, 1, divergence.index, check_csrs, check_priv)
+        return exact_steps, exact or divergence
+    return steps, divergence
+
+
+def _run_file(args):
+    path, block, max_steps, check_csrs, check_priv = args
+    return (path,) + run_program(load_words(path), path, block, max_steps, check_csrs, check_priv)
+
+
+def run_many(paths, jobs=None, block=1, max_steps=100000, check_csrs=True, check_priv=True):
+    """Chạy nhiều chương trình song song (mỗi worker process có engine cũ riêng)."""
+    tasks = [(path, block, max_steps, check_csrs, check_priv) for path in paths]
+    if jobs == 1 or len(tasks) <= 1:
+        return [_run_file(task) for task in tasks]
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(_run_file, tasks))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Differential test: RISCV_ISS vs RISCV_simulator")
+    parser.add_argument("programs", nargs="+", help="text.bin program images")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--block", type=int, default=1, help="compare state every N instructions")
+    parser.add_argument("--max-steps", type=int, default=100000)
+    parser.add_argument("--no-csrs", action="store_true", help="do not compare S-mode CSRs")
+    parser.add_argument("--no-priv", action="store_true", help="do not compare privilege level")
+    args = parser.parse_args(argv)
+
+    results = run_many(args.programs, args.jobs, args.block, args.max_steps,
+                       not args.no_csrs, not args.no_priv)
+    failures = 0
+    for path, steps, divergence in results:
+        if divergence is None:
+            print(f"{path}: OK ({steps} instructions)")
+        else:
+            failures += 1
+            print(divergence.report())
+    print(f"{len(results) - failures}/{len(results)} program(s) agree")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
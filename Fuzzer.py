@@ -0,0 +1,387 @@
+import argparse
+import contextlib
+import os
+import random
+import sys
+import time
+
+import RISCV_asembler as asm
+from CSR import CSR_ADDRESSES
+from Coverage import BlockRecorder
+from ISS import RISCV_ISS
+
+# Fuzzer sinh chuỗi lệnh RV32I/Zicsr ngẫu nhiên (hợp lệ) cho RISCV_ISS.
+#
+# Chương trình được sinh thẳng thành word 32 bit bằng các encoder của RISCV_asembler.py
+# và nạp vào bộ nhớ bằng load_program_words(), chạy bằng RISCV_ISS.run() (không qua
+# file text.bin). Coverage được tính từ block cache sau mỗi lần chạy; chương trình nào
+# chạm coverage mới được giữ lại trong corpus và làm đầu vào cho mutation.
+#
+# Layout bộ nhớ:
+#   0x0000  prologue (x31 = DATA_BASE, stvec = HANDLER_BASE) + thân chương trình + word 0
+#   0x3000  trap handler: sepc += 4, sret
+#   0x8000  vùng dữ liệu cho load/store (x31 + offset 12 bit)
+# x30 dành cho trap handler, x31 là con trỏ dữ liệu; thân chương trình không ghi vào hai thanh ghi này.
+
+MEM_SIZE = 0x10000
+HANDLER_BASE = 0x3000
+DATA_BASE = 0x8000
+SCRATCH_REG = 30
+DATA_REG = 31
+
+# Bitmap coverage: [lệnh | địa chỉ CSR | trap cause]
+INSN_KEYS = 1 << 11          # opcode | funct3 << 7 | bit30 << 10
+CSR_KEYS = 1 << 12
+TRAP_KEYS = 32
+CSR_OFFSET = INSN_KEYS
+TRAP_OFFSET = INSN_KEYS + CSR_KEYS
+BITMAP_SIZE = TRAP_OFFSET + TRAP_KEYS
+
+# CSR mà chương trình sinh ra được phép ghi (stvec/sepc do handler quản lý)
+WRITABLE_CSRS = tuple(addr for addr, name in CSR_ADDRESSES.items() if name not in ("stvec", "sepc"))
+ALL_CSRS = tuple(CSR_ADDRESSES) + (0x300, 0xC00)  # Thêm vài CSR không tồn tại -> illegal instruction
+
+R_TYPE = ("add", "sub", "sll", "slt", "sltu", "xor", "srl", "sra", "or", "and")
+I_TYPE = ("addi", "slti", "sltiu", "xori", "ori", "andi")
+SHIFT_I = ("slli", "srli", "srai")
+LOADS = ("lb", "lh", "lw", "lbu", "lhu")
+STORES = ("sb", "sh", "sw")
+BRANCHES = ("beq", "bne", "blt", "bge", "bltu", "bgeu")
+CSR_OPS = ("csrrw", "csrrs", "csrrc", "csrrwi", "csrrsi", "csrrci")
+# Tầm nhảy (số lệnh) của immediate: B-type ±4 KiB, J-type ±1 MiB, jalr từ x0 tới 2047
+BRANCH_REACH = 1 << 10
+JAL_REACH = 1 << 18
+JALR_LIMIT = 2047 // 4
+
+SYSTEM = {
+    "ecall": 0x00000073,
+    "ebreak": 0x00100073,
+    "sret": 0x10200073,
+    "wfi": 0x10500073,
+    "sfence.vma": 0x12000073,
+}
+
+
+def _word(bits):
+    return int(bits, 2)
+
+
+def prologue():
+    return [
+        _word(asm.encode_u_type("lui", DATA_REG, DATA_BASE >> 12)),
+        _word(asm.encode_u_type("lui", SCRATCH_REG, HANDLER_BASE >> 12)),
+        _word(asm.encode_i_type("csrrw", 0, SCRATCH_REG, 0x105)),   # stvec = x30
+    ]
+
+
+def trap_handler():
+    return [
+        _word(asm.encode_i_type("csrrs", SCRATCH_REG, 0, 0x141)),           # x30 = sepc
+        _word(asm.encode_i_type("addi", SCRATCH_REG, SCRATCH_REG, 4)),
+        _word(asm.encode_i_type("csrrw", 0, SCRATCH_REG, 0x141)),           # sepc = x30
+        SYSTEM["sret"],
+    ]
+
+
+PROLOGUE = prologue()
+HANDLER = trap_handler()
+
+
+class InstructionGenerator:
+    """Sinh ngẫu nhiên từng lệnh của thân chương trình (index i trong thân dài n lệnh)."""
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.kinds = (
+            (self.gen_rtype, 20), (self.gen_itype, 20), (self.gen_shift, 6),
+            (self.gen_load, 10), (self.gen_store, 10), (self.gen_utype, 5),
+            (self.gen_branch, 10), (self.gen_jal, 3), (self.gen_jalr, 2),
+            (self.gen_csr, 8), (self.gen_system, 3),
+        )
+        self.generators = [g for g, _ in self.kinds]
+        self.weights = [w for _, w in self.kinds]
+
+    def rd(self):
+        rng = self.rng
+        return 0 if rng.random() < 0.05 else rng.randrange(1, SCRATCH_REG)
+
+    def rs(self):
+        return self.rng.randrange(32)
+
+    def imm12(self):
+        rng = self.rng
+        return rng.choice((0, 1, -1, 2047, -2048)) if rng.random() < 0.2 else rng.randrange(-2048, 2048)
+
+    def mem_offset(self, size):
+        rng = self.rng
+        offset = rng.randrange(-2048, 2048 - size)
+        if rng.random() < 0.9:
+            offset &= ~(size - 1)  # Phần lớn truy cập căn chỉnh đúng
+        return offset
+
+    def gen_rtype(self, i, n):
+        return asm.encode_r_type(self.rng.choice(R_TYPE), self.rd(), self.rs(), self.rs())
+
+    def gen_itype(self, i, n):
+        return asm.encode_i_type(self.rng.choice(I_TYPE), self.rd(), self.rs(), self.imm12())
+
+    def gen_shift(self, i, n):
+        return asm.encode_i_type(self.rng.choice(SHIFT_I), self.rd(), self.rs(), self.rng.randrange(32))
+
+    def gen_load(self, i, n):
+        inst = self.rng.choice(LOADS)
+        return asm.encode_i_type(inst, self.rd(), DATA_REG, self.mem_offset(4 if inst == "lw" else 2))
+
+    def gen_store(self, i, n):
+        inst = self.rng.choice(STORES)
+        return asm.encode_s_type(inst, self.rs(), DATA_REG, self.mem_offset(4 if inst == "sw" else 2))
+
+    def gen_utype(self, i, n):
+        return asm.encode_u_type(self.rng.choice(("lui", "auipc")), self.rd(), self.rng.randrange(1 << 20))
+
+    def _target(self, i, n, reach):
+        # Đích nhảy nằm trong thân chương trình (n là word 0 kết thúc) và trong tầm
+        # ±reach lệnh của immediate, nếu không encoder sẽ cắt mất bit cao
+        lo, hi = max(0, i - reach), min(n, i + reach - 1)
+        return (self.rng.randint(lo, hi) - i) * 4
+
+    def gen_branch(self, i, n):
+        return asm.encode_b_type(self.rng.choice(BRANCHES), self.rs(), self.rs(), self._target(i, n, BRANCH_REACH))
+
+    def gen_jal(self, i, n):
+        return asm.encode_j_type("jal", self.rd(), self._target(i, n, JAL_REACH))
+
+    def gen_jalr(self, i, n):
+        # jalr rd, x0, addr: nhảy tuyệt đối tới một lệnh trong thân chương trình;
+        # imm 12 bit chỉ tới được JALR_LIMIT word đầu bộ nhớ
+        k = self.rng.randint(0, min(n, JALR_LIMIT - len(PROLOGUE)))
+        return asm.encode_i_type("jalr", self.rd(), 0, 4 * (len(PROLOGUE) + k))
+
+    def gen_csr(self, i, n):
+        rng = self.rng
+        inst = rng.choice(CSR_OPS)
+        write = inst in ("csrrw", "csrrwi") or rng.random() < 0.5
+        if write:
+            csr = rng.choice(WRITABLE_CSRS)
+            src = rng.randrange(32) if inst.endswith("i") else rng.randrange(1, SCRATCH_REG)
+        else:
+            csr = rng.choice(ALL_CSRS)
+            src = 0  # csrrs/csrrc với rs1 = x0: chỉ đọc
+        return asm.encode_i_type(inst, self.rd(), src, csr)
+
+    def gen_system(self, i, n):
+        return SYSTEM[self.rng.choice(("ecall", "ecall", "ebreak", "wfi", "sfence.vma", "sret"))]
+
+    def generate(self, i, n):
+        gen = self.rng.choices(self.generators, self.weights)[0]
+        bits = gen(i, n)
+        return bits if isinstance(bits, int) else _word(bits)
+
+
+def generate_body(gen, length):
+    return [gen.generate(i, length) for i in range(length)]
+
+
+def mutate_body(gen, body, max_changes=4):
+    """Thay một vài lệnh của thân chương trình bằng lệnh mới (giữ nguyên layout nên đích nhảy vẫn hợp lệ)."""
+    body = list(body)
+    n = len(body)
+    for _ in range(gen.rng.randint(1, max_changes)):
+        i = gen.rng.randrange(n)
+        body[i] = gen.generate(i, n)
+    return body
+
+
+def program_words(body):
+    return PROLOGUE + list(body) + [0]
+
+
+class FuzzTarget(BlockRecorder):
+    """
+    Một RISCV_ISS dùng lại cho mọi chương trình trong worker (chỉ reset, không cấp phát lại).
+
+    FuzzTarget tự gắn vào iss.coverage: run() báo số lệnh đầu mỗi block đã thực sự
+    retire (BlockRecorder.block_executed), nên lệnh đã decode nhưng không chạy tới không
+    tính là coverage; record() chỉ đánh dấu bitmap của fuzzer.
+    """
+
+    def __init__(self, max_steps=10000):
+        self.iss = RISCV_ISS(MEM_SIZE)
+        self.iss.verbose = False
+        self.max_steps = max_steps
+        self.bitmap = bytearray(BITMAP_SIZE)
+        super().__init__()
+
+    def run(self, body):
+        """Chạy một chương trình, trả về (số lệnh đã chạy, bitmap coverage)."""
+        iss = self.iss
+        iss.reset()
+        iss.load_program_words(HANDLER, HANDLER_BASE)
+        iss.load_program_words(program_words(body))
+        iss.privilege_level = 0b01
+        self.bitmap[:] = bytes(BITMAP_SIZE)
+        self.blocks.clear()
+        iss.coverage = self
+        try:
+            executed = iss.run(self.max_steps)
+        finally:
+            iss.coverage = None
+            self.collect()
+        return executed, self.bitmap
+
+    def record(self, instr, priv):
+        bitmap = self.bitmap
+        bitmap[(instr & 0x7F) | ((instr >> 5) & 0x380) | ((instr >> 20) & 0x400)] = 1
+        if instr & 0x7F == 0b1110011 and (instr >> 12) & 0x7:
+            bitmap[CSR_OFFSET + (instr >> 20)] = 1
+
+    def collect(self):
+        bitmap = self.bitmap
+        for cause, count in enumerate(self.iss.trap_counts):
+            if count:
+                bitmap[TRAP_OFFSET + cause] = 1
+
+
+def has_new_coverage(bitmap, total):
+    return any(b and not t for b, t in zip(bitmap, total))
+
+
+def merge_coverage(total, bitmap):
+    for i, b in enumerate(bitmap):
+        if b:
+            total[i] = 1
+
+
+def fuzz_shard(seed, programs, coverage, corpus, length=64, max_steps=10000):
+    """
+    Chạy một lô chương trình trong một worker.
+
+    coverage: bitmap tổng hiện tại của master; corpus: danh sách thân chương trình để mutate.
+    Trả về (input mới kèm bitmap của nó, crash, số chương trình, số lệnh).
+    """
+    rng = random.Random(seed)
+    gen = InstructionGenerator(rng)
+    target = FuzzTarget(max_steps)
+    total = bytearray(coverage)
+    corpus = list(corpus)
+    new_inputs = []
+    crashes = []
+    instructions = 0
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(programs):
+            if corpus and rng.random() < 0.7:
+                body = mutate_body(gen, rng.choice(corpus))
+            else:
+                body = generate_body(gen, rng.randint(1, length))
+            try:
+                executed, bitmap = target.run(body)
+            except Exception as e:  # Lỗi Python trong ISS là bug cần báo lại
+                crashes.append((body, f"{type(e).__name__}: {e}"))
+                instructions += target.iss.instret
+                continue
+            instructions += executed
+            if has_new_coverage(bitmap, total):
+                merge_coverage(total, bitmap)
+                corpus.append(body)
+                new_inputs.append((body, bytes(bitmap)))
+    return new_inputs, crashes, programs, instructions
+
+
+def save_program(path, body):
+    """Lưu chương trình (prologue + thân) theo định dạng text.bin; trap handler được nạp riêng khi replay."""
+    with open(path, "w") as f:
+        for word in program_words(body)[:-1]:
+            f.write(f"{word:032b}\n")
+
+
+def load_body(path):
+    from DiffTest import load_words
+    words = load_words(path)
+    if words[:len(PROLOGUE)] != PROLOGUE:
+        raise ValueError(f"Not a fuzzer program: {path}")
+    return words[len(PROLOGUE):]
+
+
+def load_corpus(directory):
+    corpus = []
+    if os.path.isdir(directory):
+        for name in sorted(os.listdir(directory)):
+            if name.endswith(".bin"):
+                try:
+                    corpus.append(load_body(os.path.join(directory, name)))
+                except ValueError:
+                    pass
+    return corpus
+
+
+def coverage_summary(bitmap):
+    insns = sum(bitmap[:CSR_OFFSET])
+    csrs = sum(bitmap[CSR_OFFSET:TRAP_OFFSET])
+    traps = [cause for cause in range(TRAP_KEYS) if bitmap[TRAP_OFFSET + cause]]
+    return f"{insns} insn keys, {csrs} CSRs, trap causes {traps}"
+
+
+def fuzz(out_dir, rounds=10, programs=2000, workers=None, seed=None, length=64, max_steps=10000):
+    """Vòng lặp chính: mỗi round chia programs chương trình cho các worker rồi gộp coverage/corpus."""
+    from concurrent.futures import ProcessPoolExecutor
+    workers = workers or os.cpu_count() or 1
+    seed = random.randrange(1 << 32) if seed is None else seed
+    corpus_dir = os.path.join(out_dir, "corpus")
+    crash_dir = os.path.join(out_dir, "crashes")
+    os.makedirs(corpus_dir, exist_ok=True)
+    os.makedirs(crash_dir, exist_ok=True)
+
+    corpus = load_corpus(corpus_dir)
+    coverage = bytearray(BITMAP_SIZE)
+    total_programs = total_instructions = total_crashes = 0
+    per_worker = max(1, programs // workers)
+    start = time.perf_counter()
+    print(f"Fuzzing with {workers} worker(s), seed {seed}, {len(corpus)} corpus input(s)")
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for rnd in range(rounds):
+            futures = [pool.submit(fuzz_shard, seed + rnd * workers + w, per_worker,
+                                   bytes(coverage), corpus[-256:], length, max_steps)
+                       for w in range(workers)]
+            for future in futures:
+                new_inputs, crashes, n_programs, n_instructions = future.result()
+                total_programs += n_programs
+                total_instructions += n_instructions
+                for body, bitmap in new_inputs:
+                    # Worker khác trong cùng round có thể đã chạm cùng coverage
+                    if not has_new_coverage(bitmap, coverage):
+                        continue
+                    merge_coverage(coverage, bitmap)
+                    corpus.append(body)
+                    save_program(os.path.join(corpus_dir, f"id-{len(corpus):06d}.bin"), body)
+                for body, reason in crashes:
+                    total_crashes += 1
+                    path = os.path.join(crash_dir, f"crash-{total_crashes:06d}.bin")
+                    save_program(path, body)
+                    with open(path + ".txt", "w") as f:
+                        f.write(reason + "\n")
+            elapsed = time.perf_counter() - start
+            print(f"round {rnd + 1}/{rounds}: {total_programs} programs ({total_programs / elapsed:.0f}/s), "
+                  f"{total_instructions / elapsed:.0f} instr/s, corpus {len(corpus)}, "
+                  f"crashes {total_crashes}, {coverage_summary(coverage)}")
+    return coverage, total_crashes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Coverage-guided random instruction fuzzer for RISCV_ISS")
+    parser.add_argument("out", help="output directory (corpus/ and crashes/)")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--programs", type=int, default=2000, help="programs per round (all workers)")
+    parser.add_argument("--length", type=int, default=64, help="maximum body length in instructions")
+    parser.add_argument("--max-steps", type=int, default=10000, help="instruction budget per program")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    _, crashes = fuzz(args.out, args.rounds, args.programs, args.workers, args.seed,
+                      args.length, args.max_steps)
+    return 1 if crashes else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
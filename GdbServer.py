@@ -0,0 +1,425 @@
+import select
+import socket
+import struct
+import sys
+
+from Breakpoints import ABI_NAMES
+from CSR import CSR_ADDRESSES
+from Triggers import Watch, MCONTROL_LOAD, MCONTROL_STORE, TYPE_MCONTROL
+
+# GDB Remote Serial Protocol server cho DebugModule (một hart, TCP localhost).
+#
+#   python GdbServer.py text.bin --port 3333
+#   riscv64-unknown-elf-gdb -ex "set architecture riscv:rv32" -ex "target remote :3333"
+#
+# Hỗ trợ: g/G (33 thanh ghi một lần), p/P (cả CSR, regnum = 65 + địa chỉ CSR), m/M/X
+# (đọc từ memoryview, ghi nhị phân), c/s/vCont, Z0-Z4/z0-z4 (breakpoint và watchpoint qua
+# Triggers.py), bc/bs (reverse khi DebugModule đang record), qXfer:features:read
+# (target.xml), QStartNoAckMode. Mọi packet đầy đủ trong một lần recv được xử lý liền
+# và các reply được gửi chung một lần sendall. Khi đang chạy, hart chạy từng đoạn
+# RUN_CHUNK lệnh và kiểm tra Ctrl-C (0x03) giữa các đoạn.
+
+PACKET_SIZE = 0x4000     # Kích thước packet tối đa báo cho GDB (load image nhanh hơn)
+RUN_CHUNK = 65536        # Số lệnh mỗi đoạn khi continue, giữa các đoạn kiểm tra Ctrl-C
+RECV_SIZE = 65536
+
+REG_PC = 32
+REG_CSR_BASE = 65        # Quy ước GDB: regnum CSR = 65 + địa chỉ CSR
+
+SIGINT = 2
+SIGTRAP = 5
+
+REG_NAMES = ["zero", "ra", "sp", "gp", "tp", "t0", "t1", "t2", "fp", "s1"] + \
+    [name for name, index in sorted(ABI_NAMES.items(), key=lambda item: item[1]) if index >= 10]
+
+
+def target_xml():
+    regs = [f'    <reg name="{name}" bitsize="32" type="int" regnum="{i}"/>' for i, name in enumerate(REG_NAMES)]
+    regs[2] = regs[2].replace('type="int"', 'type="data_ptr"')
+    regs.append(f'    <reg name="pc" bitsize="32" type="code_ptr" regnum="{REG_PC}"/>')
+    csrs = [f'    <reg name="{name}" bitsize="32" type="int" regnum="{REG_CSR_BASE + addr}"/>'
+            for addr, name in sorted(CSR_ADDRESSES.items())]
+    return "\n".join([
+        '<?xml version="1.0"?>',
+        '<!DOCTYPE target SYSTEM "gdb-target.dtd">',
+        '<target version="1.0">',
+        '  <architecture>riscv:rv32</architecture>',
+        '  <feature name="org.gnu.gdb.riscv.cpu">',
+        *regs,
+        '  </feature>',
+        '  <feature name="org.gnu.gdb.riscv.csr">',
+        *csrs,
+        '  </feature>',
+        '</target>',
+    ])
+
+
+def checksum(data):
+    return sum(data) & 0xFF
+
+
+def unescape(data):
+    """Bỏ escape '}' (byte kế tiếp XOR 0x20) trong dữ liệu nhị phân của packet X."""
+    if b"}" not in data:
+        return data
+    parts = data.split(b"}")
+    out = bytearray(parts[0])
+    for part in parts[1:]:
+        out.append(part[0] ^ 0x20)
+        out += part[1:]
+    return bytes(out)
+
+
+class GdbServer:
+    """
+    Phục vụ một client GDB cho DebugModule dm.
+
+    Args:
+        dm: DebugModule của hart (hart được halt khi client kết nối).
+        host / port: Địa chỉ lắng nghe (mặc định chỉ localhost).
+    """
+
+    def __init__(self, dm, host="127.0.0.1", port=3333):
+        self.dm = dm
+        self.iss = dm.iss
+        self.host = host
+        self.port = port
+        self.sock = None
+        self.ack = True
+        self.buffer = b""
+        self.out = []           # Reply chờ gửi (gửi chung một lần)
+        self.break_kinds = {}   # addr -> loại Z đã đặt ("0": swbreak, "1": hwbreak)
+        self.xml = target_xml().encode()
+        self.handlers = {
+            "?": self.cmd_stop_reason,
+            "g": self.cmd_read_registers,
+            "G": self.cmd_write_registers,
+            "p": self.cmd_read_register,
+            "P": self.cmd_write_register,
+            "m": self.cmd_read_memory,
+            "M": self.cmd_write_memory,
+            "c": self.cmd_continue,
+            "s": self.cmd_step,
+            "Z": self.cmd_insert_point,
+            "z": self.cmd_remove_point,
+            "H": lambda args: "OK",
+            "T": lambda args: "OK",
+            "D": self.cmd_detach,
+            "k": self.cmd_kill,
+        }
+
+    # Kết nối và đóng gói packet
+
+    def serve(self):
+        """Chờ một client, phục vụ tới khi client detach/kill hoặc ngắt kết nối."""
+        with socket.create_server((self.host, self.port)) as server:
+            print(f"[GDB] Listening on {self.host}:{self.port}")
+            conn, addr = server.accept()
+        print(f"[GDB] Client connected from {addr[0]}:{addr[1]}")
+        with conn:
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.serve_connection(conn)
+
+    def serve_connection(self, conn):
+        self.sock = conn
+        self.ack = True
+        self.buffer = b""
+        self.dm.halt_hart()
+        try:
+            while self.sock is not None:
+                data = conn.recv(RECV_SIZE)
+                if not data:
+                    break
+                self.buffer += data
+                self.process_buffer()
+                self.flush()
+        finally:
+            self.sock = None
+
+    def flush(self):
+        if self.out and self.sock is not None:
+            self.sock.sendall(b"".join(self.out))
+        self.out.clear()
+
+    def send_packet(self, payload):
+        if isinstance(payload, str):
+            payload = payload.encode()
+        self.out.append(b"$" + payload + b"#%02x" % checksum(payload))
+
+    def process_buffer(self):
+        """Xử lý mọi packet đầy đủ trong buffer, phần còn thiếu giữ lại cho lần recv sau."""
+        pos = 0
+        while pos < len(self.buffer) and self.sock is not None:
+            buf = self.buffer  # continue có thể nối thêm dữ liệu nhận trong lúc chạy
+            ch = buf[pos]
+            if ch != 0x24:  # '$'; '+', '-' (ack) và Ctrl-C ngoài lúc chạy bị bỏ qua
+                pos += 1
+                continue
+            end = buf.find(b"#", pos)
+            if end < 0 or end + 3 > len(buf):
+                break
+            payload = buf[pos + 1:end]
+            pos = end + 3
+            if self.ack:
+                if int(buf[end + 1:end + 3], 16) != checksum(payload):
+                    self.out.append(b"-")
+                    continue
+                self.out.append(b"+")
+            reply = self.dispatch(payload)
+            if reply is not None:
+                self.send_packet(reply)
+        self.buffer = self.buffer[pos:]
+
+    def dispatch(self, payload):
+        if payload[:1] == b"X":
+            return self.cmd_write_binary(payload[1:])  # Dữ liệu nhị phân, không decode
+        packet = payload.decode("latin-1")
+        try:
+            if packet.startswith(("q", "Q", "v", "b")):
+                return self.cmd_query(packet)
+            handler = self.handlers.get(packet[:1])
+            if handler is None:
+                return ""
+            return handler(packet[1:])
+        except (ValueError, IndexError):
+            return "E01"
+
+    # Thanh ghi
+
+    def _regs(self):
+        return [value & 0xFFFFFFFF for value in self.iss.regs] + [self.iss.pc & 0xFFFFFFFF]
+
+    def _set_pc(self, value):
+        self.iss.pc = value
+        self.dm.dcsrs["dpc"].save_pc(value)  # resume_hart() tiếp tục từ dpc
+
+    def _state_changed(self):
+        if self.dm.recorder is not None:
+            self.dm.recorder.truncate()
+
+    def cmd_read_registers(self, args):
+        return struct.pack("<33I", *self._regs()).hex()
+
+    def cmd_write_registers(self, args):
+        values = struct.unpack("<33I", bytes.fromhex(args[:33 * 8]))
+        self.iss.regs[1:32] = values[1:32]
+        self._set_pc(values[REG_PC])
+        self._state_changed()
+        return "OK"
+
+    def cmd_read_register(self, args):
+        regnum = int(args, 16)
+        if regnum <= REG_PC:
+            value = self._regs()[regnum]
+        else:
+            csr = self.iss.csrs.get(CSR_ADDRESSES.get(regnum - REG_CSR_BASE))
+            if csr is None:
+                return "E01"
+            value = int(csr.read(), 2)
+        return struct.pack("<I", value).hex()
+
+    def cmd_write_register(self, args):
+        regnum, value = args.split("=")
+        regnum = int(regnum, 16)
+        value = struct.unpack("<I", bytes.fromhex(value))[0]
+        if regnum == REG_PC:
+            self._set_pc(value)
+        elif 0 < regnum < REG_PC:
+            self.dm.write_gpr(regnum, value)
+        elif regnum > REG_PC:
+            csr = self.iss.csrs.get(CSR_ADDRESSES.get(regnum - REG_CSR_BASE))
+            if csr is None:
+                return "E01"
+            csr.write(f"{value:032b}")
+        self._state_changed()
+        return "OK"
+
+    # Bộ nhớ
+
+    def _range(self, args):
+        addr, length = (int(x, 16) for x in args.split(","))
+        if addr + length > len(self.iss.memory):
+            raise ValueError("address out of range")
+        return addr, length
+
+    def cmd_read_memory(self, args):
+        addr, length = self._range(args)
+        return memoryview(self.iss.memory)[addr:addr + length].hex()
+
+    def _write(self, addr, data):
+        self.iss.memory[addr:addr + len(data)] = data
+        self.iss.invalidate_blocks()  # Có thể vừa ghi đè code đã decode
+        self._state_changed()
+        return "OK"
+
+    def cmd_write_memory(self, args):
+        location, data = args.split(":")
+        addr, length = self._range(location)
+        return self._write(addr, bytes.fromhex(data)[:length])
+
+    def cmd_write_binary(self, payload):
+        location, _, data = payload.partition(b":")
+        try:
+            addr, length = self._range(location.decode())
+        except ValueError:
+            return "E01"
+        data = unescape(data)
+        if len(data) != length:
+            return "E01"
+        return self._write(addr, data) if length else "OK"
+
+    # Chạy
+
+    def cmd_stop_reason(self, args):
+        return f"S{SIGTRAP:02x}"
+
+    def stop_reply(self):
+        iss = self.iss
+        if iss.halted:
+            return "W00"
+        if iss.breakpoint_hit is not None:
+            kinds = self.break_kinds.get(iss.breakpoint_hit.pc, ())
+            return f"T{SIGTRAP:02x}{'swbreak' if '0' in kinds else 'hwbreak'}:;"
+        trigger = iss.trigger_hit
+        if isinstance(trigger, Watch):
+            kind = "awatch" if trigger.load and trigger.store else "rwatch" if trigger.load else "watch"
+            return f"T{SIGTRAP:02x}{kind}:{trigger.lo:x};"
+        return f"T{SIGTRAP:02x}"
+
+    def cmd_step(self, args):
+        if args:
+            self._set_pc(int(args, 16))
+        self.dm.resume_hart()
+        self.dm.run(1)
+        self.dm.halt_hart()
+        return self.stop_reply()
+
+    def cmd_continue(self, args):
+        if args:
+            self._set_pc(int(args, 16))
+        self.dm.resume_hart()
+        iss = self.iss
+        interrupted = False
+        while True:
+            self.dm.run(RUN_CHUNK)
+            if iss.halted or iss.breakpoint_hit is not None or iss.trigger_hit is not None:
+                break
+            if iss.haltreq_hit or self.poll_interrupt():
+                interrupted = True
+                break
+        self.dm.halt_hart()
+        return f"T{SIGINT:02x}" if interrupted else self.stop_reply()
+
+    def poll_interrupt(self):
+        """Đọc dữ liệu client gửi trong lúc chạy; True nếu có Ctrl-C (0x03)."""
+        readable, _, _ = select.select([self.sock], [], [], 0)
+        if not readable:
+            return False
+        data = self.sock.recv(RECV_SIZE)
+        if not data:
+            self.sock = None
+            return True
+        if b"\x03" in data:
+            data = data.replace(b"\x03", b"")
+            self.buffer += data
+            return True
+        self.buffer += data
+        return False
+
+    def cmd_insert_point(self, args, insert=True):
+        kind, addr, length = args.split(",")[:3]
+        addr = int(addr, 16)
+        length = int(length, 16)
+        if kind in ("0", "1"):
+            # Z0 và Z1 cùng địa chỉ dùng chung một breakpoint của DebugModule
+            kinds = self.break_kinds.setdefault(addr, set())
+            if insert:
+                if not kinds:
+                    self.dm.set_breakpoint(addr)
+                kinds.add(kind)
+            else:
+                kinds.discard(kind)
+                if not kinds:
+                    del self.break_kinds[addr]
+                    self.dm.remove_breakpoint(addr)
+            return "OK"
+        if kind in ("2", "3", "4"):
+            triggers = self.dm.triggers
+            if insert:
+                triggers.watch(addr, addr + max(length, 1), load=kind != "2", store=kind != "3")
+                return "OK"
+            # Chỉ gỡ trigger cùng địa chỉ và cùng loại (z2 write, z3 read, z4 access)
+            flags = (MCONTROL_LOAD if kind != "2" else 0) | (MCONTROL_STORE if kind != "3" else 0)
+            for trigger in triggers.triggers:
+                if trigger.type == TYPE_MCONTROL and trigger.address_range()[0] == addr and \
+                        int(trigger.tdata1.read(), 2) & (MCONTROL_LOAD | MCONTROL_STORE) == flags:
+                    triggers.clear(trigger.index)
+                    return "OK"
+            return "E01"
+        return ""
+
+    def cmd_remove_point(self, args):
+        return self.cmd_insert_point(args, insert=False)
+
+    def cmd_detach(self, args):
+        self.send_packet("OK")
+        self.flush()
+        self.dm.resume_hart()
+        self.sock = None
+        return None
+
+    def cmd_kill(self, args):
+        self.sock = None
+        return None
+
+    # Query và packet v*/b*
+
+    def cmd_query(self, packet):
+        if packet.startswith("qSupported"):
+            features = [f"PacketSize={PACKET_SIZE:x}", "QStartNoAckMode+", "qXfer:features:read+",
+                        "vContSupported+", "swbreak+", "hwbreak+"]
+            if self.dm.recorder is not None:
+                features += ["ReverseStep+", "ReverseContinue+"]
+            return ";".join(features)
+        if packet == "QStartNoAckMode":
+            self.send_packet("OK")
+            self.ack = False
+            return None
+        if packet.startswith("qXfer:features:read:target.xml:"):
+            offset, length = (int(x, 16) for x in packet.rsplit(":", 1)[1].split(","))
+            chunk = self.xml[offset:offset + length]
+            return ("l" if offset + length >= len(self.xml) else "m") + chunk.decode()
+        if packet == "qAttached":
+            return "1"
+        if packet == "qC":
+            return "QC1"
+        if packet == "qfThreadInfo":
+            return "m1"
+        if packet == "qsThreadInfo":
+            return "l"
+        if packet == "vCont?":
+            return "vCont;c;C;s;S"
+        if packet.startswith("vCont;"):
+            action = packet[6:].split(";")[0]
+            return self.cmd_step("") if action[:1] in ("s", "S") else self.cmd_continue("")
+        if packet in ("bs", "bc"):
+            recorder = self.dm.recorder
+            if recorder is None:
+                return "E01"
+            if packet == "bs":
+                recorder.reverse_step()
+            elif recorder.reverse_continue() is None:
+                self._set_pc(self.iss.pc)
+                return f"T{SIGTRAP:02x}replaylog:begin;"
+            self._set_pc(self.iss.pc)
+            return self.stop_reply()
+        return ""
+
+
+def main(argv=None):
+    from CLI import gdbserver_main  # Tham số dòng lệnh dùng chung với "CLI.py gdbserver"
+    return gdbserver_main(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,294 @@
+from ISS import RISCV_ISS, XRET_CAUSE, OPCODE_LOAD, OPCODE_STORE, LOAD_SIZES, STORE_SIZES
+
+# Hook API cho công cụ (profiler, coverage, trace, co-simulation) gắn vào RISCV_ISS.
+#
+# Sự kiện:
+#   pre_instruction / post_instruction : InstructionEvent (trước / sau mỗi lệnh)
+#   mem_read / mem_write               : MemoryEvent (load / store thành công)
+#   csr_write                          : CsrWriteEvent (csrrw/csrrs/csrrc và dạng imm có ghi CSR)
+#   trap                               : TrapEvent (exception và ngắt)
+#   priv_change                        : PrivilegeEvent (trap hoặc sret làm đổi privilege)
+#
+# Không có hook nào thì ISS chạy đúng code gốc: registry chỉ thay handler trong bảng
+# dispatch (block cache được decode lại) và override method trên instance cho những
+# sự kiện có hook, mỗi khi add()/remove() được gọi hoặc iss.tracer/iss.coverage đổi
+# (tracer và coverage.record được gọi từ step() đã bọc, sau lệnh, trước post_instruction). Callback nhận (iss, event); event là
+# object cấp phát sẵn, được ghi đè ở lần gọi sau nên callback phải copy nếu muốn giữ lại.
+
+OPCODE_SYSTEM = 0b1110011
+
+EVENTS = ("pre_instruction", "post_instruction", "mem_read", "mem_write",
+          "csr_write", "trap", "priv_change")
+
+
+class InstructionEvent:
+    __slots__ = ("pc", "instr", "priv", "next_pc")
+
+    def __init__(self):
+        self.pc = self.instr = self.priv = self.next_pc = 0
+
+    def __repr__(self):
+        return f"InstructionEvent(pc=0x{self.pc:08x}, instr=0x{self.instr:08x}, priv={self.priv})"
+
+
+class MemoryEvent:
+    __slots__ = ("pc", "addr", "size", "value")
+
+    def __init__(self):
+        self.pc = self.addr = self.size = self.value = 0
+
+    def __repr__(self):
+        return f"MemoryEvent(pc=0x{self.pc:08x}, addr=0x{self.addr:08x}, size={self.size}, value=0x{self.value:x})"
+
+
+class CsrWriteEvent:
+    __slots__ = ("pc", "csr", "name", "old", "new")
+
+    def __init__(self):
+        self.pc = self.csr = self.old = self.new = 0
+        self.name = ""
+
+    def __repr__(self):
+        return f"CsrWriteEvent(pc=0x{self.pc:08x}, {self.name}: 0x{self.old:08x} -> 0x{self.new:08x})"
+
+
+class TrapEvent:
+    __slots__ = ("cause", "interrupt", "epc", "tval", "from_priv", "to_priv")
+
+    def __init__(self):
+        self.cause = self.epc = self.from_priv = self.to_priv = 0
+        self.interrupt = False
+        self.tval = None
+
+    def __repr__(self):
+        kind = "interrupt" if self.interrupt else "exception"
+        return f"TrapEvent({kind} {self.cause}, epc=0x{self.epc:08x}, priv {self.from_priv}->{self.to_priv})"
+
+
+class PrivilegeEvent:
+    __slots__ = ("pc", "from_priv", "to_priv", "cause")
+
+    def __init__(self):
+        self.pc = self.from_priv = self.to_priv = self.cause = 0
+
+    def __repr__(self):
+        return f"PrivilegeEvent(pc=0x{self.pc:08x}, {self.from_priv}->{self.to_priv}, cause={self.cause})"
+
+
+def _fanout(callbacks):
+    """Gộp danh sách callback thành một hàm (gọi thẳng nếu chỉ có một)."""
+    if len(callbacks) == 1:
+        return callbacks[0]
+    callbacks = tuple(callbacks)
+
+    def call_all(iss, event):
+        for callback in callbacks:
+            callback(iss, event)
+    return call_all
+
+
+class HookRegistry:
+    """Danh sách hook của một RISCV_ISS; thường được tạo qua RISCV_ISS.add_hook()."""
+
+    def __init__(self, iss: RISCV_ISS):
+        self.iss = iss
+        self.callbacks = {event: [] for event in EVENTS}
+        self.per_instruction = False  # run() phải đi đường step() từng lệnh (hook pre/post, tracer)
+        self.instruction_event = InstructionEvent()
+        self.post_event = InstructionEvent()
+        self.mem_read_event = MemoryEvent()
+        self.mem_write_event = MemoryEvent()
+        self.csr_event = CsrWriteEvent()
+        self.trap_event = TrapEvent()
+        self.priv_event = PrivilegeEvent()
+
+    def add(self, event, callback):
+        if event not in self.callbacks:
+            raise ValueError(f"Unknown hook event: {event} (expected one of {', '.join(EVENTS)})")
+        self.callbacks[event].append(callback)
+        self.specialize()
+        return callback
+
+    def remove(self, event, callback):
+        self.callbacks[event].remove(callback)
+        self.specialize()
+
+    def clear(self):
+        for callbacks in self.callbacks.values():
+            callbacks.clear()
+        self.specialize()
+
+    def active(self):
+        return any(self.callbacks.values())
+
+    def specialize(self):
+        """Cài lại wrapper chỉ cho những sự kiện đang có hook, phần còn lại dùng code gốc."""
+        iss = self.iss
+        for name in ("step", "enter_trap", "handle_sret"):
+            iss.__dict__.pop(name, None)
+        iss.dispatch[OPCODE_LOAD] = iss.execute_load
+        iss.dispatch[OPCODE_STORE] = iss.execute_store
+        iss.dispatch[OPCODE_SYSTEM] = iss.execute_system
+
+        cb = self.callbacks
+        tracer, coverage = iss.tracer, iss.coverage
+        if cb["pre_instruction"] or cb["post_instruction"] or tracer is not None or coverage is not None:
+            iss.step = self._make_step(cb["pre_instruction"], cb["post_instruction"], tracer, coverage)
+        if cb["mem_read"]:
+            iss.dispatch[OPCODE_LOAD] = self._make_load(_fanout(cb["mem_read"]))
+        if cb["mem_write"]:
+            iss.dispatch[OPCODE_STORE] = self._make_store(_fanout(cb["mem_write"]))
+        if cb["csr_write"]:
+            iss.dispatch[OPCODE_SYSTEM] = self._make_system(_fanout(cb["csr_write"]))
+        if cb["trap"] or cb["priv_change"]:
+            iss.enter_trap = self._make_enter_trap(cb["trap"], cb["priv_change"])
+        if cb["priv_change"]:
+            iss.handle_sret = self._make_sret(_fanout(cb["priv_change"]))
+        self.per_instruction = bool(cb["pre_instruction"] or cb["post_instruction"] or tracer is not None)
+        iss.invalidate_blocks()  # Block cache đang giữ handler cũ
+
+    def _make_step(self, pre, post, tracer=None, coverage=None):
+        iss = self.iss
+        step = RISCV_ISS.step
+        pre = _fanout(pre) if pre else None
+        post = _fanout(post) if post else None
+        trace = tracer.record if tracer is not None else None
+        cover = coverage.record if coverage is not None else None
+        pre_event = self.instruction_event
+        post_event = self.post_event
+
+        def hooked_step():
+            pc = iss.pc
+            priv = iss.privilege_level
+            instr = iss.load_word(pc)
+            if pre is not None:
+                pre_event.pc = pc
+                pre_event.instr = instr
+                pre_event.priv = priv
+                pre_event.next_pc = pc + 4
+                pre(iss, pre_event)
+            step(iss)
+            if cover is not None:
+                cover(instr, priv)
+            if trace is not None:
+                trace(iss, pc, instr, priv)
+            if post is not None:
+                post_event.pc = pc
+                post_event.instr = instr
+                post_event.priv = priv
+                post_event.next_pc = iss.pc
+                post(iss, post_event)
+        return hooked_step
+
+    # Load/store/CSR bị trap (iss.trapped) thì không báo sự kiện truy cập. Cờ được xoá trước
+    # mỗi lệnh vì run() theo block không đi qua step()
+    def _make_load(self, callback):
+        iss = self.iss
+        execute_load = iss.execute_load
+        event = self.mem_read_event
+
+        def hooked_load(instr):
+            pc = iss.pc
+            iss.trapped = False
+            execute_load(instr)
+            if not iss.trapped:
+                event.pc = pc - 4
+                event.addr = iss.mem_addr
+                event.size = LOAD_SIZES.get((instr >> 12) & 0x7, 4)
+                event.value = iss.mem_data & 0xFFFFFFFF
+                callback(iss, event)
+        return hooked_load
+
+    def _make_store(self, callback):
+        iss = self.iss
+        execute_store = iss.execute_store
+        event = self.mem_write_event
+
+        def hooked_store(instr):
+            pc = iss.pc
+            iss.trapped = False
+            execute_store(instr)
+            if not iss.trapped:
+                size = STORE_SIZES.get((instr >> 12) & 0x7, 4)
+                event.pc = pc - 4
+                event.addr = iss.mem_addr
+                event.size = size
+                event.value = iss.mem_data & ((1 << (8 * size)) - 1)
+                callback(iss, event)
+        return hooked_store
+
+    def _make_system(self, callback):
+        iss = self.iss
+        execute_system = iss.execute_system
+        csr_names = iss.csrs
+        event = self.csr_event
+        from CSR import CSR_ADDRESSES
+
+        def hooked_system(instr):
+            funct3 = (instr >> 12) & 0x7
+            rs1 = (instr >> 15) & 0x1F
+            # csrrs/csrrc (và dạng imm) với rs1 = 0 không ghi CSR
+            if funct3 == 0 or ((funct3 & 0b011) != 0b01 and rs1 == 0):
+                execute_system(instr)
+                return
+            csr = instr >> 20
+            name = CSR_ADDRESSES.get(csr)
+            reg = csr_names.get(name)
+            if reg is None:
+                execute_system(instr)  # Illegal instruction
+                return
+            pc = iss.pc
+            old = reg.read()
+            iss.trapped = False
+            execute_system(instr)
+            if not iss.trapped:
+                event.pc = pc - 4
+                event.csr = csr
+                event.name = name
+                event.old = int(old, 2)
+                event.new = int(reg.read(), 2)
+                callback(iss, event)
+        return hooked_system
+
+    def _make_enter_trap(self, trap, priv_change):
+        iss = self.iss
+        enter_trap = RISCV_ISS.enter_trap
+        trap = _fanout(trap) if trap else None
+        priv_change = _fanout(priv_change) if priv_change else None
+        trap_event = self.trap_event
+        priv_event = self.priv_event
+
+        def hooked_enter_trap(cause_code, faulting_address=None, epc=None, interrupt=False):
+            from_priv = iss.privilege_level
+            enter_trap(iss, cause_code, faulting_address, epc, interrupt)
+            if trap is not None:
+                trap_event.cause = cause_code
+                trap_event.interrupt = iss.csrs["scause"].value[0] == "1"
+                trap_event.epc = iss.csrs["sepc"].restore_pc()
+                trap_event.tval = faulting_address
+                trap_event.from_priv = from_priv
+                trap_event.to_priv = iss.privilege_level
+                trap(iss, trap_event)
+            if priv_change is not None and iss.privilege_level != from_priv:
+                priv_event.pc = iss.pc
+                priv_event.from_priv = from_priv
+                priv_event.to_priv = iss.privilege_level
+                priv_event.cause = cause_code
+                priv_change(iss, priv_event)
+        return hooked_enter_trap
+
+    def _make_sret(self, priv_change):
+        iss = self.iss
+        handle_sret = RISCV_ISS.handle_sret
+        event = self.priv_event
+
+        def hooked_sret():
+            from_priv = iss.privilege_level
+            handle_sret(iss)
+            if iss.privilege_level != from_priv:
+                event.pc = iss.pc
+                event.from_priv = from_priv
+                event.to_priv = iss.privilege_level
+                event.cause = XRET_CAUSE
+                priv_change(iss, event)
+        return hooked_sret
@@ -1,11 +1,16 @@
 from ISS import RISCV_ISS
-from DebugModule import DebugModule
+from DebugModule import DebugModule, sigint_requests_halt
 input_loaded = False
-RISCV = RISCV_ISS()
-DM = DebugModule(RISCV)
+# ISS và DebugModule được tạo khi chạy main(), import module không tạo gì cả
+RISCV = None
+DM = None
 def main():
     global input_loaded
+    global RISCV
     global DM
+    if RISCV is None:
+        RISCV = RISCV_ISS()
+        DM = DebugModule(RISCV)
     while(1):
         print("===Multi-mode RISCV Processor with Supervisor and Debug Support Simulator===")
         print("Please enter your instruction: ")
@@ -43,6 +48,17 @@ def main():
                 RISCV.privilege_level = 0b00
                 print("Running as Debug mode...")
                 DM.enter_debug_mode
+        elif Host_Command.startswith("script "):
+            if input_loaded == False:
+                print("Please load your input first!")
+            else:
+                # Chạy file lệnh debug không tương tác (DebugScript.py), in kết quả từng lệnh
+                from DebugScript import DebugScript, format_result
+                try:
+                    for result in DebugScript(DM).run_file(Host_Command[7:].strip()):
+                        print(format_result(result))
+                except OSError as e:
+                    print(e)
         elif Host_Command == "help":
             print("=====Available Instructions=====")
             print(" input    - Load input (binary file)")
@@ -50,6 +66,7 @@ def main():
             print(" Umode    - Run as User mode")
             print(" Smode    - Run as Supervisor mode")
             print(" Dmode    - Run as Debug mode")
+            print(" script F - Run debug commands from file F")
             print(" exit     - Exit simulation")
         elif Host_Command == "exit":
             print("Exit Simulation!")
@@ -67,9 +84,15 @@ def execute():
         if Execute_Command == "r":
             RISCV.step()
         elif Execute_Command == "run all":
-            while (RISCV.load_word(int(RISCV.pc))!=0):
-                RISCV.step()
-            print("Simulation Completed!")
+            # Chạy hết tốc độ bằng run(); Ctrl-C dừng giữa hai lệnh và vào debug mode
+            with sigint_requests_halt(RISCV):
+                RISCV.run()
+            if RISCV.haltreq_hit:
+                DM.enter_debug_mode("Reset-haltreq")
+            elif RISCV.breakpoint_hit is not None or RISCV.trigger_hit is not None:
+                DM.enter_debug_mode("Trigger")
+            else:
+                print("Simulation Completed!")
         elif Execute_Command == "reset":
             RISCV = RISCV_ISS()
             DM = DebugModule(RISCV)
@@ -81,7 +104,7 @@ def execute():
         elif Execute_Command == "help":
             print("=====Available Instructions=====")
             print(" r           - run 1 instruction")
-            print(" run all     - run to the end")
+            print(" run all     - run to the end (Ctrl-C to halt)")
             print(" reset       - reset all instructions")
             print(" debug mode  - enter debug mode")
             print(" help        - display available instruction")
@@ -1,4 +1,29 @@
-from CSR import CSR32, SStatus, STVec, SIE, SIP, SCOUNTEREN, SSCRATCH, SEPC, SCause, STval, SENVCFG, SATP
+import struct
+
+from CSR import CSR32, SStatus, STVec, SIE, SIP, SCOUNTEREN, SSCRATCH, SEPC, SCause, STval, SENVCFG, SATP, CSR_ADDRESSES
+
+MAX_BLOCK_LEN = 64       # Số lệnh tối đa trong một basic block đã decode
+CODE_PAGE_SHIFT = 10     # Trang 1 KiB dùng để phát hiện ghi đè lên code đã decode
+WATCH_PAGE_SHIFT = 10    # Trang 1 KiB có watchpoint: chỉ load/store vào đây mới bị kiểm tra
+# Các opcode kết thúc basic block: branch, jal, jalr, system
+BLOCK_END_OPCODES = frozenset((0b1100011, 0b1101111, 0b1100111, 0b1110011))
+XRET_CAUSE = 32          # "Cause" dùng cho chuyển privilege bằng sret
+PRIV_TRANSITION_SLOTS = 4 * 4 * 33
+OPCODE_LOAD = 0b0000011
+OPCODE_STORE = 0b0100011
+# funct3 -> số byte truy cập
+LOAD_SIZES = {0b000: 1, 0b001: 2, 0b010: 4, 0b100: 1, 0b101: 2}
+STORE_SIZES = {0b000: 1, 0b001: 2, 0b010: 4, 0b011: 8}
+
+
+def transition_index(from_priv, to_priv, cause):
+    return ((from_priv << 2) | to_priv) * 33 + cause
+
+
+class DebugHalt(Exception):
+    """Trigger (action = enter debug mode) dừng hart trước lệnh tại iss.pc; run() bắt exception này."""
+
+
 class RISCV_ISS:
     def __init__(self, mem_size=4096):
         self.regs = [0] * 32
@@ -18,7 +43,116 @@ class RISCV_ISS:
             "senvcfg": SENVCFG(),
             "satp": SATP(),
         }
+        self.instret = 0        # Số lệnh đã retire
+        self.verbose = True     # In "Executed: ..." cho từng lệnh
+        self.hooks = None       # HookRegistry (Hooks.py), tạo khi add_hook() hoặc gắn tracer/coverage
+        self._tracer = None
+        self._coverage = None
+        self.mem_addr = 0       # Địa chỉ/dữ liệu của lần truy cập bộ nhớ gần nhất
+        self.mem_data = 0
+        # Của lệnh vừa chạy trong step(): mem_addr/mem_data thuộc về lệnh này, lệnh bị trap
+        self.mem_valid = False
+        self.trapped = False
+        self.halted = False     # Gặp lệnh 0 (kết thúc chương trình) trong run()
+        self.trap_counts = [0] * 32  # Số lần trap theo cause code
+        # Số lần chuyển privilege, index transition_index(from, to, cause)
+        self.priv_transitions = [0] * PRIV_TRANSITION_SLOTS
+
+        # Bảng dispatch theo opcode
+        self.dispatch = {
+            0b0110011: self.execute_rtype,
+            0b0010011: self.execute_itype,
+            0b0000011: self.execute_load,
+            0b0100011: self.execute_store,
+            0b1100011: self.execute_btype,
+            0b0110111: self.execute_utype,
+            0b0010111: self.execute_utype,
+            0b1101111: self.execute_jtype,
+            0b1100111: self.execute_jalr,
+            0b1110011: self.execute_system,
+        }
+        # Cache basic block: pc -> tuple((handler, instr), ...)
+        self.block_cache = {}
+        self.code_pages = set()
+        # Breakpoint: pc -> object có hit(iss) (Breakpoints.Breakpoint). Block bắt đầu tại pc
+        # có breakpoint được cache riêng nên run() chỉ kiểm tra khi vào những block này.
+        self.breakpoints = {}
+        self.breakpoint_blocks = {}
+        self.breakpoint_hit = None  # Breakpoint làm run() dừng lần gần nhất
+        # Trigger module (Triggers.py): watchpoint load/store và icount
+        self.watchpoints = ()
+        self.watch_pages = set()
+        self.icount_trigger = None
+        self.trigger_hit = None     # Trigger làm run()/step() dừng lần gần nhất
+        self.trigger_pc = None      # pc của lệnh vừa bị watchpoint chặn (chạy lại khi resume)
+        # Yêu cầu halt bất đồng bộ (request_halt() từ thread khác, signal handler, debug
+        # server): run() kiểm tra một lần mỗi block, dừng giữa hai lệnh và đặt haltreq_hit.
+        self.halt_request = False
+        self.haltreq_hit = False
+
+    def reset(self, image=None):
+        """
+        Đưa hart về trạng thái sau reset nhưng giữ lại bộ nhớ đã cấp phát.
+
+        image (bytes dài bằng bộ nhớ): nạp lại nội dung này thay vì xoá bộ nhớ. Cache block
+        được giữ nếu mọi trang code đã decode giống image, nên chạy lại cùng chương trình
+        không phải decode lại.
+        """
+        self.regs[:] = [0] * 32
+        self.pc = 0x0
+        self.privilege_level = 0b00
+        for csr in self.csrs.values():
+            csr.value = "0" * 32
+        self.instret = 0
+        self.mem_addr = 0
+        self.mem_data = 0
+        self.mem_valid = False
+        self.trapped = False
+        self.halted = False
+        self.breakpoint_hit = None
+        self.trigger_hit = None
+        self.trigger_pc = None
+        self.halt_request = False
+        self.haltreq_hit = False
+        self.trap_counts[:] = [0] * 32
+        self.priv_transitions[:] = [0] * PRIV_TRANSITION_SLOTS
+        if image is None:
+            self.memory[:] = bytes(len(self.memory))
+            self.invalidate_blocks()
+            return
+        if len(image) != len(self.memory):
+            raise ValueError("Memory image size does not match the hart memory")
+        size = 1 << CODE_PAGE_SHIFT
+        memory = memoryview(self.memory)
+        image = memoryview(image)
+        for page in self.code_pages:
+            start = page << CODE_PAGE_SHIFT
+            if memory[start:start + size] != image[start:start + size]:
+                self.invalidate_blocks()  # Code đã decode bị ghi đè trong lần chạy trước
+                break
+        self.memory[:] = image
+
+    def load_program_words(self, words, base_address=0x0):
+        """Nạp một dãy lệnh 32 bit vào bộ nhớ bằng một lần copy."""
+        data = struct.pack(f"<{len(words)}I", *words)
+        self.memory[base_address:base_address + len(data)] = data
+        self.invalidate_blocks()
         
+    def load_image(self, image):
+        """
+        Nạp ProgramImage (RISCV_asembler.assemble_string/assemble_file) không qua file:
+        text và data mỗi section một lần copy, pc = image.entry.
+        """
+        if image.errors:
+            raise ValueError(f"Program image has {len(image.errors)} error(s): {image.errors[0]}")
+        end = max(image.text_base + len(image.text), image.data_base + len(image.data))
+        if end > len(self.memory):
+            raise ValueError(f"Program image needs 0x{end:x} bytes of memory")
+        self.memory[image.text_base:image.text_base + len(image.text)] = image.text
+        self.memory[image.data_base:image.data_base + len(image.data)] = image.data
+        self.pc = image.entry
+        self.invalidate_blocks()
+
     def load_program_from_binary_file(self, filepath, base_address=0x0):
         with open(filepath, "r") as f:
             lines = f.readlines()
@@ -39,6 +173,8 @@ class RISCV_ISS:
             self.memory[address + 3] = (instruction >> 24) & 0xFF
 
             address += 4  # mỗi instruction 4 byte
+
+        self.invalidate_blocks()
             
     def dump_loaded_instructions(self, base_address=0x0, count=None):
         """
@@ -118,32 +254,283 @@ class RISCV_ISS:
         self.memory[addr + 3] = (value >> 24) & 0xFF
 
     def step(self):
-        instr = self.load_word(self.pc)
+        pc = self.pc
+        priv = self.privilege_level
+        instr = self.load_word(pc)
         self.pc += 4
 
         opcode = instr & 0x7F
+        self.mem_valid = False
+        self.trapped = False
 
         # Dispatch theo opcode
-        if opcode == 0b0110011:
-            self.execute_rtype(instr)
-        elif opcode == 0b0010011:
-            self.execute_itype(instr)
-        elif opcode == 0b0000011:
-            self.execute_load(instr)
-        elif opcode == 0b0100011:
-            self.execute_store(instr)
-        elif opcode == 0b1100011:
-            self.execute_btype(instr)
-        elif opcode in ("0110111", "0010111"):
-            self.execute_utype(instr)
-        elif opcode == 0b1101111:
-            self.execute_jtype(instr)
+        handler = self.dispatch.get(opcode)
+        if handler is not None:
+            handler(instr)
         elif instr == 0:
             print("Simulation completed!")
             exit()
         else:
             raise NotImplementedError(f"Unknown opcode: {opcode:07b}")
 
+        self.instret += 1
+
+    # tracer (TraceWriter, CommitLogWriter, RetireCapture: record(iss, pc, instr, priv)) và
+    # coverage (Coverage: record(instr, priv), block_executed(...)) được HookRegistry gắn vào
+    # step() như hook sau lệnh, nên step() gốc không phải kiểm tra gì thêm.
+    @property
+    def tracer(self):
+        return self._tracer
+
+    @tracer.setter
+    def tracer(self, tracer):
+        if tracer is not self._tracer:
+            self._tracer = tracer
+            self._observers_changed()
+
+    @property
+    def coverage(self):
+        return self._coverage
+
+    @coverage.setter
+    def coverage(self, coverage):
+        if coverage is not self._coverage:
+            self._coverage = coverage
+            self._observers_changed()
+
+    def _observers_changed(self):
+        if self.hooks is None:
+            from Hooks import HookRegistry
+            self.hooks = HookRegistry(self)
+        self.hooks.specialize()
+
+    def add_hook(self, event, callback):
+        """Đăng ký callback(iss, event) cho một sự kiện của Hooks.EVENTS."""
+        if self.hooks is None:
+            from Hooks import HookRegistry
+            self.hooks = HookRegistry(self)
+        return self.hooks.add(event, callback)
+
+    def remove_hook(self, event, callback):
+        self.hooks.remove(event, callback)
+
+    def execute_unknown(self, instr):
+        raise NotImplementedError(f"Unknown opcode: {instr & 0x7F:07b}")
+
+    def decode_block(self, pc):
+        """
+        Decode basic block bắt đầu tại pc và lưu vào block_cache (tuple rỗng nếu pc là lệnh 0).
+        Block dừng trước pc có breakpoint, block bắt đầu tại breakpoint lưu vào breakpoint_blocks.
+        """
+        block = []
+        dispatch = self.dispatch
+        breakpoints = self.breakpoints
+        addr = pc
+        limit = len(self.memory) - 3
+        while len(block) < MAX_BLOCK_LEN and addr < limit:
+            if addr != pc and addr in breakpoints:
+                break
+            instr = self.load_word(addr)
+            if instr == 0:
+                break
+            opcode = instr & 0x7F
+            block.append((dispatch.get(opcode, self.execute_unknown), instr))
+            addr += 4
+            if opcode in BLOCK_END_OPCODES:
+                break
+        block = tuple(block)
+        if pc in breakpoints:
+            self.breakpoint_blocks[pc] = block
+        else:
+            self.block_cache[pc] = block
+        for page in range(pc >> CODE_PAGE_SHIFT, ((addr - 1) >> CODE_PAGE_SHIFT) + 1):
+            self.code_pages.add(page)
+        return block
+
+    def invalidate_blocks(self):
+        self.block_cache.clear()
+        self.breakpoint_blocks.clear()
+        self.code_pages.clear()
+
+    def set_breakpoint(self, pc, breakpoint):
+        """Đặt breakpoint (object có hit(iss) -> bool) tại pc; block cache được decode lại."""
+        self.breakpoints[pc] = breakpoint
+        self.invalidate_blocks()
+
+    def remove_breakpoint(self, pc):
+        if self.breakpoints.pop(pc, None) is not None:
+            self.invalidate_blocks()
+
+    def set_watchpoints(self, watchpoints):
+        """
+        Cài danh sách watchpoint (object có lo, hi, matches(iss, addr, size, store), xem
+        Triggers.Watch). Load/store chỉ đi đường kiểm tra khi có watchpoint; khi đó trang
+        [lo, hi) được đánh dấu và chỉ truy cập vào các trang này mới phải so khớp.
+        """
+        self.watchpoints = tuple(watchpoints)
+        self.watch_pages = set()
+        last_page = (len(self.memory) - 1) >> WATCH_PAGE_SHIFT
+        for watch in self.watchpoints:
+            first = watch.lo >> WATCH_PAGE_SHIFT
+            last = min((watch.hi - 1) >> WATCH_PAGE_SHIFT, last_page)
+            self.watch_pages.update(range(first, last + 1))
+        if self.watchpoints:
+            self.execute_load = self.execute_load_watched
+            self.execute_store = self.execute_store_watched
+        else:
+            self.__dict__.pop("execute_load", None)
+            self.__dict__.pop("execute_store", None)
+        self.dispatch[OPCODE_LOAD] = self.execute_load
+        self.dispatch[OPCODE_STORE] = self.execute_store
+        if self.hooks is not None:
+            self.hooks.specialize()  # Bọc lại handler load/store mới, decode lại block
+        else:
+            self.invalidate_blocks()
+
+    def check_watchpoints(self, addr, size, store):
+        """Trả về True nếu truy cập bị watchpoint chặn (đã trap), DebugHalt nếu phải dừng hart."""
+        for watch in self.watchpoints:
+            if watch.matches(self, addr, size, store):
+                self.fire_trigger(watch, addr)
+                return True
+        return False
+
+    def fire_trigger(self, trigger, tval, epc=None):
+        """
+        Trigger khớp: action debug -> lùi pc về lệnh gây ra và raise DebugHalt, ngược lại
+        raise exception Breakpoint (stval = tval).
+        """
+        trigger.fire()
+        if trigger.halts:
+            if epc is None:
+                self.pc -= 4
+                self.trigger_pc = self.pc
+            self.trigger_hit = trigger
+            raise DebugHalt(trigger)
+        self.raise_exception("Breakpoint", tval, epc)
+
+    def request_halt(self):
+        """Yêu cầu run() đang chạy dừng ở ranh giới block kế tiếp (gọi được từ thread/signal khác)."""
+        self.halt_request = True
+
+    def step_over_trigger(self):
+        """Chạy một lệnh mà không so khớp watchpoint (lệnh vừa bị chặn tại trigger_pc)."""
+        watchpoints = self.watchpoints
+        self.watchpoints = ()
+        try:
+            self.step()
+        finally:
+            self.watchpoints = watchpoints
+            self.trigger_pc = None
+
+    def run(self, max_instructions=None):
+        """
+        Chạy nhanh tới khi gặp lệnh 0 (kết thúc chương trình) hoặc đủ max_instructions.
+
+        Dùng cache basic block đã decode thay vì fetch/decode từng lệnh như step().
+        Nếu có tracer hoặc hook pre/post_instruction thì chạy từng lệnh qua step().
+        Coverage (nếu có) được cập nhật một lần cho mỗi block. Trả về số lệnh đã retire.
+
+        Breakpoint chỉ được kiểm tra khi vào block bắt đầu tại pc có breakpoint; nếu hit()
+        trả về True thì dừng trước lệnh đó và đặt breakpoint_hit. Breakpoint tại pc lúc gọi
+        run() được bỏ qua để có thể chạy tiếp sau khi dừng. Watchpoint/icount trigger dừng
+        run() bằng DebugHalt và đặt trigger_hit; lệnh bị chặn được chạy lại (không so khớp)
+        ở lần run() tiếp theo. icount chỉ làm giảm giới hạn số lệnh. request_halt() dừng
+        run() trước block kế tiếp (trước lệnh kế tiếp khi chạy từng lệnh) và đặt haltreq_hit.
+        """
+        start = self.instret
+        limit = -1 if max_instructions is None else start + max_instructions
+        icount = self.icount_trigger
+        if icount is not None and (limit < 0 or start + icount.count < limit):
+            limit = start + icount.count
+        breakpoints = self.breakpoints
+        self.breakpoint_hit = None
+        self.trigger_hit = None
+        self.haltreq_hit = False
+        resume_pc = self.pc
+        if self.trigger_pc == self.pc and self.instret != limit:
+            self.step_over_trigger()
+        if self.hooks is not None and self.hooks.per_instruction:
+            try:
+                while not self.halted and self.instret != limit:
+                    if self.halt_request:
+                        self.halt_request = False
+                        self.haltreq_hit = True
+                        break
+                    pc = self.pc
+                    if self.load_word(pc) == 0:
+                        self.halted = True
+                        break
+                    breakpoint = breakpoints.get(pc)
+                    if breakpoint is not None and pc != resume_pc and breakpoint.hit(self):
+                        self.breakpoint_hit = breakpoint
+                        break
+                    resume_pc = None
+                    self.step()
+            except DebugHalt:
+                pass
+            if icount is not None:
+                self.count_instructions(icount, self.instret - start)
+            return self.instret - start
+
+        blocks = self.block_cache
+        coverage = self.coverage
+        instret = self.instret
+        try:
+            while instret != limit:
+                if self.halt_request:
+                    self.halt_request = False
+                    self.haltreq_hit = True
+                    break
+                pc = block_pc = self.pc
+                block = blocks.get(pc)
+                if block is None:
+                    breakpoint = breakpoints.get(pc)
+                    if breakpoint is not None:
+                        if pc != resume_pc and breakpoint.hit(self):
+                            self.breakpoint_hit = breakpoint
+                            break
+                        block = self.breakpoint_blocks.get(pc)
+                    if block is None:
+                        block = self.decode_block(pc)
+                resume_pc = None
+                if not block:
+                    self.halted = True
+                    break
+                if limit >= 0 and instret + len(block) > limit:
+                    block = block[:limit - instret]
+                priv = self.privilege_level
+                block_start = instret
+                for handler, instr in block:
+                    pc += 4
+                    self.pc = pc
+                    handler(instr)
+                    instret += 1
+                    if self.pc != pc or not blocks:
+                        break  # Nhảy, trap hoặc code vừa bị ghi đè
+                if coverage is not None:
+                    coverage.block_executed(block_pc, block, instret - block_start, priv)
+        except DebugHalt:
+            if coverage is not None:  # Phần block đã chạy trước lệnh bị chặn
+                coverage.block_executed(block_pc, block, instret - block_start, priv)
+        finally:
+            self.instret = instret
+        if icount is not None:
+            self.count_instructions(icount, instret - start)
+        return instret - start
+
+    def count_instructions(self, icount, executed):
+        """Trừ số lệnh đã retire khỏi icount trigger; về 0 thì trigger khớp."""
+        if icount.count == 0 or executed == 0:
+            return
+        icount.count -= executed
+        if icount.count == 0:
+            self.icount_trigger = None
+            try:
+                self.fire_trigger(icount, None, self.pc)
+            except DebugHalt:
+                pass
+
     def sign_extend(self, val, bits):
         if (val >> (bits - 1)) & 1:
             return val | (~0 << bits)
@@ -206,7 +593,8 @@ class RISCV_ISS:
             raise NotImplementedError(f"Unknown R-type instruction: funct3={funct3:03b}, funct7={funct7:07b}")
 
         self.write_reg(rd, result)
-        print(f"Executed: {mnemonic} x{rd}, x{rs1}, x{rs2}")
+        if self.verbose:
+            print(f"Executed: {mnemonic} x{rd}, x{rs1}, x{rs2}")
 
     def execute_itype(self, instr):
         rd     = (instr >> 7) & 0x1F
@@ -261,7 +649,8 @@ class RISCV_ISS:
             raise NotImplementedError(f"Unknown I-type instruction: funct3={funct3:03b}")
 
         self.write_reg(rd, result)
-        print(f"Executed: {mnemonic} x{rd}, x{rs1}, {imm}")
+        if self.verbose:
+            print(f"Executed: {mnemonic} x{rd}, x{rs1}, {imm}")
 
     def execute_load(self, instr):
         rd     = (instr >> 7) & 0x1F
@@ -292,6 +681,9 @@ class RISCV_ISS:
         else:
             raise NotImplementedError(f"Unsupported load funct3: {funct3}")
 
+        self.mem_addr = addr
+        self.mem_data = val
+        self.mem_valid = True
         self.write_reg(rd, val)
 
     def execute_store(self, instr):
@@ -306,7 +698,13 @@ class RISCV_ISS:
         if addr % 4 != 0:
             self.raise_exception("Store/AMO address misaligned", addr)
             return
-        
+
+        self.mem_addr = addr
+        self.mem_data = val
+        self.mem_valid = True
+        if (addr >> CODE_PAGE_SHIFT) in self.code_pages:
+            self.invalidate_blocks()  # Ghi đè lên code đã decode
+
         if funct3 == 0b000:  # sb
             self.memory[addr] = val & 0xFF
         elif funct3 == 0b001:  # sh
@@ -321,6 +719,24 @@ class RISCV_ISS:
         else:
             raise NotImplementedError(f"Unsupported store funct3: {funct3}")
 
+    # Handler load/store khi có watchpoint (set_watchpoints): chỉ truy cập vào trang được
+    # đánh dấu mới phải so khớp, trigger khớp thì lệnh không được thực hiện.
+    def execute_load_watched(self, instr):
+        imm = instr >> 20
+        addr = (self.regs[(instr >> 15) & 0x1F] + (imm - 0x1000 if imm & 0x800 else imm)) & 0xFFFFFFFF
+        if (addr >> WATCH_PAGE_SHIFT) in self.watch_pages and \
+                self.check_watchpoints(addr, LOAD_SIZES.get((instr >> 12) & 0x7, 4), False):
+            return
+        RISCV_ISS.execute_load(self, instr)
+
+    def execute_store_watched(self, instr):
+        imm = ((instr >> 25) << 5) | ((instr >> 7) & 0x1F)
+        addr = (self.regs[(instr >> 15) & 0x1F] + (imm - 0x1000 if imm & 0x800 else imm)) & 0xFFFFFFFF
+        if (addr >> WATCH_PAGE_SHIFT) in self.watch_pages and \
+                self.check_watchpoints(addr, STORE_SIZES.get((instr >> 12) & 0x7, 4), True):
+            return
+        RISCV_ISS.execute_store(self, instr)
+
     def execute_btype(self, instr):
         rs1    = (instr >> 15) & 0x1F
         rs2    = (instr >> 20) & 0x1F
@@ -376,7 +792,8 @@ class RISCV_ISS:
         if taken:
             self.pc -= 4
 
-        print(f"Executed: {mnemonic} x{rs1}, x{rs2}, {imm}")
+        if self.verbose:
+            print(f"Executed: {mnemonic} x{rs1}, x{rs2}, {imm}")
 
     def execute_utype(self, instr):
         opcode = instr & 0x7F            # opcode = bits [6:0]
@@ -385,13 +802,14 @@ class RISCV_ISS:
         mnemonic = "unknown"
 
         if opcode == 0b0110111:  # LUI
-            self.regs[rd] = imm << 12
+            self.write_reg(rd, imm << 12)
             mnemonic = "lui"
-        elif opcode == 0b0010111:  # AUIPC
-            self.regs[rd] = self.pc + (imm << 12)
+        elif opcode == 0b0010111:  # AUIPC (self.pc đã được tăng 4)
+            self.write_reg(rd, (self.pc - 4 + (imm << 12)) & 0xFFFFFFFF)
             mnemonic = "auipc"
 
-        print(f"Executed: {mnemonic} x{rd}, {imm}")
+        if self.verbose:
+            print(f"Executed: {mnemonic} x{rd}, {imm}")
         return f"{mnemonic} x{rd}, {imm}"
 
     def execute_jtype(self, instr):
@@ -407,27 +825,110 @@ class RISCV_ISS:
         imm = (imm_20 << 20) | (imm_19_12 << 12) | (imm_11 << 11) | (imm_10_1 << 1)
         imm = self.sign_extend(imm, 21)
 
-        if opcode == 0b1101111:  # JAL
-            self.regs[rd] = self.pc + 4
-            self.pc += imm
+        if opcode == 0b1101111:  # JAL (self.pc đã được tăng 4)
+            self.write_reg(rd, self.pc)
+            self.pc = (self.pc - 4 + imm) & 0xFFFFFFFF
+            if self.verbose:
+                print(f"Executed: jal x{rd}, {imm}")
             return f"jal x{rd}, {imm}"
 
         return "unknown"
 
-    def raise_exception(self, cause_description, faulting_address=None):
+    def execute_jalr(self, instr):
+        rd  = (instr >> 7) & 0x1F
+        rs1 = (instr >> 15) & 0x1F
+        imm = self.sign_extend((instr >> 20) & 0xFFF, 12)
+
+        target = (self.regs[rs1] + imm) & 0xFFFFFFFE
+        if target % 4 != 0:
+            self.raise_exception("Instruction address misaligned", target)
+            return
+        self.write_reg(rd, self.pc)
+        self.pc = target
+        if self.verbose:
+            print(f"Executed: jalr x{rd}, {imm}(x{rs1})")
+
+    def execute_system(self, instr):
+        rd     = (instr >> 7) & 0x1F
+        funct3 = (instr >> 12) & 0x07
+        rs1    = (instr >> 15) & 0x1F
+        csr    = (instr >> 20) & 0xFFF
+
+        if funct3 == 0b000:
+            if csr == 0x000 and rs1 == 0 and rd == 0:
+                mnemonic = "ecall"
+                self.handle_ecall()
+            elif csr == 0x001 and rs1 == 0 and rd == 0:
+                mnemonic = "ebreak"
+                self.raise_exception("Breakpoint", self.pc - 4)
+            elif csr == 0x102 and self.privilege_level >= 0b01:
+                mnemonic = "sret"
+                self.handle_sret()
+            elif csr == 0x105:
+                mnemonic = "wfi"  # Không có ngắt bất đồng bộ: coi như nop
+            elif (instr >> 25) == 0b0001001 and self.privilege_level >= 0b01:
+                mnemonic = "sfence.vma"  # Không có TLB
+            else:
+                self.raise_exception("Illegal instruction", instr)
+                return
+            if self.verbose:
+                print(f"Executed: {mnemonic}")
+            return
+
+        name = CSR_ADDRESSES.get(csr)
+        if name is None or funct3 == 0b100 or self.privilege_level < (csr >> 8) & 0b11:
+            self.raise_exception("Illegal instruction", instr)
+            return
+
+        reg = self.csrs[name]
+        old = int(reg.read(), 2)
+        operand = rs1 if funct3 & 0b100 else self.regs[rs1]  # csrr*i dùng uimm 5 bit
+        op = funct3 & 0b011
+        if op == 0b01:    # csrrw
+            new = operand
+        elif op == 0b10:  # csrrs
+            new = old | operand
+        else:             # csrrc
+            new = old & ~operand
+        # csrrs/csrrc với rs1 = x0 (uimm = 0) không ghi CSR
+        if op == 0b01 or rs1 != 0:
+            reg.write(f"{new & 0xFFFFFFFF:032b}")
+        self.write_reg(rd, old)
+        if self.verbose:
+            mnemonic = ("csrrw", "csrrs", "csrrc")[op - 1] + ("i" if funct3 & 0b100 else "")
+            print(f"Executed: {mnemonic} x{rd}, {name}, {rs1}")
+
+    def raise_exception(self, cause_description, faulting_address=None, epc=None):
         self.csrs["scause"].set_cause_by_description(cause_description)
-        self.csrs["sepc"].write(self.pc)
+        self.enter_trap(self.csrs["scause"].get_cause_code(), faulting_address, epc)
+
+        if self.verbose:
+            print(f"Trap: {cause_description}, pc set to {hex(self.pc)}")
+
+    def raise_interrupt(self, cause_code):
+        """Nhận ngắt bất đồng bộ trước lệnh tại self.pc (sepc = self.pc)."""
+        self.csrs["scause"].set_cause(cause_code, interrupt=True)
+        self.enter_trap(cause_code, None, self.pc, interrupt=True)
+
+        if self.verbose:
+            print(f"Interrupt: cause {cause_code}, pc set to {hex(self.pc)}")
+
+    def enter_trap(self, cause_code, faulting_address=None, epc=None, interrupt=False):
+        # self.pc đã được tăng 4 trong step(), sepc phải là PC của lệnh gây trap
+        if epc is None:
+            epc = self.pc - 4
+        self.csrs["sepc"].save_pc(epc & 0xFFFFFFFF)
+        self.trapped = True
+        self.trap_counts[cause_code & 0x1F] += 1
+        self.priv_transitions[transition_index(self.privilege_level, 0b01, cause_code & 0x1F)] += 1
 
         if faulting_address is not None:
-            self.csrs["stval"].write(faulting_address)
+            self.csrs["stval"].write(f"{faulting_address & 0xFFFFFFFF:032b}")
 
         # Jump to handler address in stvec
-        stvec = self.csrs["stvec"].read()
-        self.pc = stvec
+        self.pc = self.csrs["stvec"].set_pc(cause_code, interrupt)
         self.privilege_level = 0b01  # Chuyển vào Supervisor Mode
 
-        print(f"Trap: {cause_description}, pc set to {hex(self.pc)}")
-
     def handle_ecall(self):
         if self.privilege_level == 0:
             self.raise_exception("Environment call from U-mode")
@@ -435,6 +936,8 @@ class RISCV_ISS:
             self.raise_exception("Environment call from S-mode")
 
     def handle_sret(self):
-        self.pc = self.csrs["sepc"].read()
+        self.priv_transitions[transition_index(self.privilege_level, 0b00, XRET_CAUSE)] += 1
+        self.pc = self.csrs["sepc"].restore_pc()
         self.privilege_level = 0b00  # Giả sử quay về user mode
-        print("Return from supervisor mode to user mode")
+        if self.verbose:
+            print("Return from supervisor mode to user mode")
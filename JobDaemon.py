@@ -0,0 +1,277 @@
+import argparse
+import asyncio
+import collections
+import hashlib
+import json
+import os
+import socket
+import sys
+import time
+
+from ISS import RISCV_ISS, CODE_PAGE_SHIFT
+from RISCV_asembler import assemble_string
+
+# Daemon chạy job mô phỏng: giữ process worker sống lâu với RISCV_ISS đã nạp image và cache
+# block đã decode, nên mỗi regression ngắn không phải trả giá khởi động Python, import,
+# nạp chương trình và decode lại từ đầu.
+#
+#   python JobDaemon.py serve --port 7878 --workers 4      (hoặc --unix /tmp/riscv-jobs.sock)
+#   python JobDaemon.py submit text.bin other.s --budget 1000000 --output regs --output mem:0x1000:16
+#
+# Giao thức: mỗi dòng là một JSON. Client gửi job
+#   {"id": 1, "image": "text.bin" | "words": [...] | "source": "<assembly>", "budget": N,
+#    "priv": "user"|"supervisor",
+#    "inputs": {"regs": {"10": 5}, "memory": {"0x1000": [1, 2]}, "pc": 0},
+#    "outputs": ["regs", "pc", "instret", "csrs", "mem:ADDR:N"]}
+# và nhận lại {"id": 1, "ok": true, "warm": true, "seconds": ..., "result": {...}} ngay khi
+# job xong (không theo thứ tự gửi), hoặc {"id": 1, "ok": false, "error": "..."}.
+# Một kết nối gửi được nhiều job liên tiếp; các job chạy song song trên pool worker.
+#
+# Mỗi worker giữ tối đa WARM_IMAGES image gần nhất (LRU). Giữa hai job, hart được reset
+# bằng RISCV_ISS.reset(image): bộ nhớ nạp lại từ bản gốc, cache block được giữ nếu code
+# không bị ghi đè.
+
+DEFAULT_PORT = 7878
+DEFAULT_BUDGET = 10000000
+MEM_SIZE = 0x10000
+WARM_IMAGES = 8
+PRIVILEGE_LEVELS = {"user": 0b00, "supervisor": 0b01}
+DEFAULT_OUTPUTS = ("regs", "pc", "instret")
+
+
+# Phía worker (chạy trong process của pool)
+
+_warm = collections.OrderedDict()  # key image -> (RISCV_ISS, bytes bộ nhớ gốc, pc bắt đầu)
+
+
+def _image_key(job):
+    # Cùng image nhưng mem_size khác cần hart khác
+    size = job.get("mem_size", MEM_SIZE)
+    if "words" in job:
+        return f"words:{size}:" + hashlib.sha1(json.dumps(job["words"]).encode()).hexdigest()
+    if "source" in job:
+        return f"source:{size}:" + hashlib.sha1(job["source"].encode()).hexdigest()
+    path = os.path.abspath(job["image"])
+    st = os.stat(path)
+    return f"file:{size}:{path}:{st.st_mtime_ns}:{st.st_size}"  # File bị dịch lại -> image mới
+
+
+def _hart(job):
+    """(iss, warm) cho image của job; iss đã reset về image gốc."""
+    key = _image_key(job)
+    entry = _warm.get(key)
+    if entry is not None:
+        _warm.move_to_end(key)
+        iss, image, entry_pc = entry
+        iss.reset(image)
+        iss.pc = entry_pc  # reset() đưa pc về 0, image dịch từ nguồn có thể bắt đầu ở ENTRY khác
+        return iss, True
+    iss = RISCV_ISS(job.get("mem_size", MEM_SIZE))
+    iss.verbose = False
+    if "words" in job:
+        iss.load_program_words(job["words"])
+    elif "source" in job:
+        iss.load_image(assemble_string(job["source"]))  # Dịch trong worker, không qua file
+    else:
+        iss.load_program_from_binary_file(job["image"])
+    _warm[key] = (iss, bytes(iss.memory), iss.pc)
+    if len(_warm) > WARM_IMAGES:
+        _warm.popitem(last=False)
+    return iss, False
+
+
+def _apply_inputs(iss, inputs):
+    for index, value in inputs.get("regs", {}).items():
+        index = int(index)
+        if index:
+            iss.regs[index] = value & 0xFFFFFFFF
+    for addr, words in inputs.get("memory", {}).items():
+        addr = int(addr, 0)
+        data = b"".join((word & 0xFFFFFFFF).to_bytes(4, "little") for word in words)
+        iss.memory[addr:addr + len(data)] = data
+        pages = range(addr >> CODE_PAGE_SHIFT, ((addr + len(data) - 1) >> CODE_PAGE_SHIFT) + 1)
+        if any(page in iss.code_pages for page in pages):
+            iss.invalidate_blocks()  # Dữ liệu đầu vào đè lên code đã decode
+    if "pc" in inputs:
+        iss.pc = inputs["pc"]
+
+
+def _collect(iss, outputs):
+    result = {}
+    for output in outputs:
+        if output == "regs":
+            result["regs"] = [value & 0xFFFFFFFF for value in iss.regs]
+        elif output == "pc":
+            result["pc"] = iss.pc
+        elif output == "instret":
+            result["instret"] = iss.instret
+        elif output == "csrs":
+            result["csrs"] = {name: int(csr.read(), 2) for name, csr in iss.csrs.items()}
+        elif output == "traps":
+            result["traps"] = list(iss.trap_counts)
+        elif output.startswith("mem:"):
+            _, addr, count = output.split(":")
+            addr = int(addr, 0)
+            data = iss.memory[addr:addr + 4 * int(count, 0)]
+            result[output] = [int.from_bytes(data[i:i + 4], "little") for i in range(0, len(data), 4)]
+        else:
+            raise ValueError(f"Unknown output: {output}")
+    return result
+
+
+def run_job(job):
+    """Chạy một job trong worker; trả về dict reply (không raise)."""
+    reply = {"id": job.get("id"), "ok": False}
+    try:
+        start = time.perf_counter()
+        iss, warm = _hart(job)
+        iss.privilege_level = PRIVILEGE_LEVELS[job.get("priv", "supervisor")]
+        _apply_inputs(iss, job.get("inputs", {}))
+        iss.run(job.get("budget", DEFAULT_BUDGET))
+        result = _collect(iss, job.get("outputs", DEFAULT_OUTPUTS))
+        result["halted"] = iss.halted  # False: hết budget trước khi chương trình kết thúc
+        reply.update(ok=True, warm=warm, seconds=time.perf_counter() - start, result=result)
+    except Exception as e:
+        reply["error"] = f"{type(e).__name__}: {e}"
+    return reply
+
+
+# Phía daemon
+
+class JobDaemon:
+    """
+    Nhận job qua TCP localhost hoặc Unix socket và chạy trên pool process worker.
+
+    Args:
+        workers: Số process worker (mặc định số CPU).
+        host / port: Địa chỉ TCP (bỏ qua khi có unix_path).
+        unix_path: Đường dẫn Unix socket.
+    """
+
+    def __init__(self, workers=None, host="127.0.0.1", port=DEFAULT_PORT, unix_path=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.host = host
+        self.port = port
+        self.unix_path = unix_path
+        self.pool = None
+        self.completed = 0
+
+    async def handle_client(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        lock = asyncio.Lock()
+        tasks = set()
+
+        async def submit(job):
+            reply = await loop.run_in_executor(self.pool, run_job, job)
+            self.completed += 1
+            async with lock:  # Mỗi reply là một dòng nguyên vẹn
+                writer.write(json.dumps(reply).encode() + b"\n")
+                await writer.drain()
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                try:
+                    job = json.loads(line)
+                except ValueError as e:
+                    writer.write(json.dumps({"id": None, "ok": False, "error": f"Bad request: {e}"}).encode() + b"\n")
+                    continue
+                task = asyncio.create_task(submit(job))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)  # Client đã đóng chiều gửi: trả nốt kết quả
+        finally:
+            writer.close()
+
+    async def serve(self):
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        # spawn: worker không thừa kế socket của client đang kết nối (fork sẽ giữ kết nối mở)
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=context) as self.pool:
+            loop = asyncio.get_running_loop()
+            await asyncio.gather(*(loop.run_in_executor(self.pool, time.sleep, 0.1) for _ in range(self.workers)))
+            if self.unix_path:
+                server = await asyncio.start_unix_server(self.handle_client, path=self.unix_path)
+                where = self.unix_path
+            else:
+                server = await asyncio.start_server(self.handle_client, self.host, self.port)
+                where = f"{self.host}:{self.port}"
+            print(f"[JOBS] Serving on {where} with {self.workers} worker(s)")
+            async with server:
+                await server.serve_forever()
+
+
+# Phía client
+
+def submit_jobs(jobs, host="127.0.0.1", port=DEFAULT_PORT, unix_path=None):
+    """Gửi mọi job rồi yield từng reply ngay khi daemon trả về (thứ tự hoàn thành)."""
+    if unix_path:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(unix_path)
+    else:
+        sock = socket.create_connection((host, port))
+    with sock, sock.makefile("rb") as replies:
+        sock.sendall(b"".join(json.dumps(job).encode() + b"\n" for job in jobs))
+        sock.shutdown(socket.SHUT_WR)
+        for line in replies:
+            yield json.loads(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulation job daemon with warm RISCV_ISS workers")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("serve", help="run the daemon")
+    p.add_argument("--workers", type=int, default=None)
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=DEFAULT_PORT)
+    p.add_argument("--unix", metavar="PATH", help="listen on a Unix socket instead of TCP")
+
+    p = sub.add_parser("submit", help="send one job per image and print the replies")
+    p.add_argument("images", nargs="+", help="text.bin program images or .s sources")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=DEFAULT_PORT)
+    p.add_argument("--unix", metavar="PATH")
+    p.add_argument("--budget", type=int, default=DEFAULT_BUDGET)
+    p.add_argument("--priv", choices=PRIVILEGE_LEVELS, default="supervisor")
+    p.add_argument("--output", dest="outputs", action="append", default=None,
+                   help="regs, pc, instret, csrs, traps or mem:ADDR:N (repeatable)")
+    p.add_argument("--repeat", type=int, default=1, help="submit each image N times")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        daemon = JobDaemon(args.workers, args.host, args.port, args.unix)
+        try:
+            asyncio.run(daemon.serve())
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    programs = {}
+    for image in args.images:
+        if image.endswith(".s"):
+            with open(image) as f:
+                programs[image] = {"source": f.read()}
+        else:
+            programs[image] = {"image": os.path.abspath(image)}
+    jobs = [{"id": i, **programs[image], "budget": args.budget, "priv": args.priv,
+             "outputs": args.outputs or list(DEFAULT_OUTPUTS)}
+            for i, image in enumerate(args.images * args.repeat)]
+    start = time.perf_counter()
+    failed = 0
+    for reply in submit_jobs(jobs, args.host, args.port, args.unix):
+        print(json.dumps(reply))
+        failed += not reply["ok"]
+    print(f"{len(jobs)} job(s) in {time.perf_counter() - start:.3f}s", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,307 @@
+import select
+import socket
+import sys
+
+# JTAG Debug Transport Module (RISC-V Debug spec 0.13) qua giao thức remote_bitbang của
+# OpenOCD, để debug hart mô phỏng giống như qua JTAG trên FPGA (README bước 12).
+#
+#   python Jtag.py text.bin --port 9824
+#   openocd -c "adapter driver remote_bitbang; remote_bitbang port 9824" \
+#           -c "transport select jtag; jtag newtap riscv cpu -irlen 5 -expected-id 0xdeadbeef" ...
+#
+# TAP có IR 5 bit: IDCODE (0x01), DTMCS (0x10), DMI (0x11), BYPASS (0x1f). Scan DMI dài
+# 41 bit (address 7 bit, data 32 bit, op 2 bit) và được chuyển cho DebugModuleInterface;
+# mọi truy cập DMI xong ngay nên op trả về luôn là 0 (thành công) và idle = 0.
+#
+# Mỗi ký tự '0'-'7' là một lần ghi TCK/TMS/TDI, 'R' đọc TDO. Server xử lý cả buffer nhận
+# được trong một vòng lặp và gửi mọi bit TDO chung một lần sendall; JtagClient ghép trọn
+# chuỗi scan (nhiều truy cập DMI) vào một packet, nên dump/ghi bộ nhớ tốn một round trip
+# cho mỗi khối word chứ không phải cho mỗi bit.
+
+IDCODE_VALUE = 0xDEADBEEF
+IR_LENGTH = 5
+IR_IDCODE = 0x01
+IR_DTMCS = 0x10
+IR_DMI = 0x11
+IR_BYPASS = 0x1F
+
+DMI_ABITS = 7
+DMI_LENGTH = DMI_ABITS + 34
+DMI_OP_NOP = 0
+DMI_OP_READ = 1
+DMI_OP_WRITE = 2
+DTMCS_VALUE = (DMI_ABITS << 4) | 1  # version 1 (0.13), idle = 0, dmistat = 0
+
+RECV_SIZE = 65536
+RUN_CHUNK = 65536        # Số lệnh hart chạy giữa hai lần kiểm tra socket khi đang chạy
+
+# Trạng thái TAP và chuyển trạng thái theo TMS
+(TEST_LOGIC_RESET, RUN_TEST_IDLE, SELECT_DR, CAPTURE_DR, SHIFT_DR, EXIT1_DR, PAUSE_DR, EXIT2_DR,
+ UPDATE_DR, SELECT_IR, CAPTURE_IR, SHIFT_IR, EXIT1_IR, PAUSE_IR, EXIT2_IR, UPDATE_IR) = range(16)
+
+TAP_NEXT = (
+    (RUN_TEST_IDLE, TEST_LOGIC_RESET),  # TEST_LOGIC_RESET
+    (RUN_TEST_IDLE, SELECT_DR),         # RUN_TEST_IDLE
+    (CAPTURE_DR, SELECT_IR),            # SELECT_DR
+    (SHIFT_DR, EXIT1_DR),               # CAPTURE_DR
+    (SHIFT_DR, EXIT1_DR),               # SHIFT_DR
+    (PAUSE_DR, UPDATE_DR),              # EXIT1_DR
+    (PAUSE_DR, EXIT2_DR),               # PAUSE_DR
+    (SHIFT_DR, UPDATE_DR),              # EXIT2_DR
+    (RUN_TEST_IDLE, SELECT_DR),         # UPDATE_DR
+    (CAPTURE_IR, TEST_LOGIC_RESET),     # SELECT_IR
+    (SHIFT_IR, EXIT1_IR),               # CAPTURE_IR
+    (SHIFT_IR, EXIT1_IR),               # SHIFT_IR
+    (PAUSE_IR, UPDATE_IR),              # EXIT1_IR
+    (PAUSE_IR, EXIT2_IR),               # PAUSE_IR
+    (SHIFT_IR, UPDATE_IR),              # EXIT2_IR
+    (RUN_TEST_IDLE, SELECT_DR),         # UPDATE_IR
+)
+
+
+class JtagDTM:
+    """
+    TAP và các thanh ghi scan của DTM, nối với dmi (DebugModuleInterface).
+
+    feed(data) nhận một chuỗi lệnh remote_bitbang và trả về các bit TDO cho mọi 'R'.
+    """
+
+    def __init__(self, dmi):
+        self.dmi = dmi
+        self.state = TEST_LOGIC_RESET
+        self.ir = IR_IDCODE
+        self.shift = 0          # Thanh ghi đang được shift (IR hoặc DR)
+        self.length = 1
+        self.tck = 0
+        self.dmi_result = (0, 0)  # (address, data) của truy cập DMI trước, đọc ra ở Capture-DR
+        self.quit = False
+
+    def reset(self):
+        self.state = TEST_LOGIC_RESET
+        self.ir = IR_IDCODE
+
+    def dr_length(self):
+        return {IR_IDCODE: 32, IR_DTMCS: 32, IR_DMI: DMI_LENGTH}.get(self.ir, 1)
+
+    def capture_dr(self):
+        if self.ir == IR_IDCODE:
+            return IDCODE_VALUE
+        if self.ir == IR_DTMCS:
+            return DTMCS_VALUE
+        if self.ir == IR_DMI:
+            address, data = self.dmi_result
+            return (address << 34) | (data << 2)  # op = 0: thành công
+        return 0
+
+    def update_dr(self):
+        if self.ir != IR_DMI:
+            return  # dmireset/dmihardreset trong DTMCS: không có lỗi dính nào cần xoá
+        value = self.shift
+        op = value & 0x3
+        data = (value >> 2) & 0xFFFFFFFF
+        address = value >> 34
+        if op == DMI_OP_READ:
+            self.dmi_result = (address, self.dmi.read(address))
+        elif op == DMI_OP_WRITE:
+            self.dmi.write(address, data)
+            self.dmi_result = (address, data)
+
+    def clock(self, tms, tdi):
+        """Cạnh lên TCK: shift trong Shift-DR/IR rồi chuyển trạng thái theo TMS."""
+        state = self.state
+        if state == SHIFT_DR or state == SHIFT_IR:
+            self.shift = (self.shift >> 1) | (tdi << (self.length - 1))
+        state = self.state = TAP_NEXT[state][tms]
+        if state == CAPTURE_DR:
+            self.length = self.dr_length()
+            self.shift = self.capture_dr()
+        elif state == CAPTURE_IR:
+            self.length = IR_LENGTH
+            self.shift = 0b00001
+        elif state == UPDATE_DR:
+            self.update_dr()
+        elif state == UPDATE_IR:
+            self.ir = self.shift & ((1 << IR_LENGTH) - 1)
+        elif state == TEST_LOGIC_RESET:
+            self.ir = IR_IDCODE
+
+    def feed(self, data):
+        out = bytearray()
+        tck = self.tck
+        for c in data:
+            if 0x30 <= c <= 0x37:  # '0'-'7': tck << 2 | tms << 1 | tdi
+                if c < 0x34:
+                    tck = 0
+                elif not tck:
+                    tck = 1
+                    if c < 0x36 and (self.state == SHIFT_DR or self.state == SHIFT_IR):
+                        self.shift = (self.shift >> 1) | ((c & 1) << (self.length - 1))  # TMS = 0: vẫn shift
+                    else:
+                        self.clock((c >> 1) & 1, c & 1)
+            elif c == 0x52:  # 'R': TDO là bit thấp của thanh ghi đang shift
+                state = self.state
+                out.append(0x31 if (state == SHIFT_DR or state == SHIFT_IR) and self.shift & 1 else 0x30)
+            elif 0x72 <= c <= 0x75:  # 'r'-'u': bit 1 = trst, bit 0 = srst
+                if (c - 0x72) & 0x2:
+                    self.reset()
+            elif c == 0x51:  # 'Q'
+                self.quit = True
+                break
+            # 'B'/'b' (LED) và các ký tự khác bị bỏ qua
+        self.tck = tck
+        return bytes(out)
+
+
+class JtagServer:
+    """
+    Server remote_bitbang (một client) cho DebugModule dm.
+
+    Args:
+        dm: DebugModule của hart; hart chạy giữa các packet khi debugger đã resume nó.
+        host / port: Địa chỉ lắng nghe (mặc định chỉ localhost).
+    """
+
+    def __init__(self, dm, host="127.0.0.1", port=9824):
+        self.dm = dm
+        self.dmi = dm.dmi
+        self.dtm = JtagDTM(self.dmi)
+        self.host = host
+        self.port = port
+
+    def serve(self):
+        with socket.create_server((self.host, self.port)) as server:
+            print(f"[JTAG] Listening on {self.host}:{self.port}")
+            conn, addr = server.accept()
+        print(f"[JTAG] Client connected from {addr[0]}:{addr[1]}")
+        with conn:
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.serve_connection(conn)
+
+    def running(self):
+        return not self.dm.in_debug_mode and not self.dm.iss.halted
+
+    def serve_connection(self, conn):
+        self.dm.halt_hart()  # Hart chỉ chạy sau khi debugger ghi resumereq
+        while not self.dtm.quit:
+            if self.running():
+                readable, _, _ = select.select([conn], [], [], 0)
+                if not readable:
+                    self.dmi.run(RUN_CHUNK)
+                    continue
+            data = conn.recv(RECV_SIZE)
+            if not data:
+                break
+            out = self.dtm.feed(data)
+            if out:
+                conn.sendall(out)
+
+
+def _clock(tms, tdi, read=False):
+    """Một chu kỳ TCK (thấp rồi cao) với TMS/TDI; read: đọc TDO trước cạnh lên."""
+    bits = (tms << 1) | tdi
+    return bytes((0x30 | bits,)) + (b"R" if read else b"") + bytes((0x34 | bits,))
+
+
+SHIFT_CLOCKS = {read: {"0": _clock(0, 0, read), "1": _clock(0, 1, read)} for read in (False, True)}
+SCAN_ENTER = _clock(0, 0) * 2                 # Select -> Capture -> Shift
+SCAN_EXIT = _clock(1, 0) + _clock(0, 0)       # Exit1 -> Update -> Run-Test/Idle
+
+
+class JtagClient:
+    """
+    Client remote_bitbang tối giản thay cho OpenOCD: có read/read_block/write như
+    DebugModuleInterface nên dùng được với DMI.read_memory/write_memory. Scan chỉ ghi được
+    gom lại và gửi chung với lần đọc kế tiếp.
+
+        client = JtagClient(port=9824)
+        client.write(DMCONTROL, DMCONTROL_DMACTIVE | DMCONTROL_HALTREQ)
+        words = read_memory(client, 0x0, 1024)
+    """
+
+    def __init__(self, host="127.0.0.1", port=9824):
+        self.sock = socket.create_connection((host, port))
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.pending = bytearray()   # Chuỗi bitbang chưa gửi
+        self.ir = None
+        self.pending += b"".join(_clock(1, 0) for _ in range(5)) + _clock(0, 0)  # Về Run-Test/Idle
+
+    def close(self):
+        self.sock.sendall(bytes(self.pending) + b"Q")
+        self.sock.close()
+
+    def _scan(self, value, length, read):
+        """Shift length bit từ Select-DR/IR-Scan (LSB trước) rồi về Run-Test/Idle."""
+        shift = SHIFT_CLOCKS[read]
+        bits = format(value & ((1 << length) - 1), f"0{length}b")
+        last = _clock(1, int(bits[0]), read)  # Bit cuối (MSB) với TMS = 1 -> Exit1
+        return SCAN_ENTER + b"".join(shift[bit] for bit in bits[:0:-1]) + last + SCAN_EXIT
+
+    def _select_ir(self, ir):
+        if self.ir != ir:
+            self.pending += _clock(1, 0) + _clock(1, 0) + self._scan(ir, IR_LENGTH, False)
+            self.ir = ir
+
+    def _dr_scan(self, value, length, read):
+        self.pending += _clock(1, 0) + self._scan(value, length, read)
+
+    def _flush(self, bits):
+        """Gửi chuỗi đang chờ và trả về đúng bits ký tự TDO ('0'/'1') server gửi lại."""
+        self.sock.sendall(bytes(self.pending))
+        self.pending.clear()
+        data = b""
+        while len(data) < bits:
+            chunk = self.sock.recv(RECV_SIZE)
+            if not chunk:
+                raise ConnectionError("JTAG server closed the connection")
+            data += chunk
+        return data
+
+    @staticmethod
+    def _value(tdo):
+        return int(tdo[::-1].decode(), 2)
+
+    def read_dr(self, ir, length):
+        self._select_ir(ir)
+        self._dr_scan(0, length, True)
+        return self._value(self._flush(length))
+
+    def idcode(self):
+        return self.read_dr(IR_IDCODE, 32)
+
+    def dtmcs(self):
+        return self.read_dr(IR_DTMCS, 32)
+
+    def write(self, address, value):
+        self._select_ir(IR_DMI)
+        self._dr_scan((address << 34) | ((value & 0xFFFFFFFF) << 2) | DMI_OP_WRITE, DMI_LENGTH, False)
+
+    def read(self, address):
+        return self.read_block(address, 1)[0]
+
+    def read_block(self, address, count):
+        """
+        count lần đọc DMI cùng address trong một round trip: mỗi scan trả về kết quả của scan
+        trước nên cần count + 1 scan, chỉ count scan sau cùng đọc TDO.
+        """
+        self._select_ir(IR_DMI)
+        request = (address << 34) | DMI_OP_READ
+        for i in range(count):
+            self._dr_scan(request, DMI_LENGTH, i > 0)
+        self._dr_scan(DMI_OP_NOP, DMI_LENGTH, True)
+        tdo = self._flush(count * DMI_LENGTH)
+        values = []
+        for i in range(count):
+            value = self._value(tdo[i * DMI_LENGTH:(i + 1) * DMI_LENGTH])
+            if value & 0x3:
+                raise ConnectionError(f"DMI access failed (op = {value & 0x3})")
+            values.append((value >> 2) & 0xFFFFFFFF)
+        return values
+
+
+def main(argv=None):
+    from CLI import jtag_main  # Tham số dòng lệnh dùng chung với "CLI.py jtag"
+    return jtag_main(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,259 @@
+import hashlib
+import json
+import os
+
+import RISCV_asembler as asm
+
+# Linker cho object relocatable của RISCV_asembler.assemble_object(): ghép .text/.data của
+# nhiều object theo memory map, gán địa chỉ cho symbol và vá relocation, trả về ProgramImage
+# nạp thẳng vào RISCV_ISS.load_image().
+#
+#   image = link([asm.assemble_object(src, "main.s"), runtime], memory_map={".data": 0x3000})
+#   image = build(["main.s", "runtime/trap.s", "runtime/printf.s"], ObjectCache(".objcache"))
+#
+# Giá trị của relocation giống hệt khi dịch một file: branch/jal lấy symbol - địa chỉ lệnh, các
+# kiểu còn lại lấy địa chỉ tuyệt đối của symbol (%hi cho lui, %lo cho lệnh I/S, cả địa chỉ cho
+# cặp lui + addi của li/la), nên link các file bằng cách nối nguồn cho cùng mã máy.
+#
+# Memory map (linker script) là các dòng "SECTION = ĐỊA CHỈ" và tuỳ chọn "ENTRY = SYMBOL":
+#   .text = 0x0
+#   .data = 0x3000      # bỏ trống: trang 4 KiB đầu tiên sau .text
+#   ENTRY = _start
+#
+# Image đã link được ghi ra file .img (JSON, giữ .text/.data, địa chỉ của chúng và entry) và
+# nạp lại bằng load_image(); text.bin chỉ biểu diễn được code nạp tại 0 và chạy từ 0.
+#
+# ObjectCache lưu object theo hash nội dung nguồn và phiên bản assembler: file không đổi
+# không bao giờ bị dịch lại, kể cả giữa các lần chạy khi có thư mục cache.
+
+DATA_ALIGN = 0x1000
+IMAGE_SUFFIX = ".img"
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "riscv-objects")
+
+
+class LinkError(ValueError):
+    """Object có lỗi dịch, symbol chưa định nghĩa hoặc định nghĩa trùng."""
+
+
+def parse_memory_map(text):
+    """Đọc linker script ("SECTION = ĐỊA CHỈ", "ENTRY = SYMBOL", '#' là chú thích) thành dict."""
+    memory_map = {}
+    for number, line in enumerate(text.splitlines(), 1):
+        line = line.split("#", 1)[0].strip()
+        if not line:
+            continue
+        key, sep, value = (part.strip() for part in line.partition("="))
+        if not sep or key not in (".text", ".data", "ENTRY"):
+            raise LinkError(f"Memory map line {number}: expected '.text|.data|ENTRY = VALUE'")
+        memory_map[key] = value if key == "ENTRY" else int(value, 0)
+    return memory_map
+
+
+# Vá field immediate của lệnh theo cách encoder tương ứng đặt bit (xem encode_*_type)
+
+def _patch_branch(word, value):
+    return (word & 0x01FFF07F) | ((value >> 12) & 1) << 31 | ((value >> 5) & 0x3F) << 25 \
+        | ((value >> 1) & 0xF) << 8 | ((value >> 11) & 1) << 7
+
+
+def _patch_jal(word, value):
+    return (word & 0xFFF) | ((value >> 20) & 1) << 31 | ((value >> 1) & 0x3FF) << 21 \
+        | ((value >> 11) & 1) << 20 | ((value >> 12) & 0xFF) << 12
+
+
+def _patch_u(word, value):
+    return (word & 0xFFF) | asm.hi20(value) << 12
+
+
+def _patch_i(word, value):
+    return (word & 0xFFFFF) | (value & 0xFFF) << 20
+
+
+def _patch_s(word, value):
+    return (word & 0x01FFF07F) | ((value >> 5) & 0x7F) << 25 | (value & 0x1F) << 7
+
+
+PATCHES = {"branch": _patch_branch, "jal": _patch_jal, "u": _patch_u, "i": _patch_i, "s": _patch_s}
+
+
+def _relocate(text, offset, kind, value):
+    word = int.from_bytes(text[offset:offset + 4], "little")
+    if kind == "pair":
+        # li/la: lui %hi + addi %lo
+        text[offset:offset + 4] = _patch_u(word, value).to_bytes(4, "little")
+        low = int.from_bytes(text[offset + 4:offset + 8], "little")
+        text[offset + 4:offset + 8] = _patch_i(low, value).to_bytes(4, "little")
+    else:
+        text[offset:offset + 4] = PATCHES[kind](word, value).to_bytes(4, "little")
+
+
+def link(objects, memory_map=None):
+    """
+    Ghép các object thành ProgramImage.
+
+    Args:
+        objects: Danh sách ObjectFile, đặt vào .text/.data theo thứ tự.
+        memory_map: dict từ parse_memory_map() (thiếu .text = 0, thiếu .data = trang 4 KiB
+            đầu tiên sau .text, thiếu ENTRY = _start nếu có, ngược lại đầu .text).
+
+    Raises:
+        LinkError: Object có lỗi dịch, symbol chưa định nghĩa hoặc định nghĩa ở hai object.
+    """
+    memory_map = memory_map or {}
+    errors = [f"{obj.name}: {error}" for obj in objects for error in obj.errors]
+    if errors:
+        raise LinkError("\n".join(errors))
+
+    text_base = memory_map.get(".text", 0)
+    text_offsets, data_offsets = [], []
+    text_size = data_size = 0
+    for obj in objects:
+        data_size += -data_size % 4  # .data của mỗi object bắt đầu ở biên word
+        text_offsets.append(text_size)
+        data_offsets.append(data_size)
+        text_size += len(obj.text)
+        data_size += len(obj.data)
+    data_base = memory_map.get(".data")
+    if data_base is None:
+        data_base = default_data_base(text_base, text_size)
+    if text_size and data_size and text_base < data_base + data_size and data_base < text_base + text_size:
+        raise LinkError(f".text (0x{text_base:x}-0x{text_base + text_size:x}) overlaps "
+                        f".data (0x{data_base:x}-0x{data_base + data_size:x})")
+
+    symbols, defined_in = {}, {}
+    for obj, text_offset, data_offset in zip(objects, text_offsets, data_offsets):
+        for name, (section, offset) in obj.symbols.items():
+            if name in defined_in:
+                raise LinkError(f"Symbol {name} defined in both {defined_in[name]} and {obj.name}")
+            defined_in[name] = obj.name
+            if section == ".text":
+                symbols[name] = text_base + text_offset + offset
+            else:
+                symbols[name] = data_base + data_offset + offset
+
+    text = bytearray()
+    data = bytearray()
+    line_addresses = {}
+    undefined = []
+    for obj, text_offset, data_offset in zip(objects, text_offsets, data_offsets):
+        text += obj.text
+        data += bytes(data_offset - len(data)) + obj.data
+        for line, offset in obj.line_addresses.items():
+            line_addresses[(obj.name, line)] = text_base + text_offset + offset
+        for offset, kind, symbol in obj.relocations:
+            if symbol not in symbols:
+                undefined.append(f"{obj.name}: undefined symbol {symbol}")
+                continue
+            value = symbols[symbol]
+            if kind in asm.PC_RELATIVE_KINDS:
+                value -= text_base + text_offset + offset
+            _relocate(text, text_offset + offset, kind, value)
+    if undefined:
+        raise LinkError("\n".join(undefined))
+
+    entry = memory_map.get("ENTRY", "_start")
+    if entry in symbols:
+        entry = symbols[entry]
+    elif "ENTRY" in memory_map:
+        raise LinkError(f"Entry symbol {entry} is not defined")
+    else:
+        entry = text_base
+    return asm.ProgramImage(text, data, data_base, entry, symbols, line_addresses, text_base=text_base)
+
+
+class ObjectCache:
+    """
+    Object đã dịch theo hash (phiên bản assembler + nội dung nguồn).
+
+    Args:
+        directory: Thư mục lưu object (JSON, một file mỗi hash); None chỉ cache trong bộ nhớ.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self.objects = {}
+        self.assembled = 0
+        self.reused = 0
+        self._version = None
+
+    def version(self):
+        # Object cũ không dùng lại được khi assembler thay đổi
+        if self._version is None:
+            with open(asm.__file__, "rb") as f:
+                self._version = hashlib.sha256(f.read()).hexdigest()
+        return self._version
+
+    def key(self, source):
+        return hashlib.sha256(self.version().encode() + b"\0" + source.encode()).hexdigest()
+
+    def get(self, path):
+        """ObjectFile của file nguồn path, chỉ dịch khi nội dung chưa có trong cache."""
+        with open(path) as f:
+            source = f.read()
+        return self.get_source(source, os.path.basename(path))
+
+    def get_source(self, source, name="<source>"):
+        key = self.key(source)
+        obj = self.objects.get(key)
+        cache_path = os.path.join(self.directory, key + ".json") if self.directory else None
+        if obj is None and cache_path and os.path.exists(cache_path):
+            with open(cache_path) as f:
+                obj = asm.ObjectFile.from_dict(json.load(f))
+        if obj is None:
+            obj = asm.assemble_object(source, name)
+            self.assembled += 1
+            if cache_path:
+                os.makedirs(self.directory, exist_ok=True)
+                temporary = f"{cache_path}.{os.getpid()}.tmp"
+                with open(temporary, "w") as f:
+                    json.dump(obj.to_dict(), f)
+                os.replace(temporary, cache_path)  # Nhiều build song song không đọc file dở
+        else:
+            self.reused += 1
+        self.objects[key] = obj
+        if obj.name != name:
+            # Cùng nội dung dưới tên khác: object dùng chung bytes, chỉ khác tên
+            obj = asm.ObjectFile(name, obj.text, obj.data, obj.symbols, obj.relocations,
+                                 obj.line_addresses, obj.errors)
+        return obj
+
+
+def load_object(path):
+    """Đọc object relocatable do "assemble --object" ghi ra."""
+    with open(path) as f:
+        return asm.ObjectFile.from_dict(json.load(f))
+
+
+def save_object(obj, path):
+    with open(path, "w") as f:
+        json.dump(obj.to_dict(), f)
+
+
+def load_image(path):
+    """Đọc ProgramImage do save_image() ("link -o FILE.img") ghi ra."""
+    with open(path) as f:
+        return asm.ProgramImage.from_dict(json.load(f))
+
+
+def save_image(image, path):
+    with open(path, "w") as f:
+        json.dump(image.to_dict(), f)
+
+
+def default_data_base(text_base, text_size):
+    """Trang 4 KiB đầu tiên sau .text (như assemble_file khi không có data_base)."""
+    return (text_base + text_size + DATA_ALIGN - 1) & ~(DATA_ALIGN - 1)
+
+
+def build(paths, cache=None, memory_map=None):
+    """
+    Dịch (qua cache) và link một chương trình từ các file .s và object .o.
+
+    Args:
+        paths: File nguồn .s hoặc object .o, theo thứ tự đặt vào bộ nhớ.
+        cache: ObjectCache (mặc định cache trong bộ nhớ, chỉ sống trong lần gọi).
+        memory_map: Như link().
+    """
+    cache = cache or ObjectCache()
+    objects = [load_object(path) if path.endswith(".o") else cache.get(path) for path in paths]
+    return link(objects, memory_map)
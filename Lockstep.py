@@ -0,0 +1,396 @@
+import argparse
+import os
+import struct
+import sys
+import time
+
+from ISS import RISCV_ISS
+from Trace import RetireCapture, REC_RD_WRITE, REC_MEM_READ, REC_MEM_WRITE
+
+# Lockstep co-simulation: RISCV_ISS làm reference model, được điều khiển bởi
+# một process khác (RTL simulator hoặc script thay thế).
+#
+# Phía RTL gửi từng lô (batch) record của các lệnh đã retire; ISS chạy từng lệnh,
+# so sánh PC / rd / ghi bộ nhớ và trả về kết quả theo lô. Trap và ngắt mà RTL
+# báo về được đưa thẳng vào ISS để hai bên luôn đồng bộ.
+#
+# Message: type(I) length(I) + payload
+#   MSG_BATCH    : n x STEP_RECORD
+#   MSG_VERDICTS : checked(I) mismatches(I) + mismatches x VERDICT_RECORD
+#   MSG_END      : (trống) -> ISS trả MSG_END với tổng số lệnh đã kiểm tra
+
+MSG_BATCH = 1
+MSG_VERDICTS = 2
+MSG_END = 3
+
+MESSAGE_HEADER = struct.Struct("<II")
+
+# kind, rd, priv, flags, pc, instr, rd_value, mem_addr, mem_data
+STEP_RECORD = struct.Struct("<BBBBIIIII")
+KIND_COMMIT = 0
+KIND_TRAP = 1       # Exception tại pc: instr = cause code, rd_value = tval
+KIND_INTERRUPT = 2  # Ngắt trước lệnh tại pc: instr = cause code
+
+# index, mismatch mask, ISS pc, ISS instr, ISS rd_value, ISS mem_addr, ISS mem_data
+VERDICT_RECORD = struct.Struct("<IIIIIII")
+VERDICT_HEADER = struct.Struct("<II")
+MISMATCH_PC = 0x1
+MISMATCH_INSTR = 0x2
+MISMATCH_RD = 0x4
+MISMATCH_MEM = 0x8
+MISMATCH_PRIV = 0x10
+MISMATCH_END = 0x20        # ISS đã tới cuối chương trình (word 0) trong khi RTL vẫn retire
+MISMATCH_EXCEPTION = 0x40  # ISS ném exception Python (vd. NotImplementedError) khi chạy lệnh
+
+
+class LockstepChecker:
+    """So sánh record do RTL báo về với RISCV_ISS, từng lô một."""
+
+    def __init__(self, iss: RISCV_ISS, check_priv=True):
+        self.iss = iss
+        self.check_priv = check_priv
+        self.checked = 0
+        self.capture = RetireCapture()
+
+    def check_batch(self, payload):
+        """Trả về (số record đã kiểm tra, danh sách verdict lệch). Dừng ở chỗ lệch đầu tiên."""
+        iss = self.iss
+        capture = self.capture
+        saved_tracer = iss.tracer
+        iss.tracer = capture
+        mismatches = []
+        checked = 0
+        try:
+            for index, rec in enumerate(STEP_RECORD.iter_unpack(payload)):
+                kind, rd, priv, flags, pc, instr, rd_value, mem_addr, mem_data = rec
+                checked += 1
+                mask = 0
+                iss_pc = iss.pc
+                iss_instr = instr
+                if iss_pc != pc:
+                    mask |= MISMATCH_PC
+                if kind == KIND_TRAP:
+                    iss.pc = (pc + 4) & 0xFFFFFFFF
+                    iss.csrs["scause"].set_cause(instr)
+                    iss.enter_trap(instr, rd_value)
+                elif kind == KIND_INTERRUPT:
+                    iss.pc = pc
+                    iss.raise_interrupt(instr)
+                else:
+                    iss_instr = iss.load_word(iss_pc)
+                    if iss_instr != instr:
+                        mask |= MISMATCH_INSTR
+                    if self.check_priv and iss.privilege_level != priv:
+                        mask |= MISMATCH_PRIV
+                    if iss_instr == 0:
+                        # step() sẽ in "Simulation completed!" và exit() cả process
+                        mismatches.append((index, mask | MISMATCH_END, iss_pc, iss_instr, 0, 0, 0))
+                        break
+                    try:
+                        iss.step()
+                    except Exception:
+                        mismatches.append((index, mask | MISMATCH_EXCEPTION, iss_pc, iss_instr, 0, 0, 0))
+                        break
+                    if (flags & REC_RD_WRITE) != (capture.flags & REC_RD_WRITE) or \
+                       (flags & REC_RD_WRITE and (rd != capture.rd or rd_value != capture.rd_value)):
+                        mask |= MISMATCH_RD
+                    mem_flags = REC_MEM_READ | REC_MEM_WRITE
+                    if (flags & mem_flags) != (capture.flags & mem_flags) or \
+                       (flags & mem_flags and mem_addr != capture.mem_addr) or \
+                       (flags & REC_MEM_WRITE and mem_data != capture.mem_data):
+                        mask |= MISMATCH_MEM
+                if mask:
+                    mismatches.append((index, mask, iss_pc, iss_instr,
+                                       capture.rd_value, capture.mem_addr, capture.mem_data))
+                    break
+        finally:
+            iss.tracer = saved_tracer
+        self.checked += checked
+        return checked, mismatches
+
+
+# ---------------------------------------------------------------- transports
+
+class PipeTransport:
+    """Truyền message qua một cặp file nhị phân (pipe, stdin/stdout, socket.makefile)."""
+
+    def __init__(self, rfile, wfile):
+        self.rfile = rfile
+        self.wfile = wfile
+
+    def send(self, msg_type, payload=b""):
+        self.wfile.write(MESSAGE_HEADER.pack(msg_type, len(payload)))
+        self.wfile.write(payload)
+        self.wfile.flush()
+
+    def _read_exact(self, n):
+        data = self.rfile.read(n)
+        while len(data) < n:
+            more = self.rfile.read(n - len(data))
+            if not more:
+                raise EOFError("Lockstep peer closed the pipe")
+            data += more
+        return data
+
+    def recv(self):
+        msg_type, length = MESSAGE_HEADER.unpack(self._read_exact(MESSAGE_HEADER.size))
+        return msg_type, self._read_exact(length) if length else b""
+
+    def close(self):
+        self.wfile.close()
+
+
+class SharedMemoryRing:
+    """
+    Ring buffer một chiều (1 producer, 1 consumer) trên multiprocessing.shared_memory.
+
+    8 byte đầu là head (tổng số byte đã ghi), 8 byte tiếp là tail (đã đọc).
+    """
+
+    CONTROL = struct.Struct("<QQ")
+
+    def __init__(self, name, capacity=1 << 20, create=False):
+        from multiprocessing import resource_tracker, shared_memory
+        self.capacity = capacity
+        self.shm = shared_memory.SharedMemory(name=name, create=create,
+                                              size=self.CONTROL.size + capacity)
+        self.buf = self.shm.buf
+        if create:
+            self.CONTROL.pack_into(self.buf, 0, 0, 0)
+        else:
+            # Chỉ process tạo ring mới được unlink nó khi kết thúc
+            resource_tracker.unregister(self.shm._name, "shared_memory")
+
+    def _positions(self):
+        return self.CONTROL.unpack_from(self.buf, 0)
+
+    def write(self, data):
+        n = len(data)
+        if n > self.capacity:
+            raise ValueError("Message larger than shared-memory ring")
+        delay = 0
+        while True:
+            head, tail = self._positions()
+            if self.capacity - (head - tail) >= n:
+                break
+            time.sleep(delay)
+            delay = min(delay + 1e-5, 1e-3)
+        start = head % self.capacity
+        first = min(n, self.capacity - start)
+        base = self.CONTROL.size
+        self.buf[base + start:base + start + first] = data[:first]
+        if first < n:
+            self.buf[base:base + n - first] = data[first:]
+        struct.pack_into("<Q", self.buf, 0, head + n)
+
+    def read(self, n):
+        delay = 0
+        while True:
+            head, tail = self._positions()
+            if head - tail >= n:
+                break
+            time.sleep(delay)
+            delay = min(delay + 1e-5, 1e-3)
+        start = tail % self.capacity
+        first = min(n, self.capacity - start)
+        base = self.CONTROL.size
+        data = bytes(self.buf[base + start:base + start + first])
+        if first < n:
+            data += bytes(self.buf[base:base + n - first])
+        struct.pack_into("<Q", self.buf, 8, tail + n)
+        return data
+
+    def close(self, unlink=False):
+        self.buf = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+class SharedMemoryTransport:
+    """Hai SharedMemoryRing "<name>.req" (RTL -> ISS) và "<name>.rsp" (ISS -> RTL)."""
+
+    def __init__(self, name, server, capacity=1 << 20, create=False):
+        req = SharedMemoryRing(f"{name}_req", capacity, create)
+        rsp = SharedMemoryRing(f"{name}_rsp", capacity, create)
+        self.owner = create
+        self.rx, self.tx = (req, rsp) if server else (rsp, req)
+
+    def send(self, msg_type, payload=b""):
+        self.tx.write(MESSAGE_HEADER.pack(msg_type, len(payload)) + payload)
+
+    def recv(self):
+        msg_type, length = MESSAGE_HEADER.unpack(self.rx.read(MESSAGE_HEADER.size))
+        return msg_type, self.rx.read(length) if length else b""
+
+    def close(self):
+        self.rx.close(self.owner)
+        self.tx.close(self.owner)
+
+
+# ------------------------------------------------------------ server / client
+
+class LockstepServer:
+    """Phía ISS: nhận lô record, kiểm tra và trả verdict cho tới khi nhận MSG_END."""
+
+    def __init__(self, iss: RISCV_ISS, transport, check_priv=True):
+        self.checker = LockstepChecker(iss, check_priv)
+        self.transport = transport
+
+    def serve(self):
+        transport = self.transport
+        while True:
+            msg_type, payload = transport.recv()
+            if msg_type == MSG_BATCH:
+                checked, mismatches = self.checker.check_batch(payload)
+                reply = bytearray(VERDICT_HEADER.pack(checked, len(mismatches)))
+                for verdict in mismatches:
+                    reply += VERDICT_RECORD.pack(*verdict)
+                transport.send(MSG_VERDICTS, bytes(reply))
+            elif msg_type == MSG_END:
+                transport.send(MSG_END, struct.pack("<Q", self.checker.checked))
+                return self.checker.checked
+            else:
+                raise ValueError(f"Unknown lockstep message type {msg_type}")
+
+
+class LockstepClient:
+    """Phía RTL: gom record thành lô, gửi sang ISS và nhận verdict."""
+
+    def __init__(self, transport, batch_size=512):
+        self.transport = transport
+        self.batch_size = batch_size
+        self.pending = bytearray()
+        self.pending_count = 0
+        self.checked = 0
+        self.mismatches = []
+
+    def commit(self, pc, instr, rd=0, rd_value=0, mem_addr=0, mem_data=0, flags=0, priv=0):
+        STEP_RECORD.pack_into(self._slot(), len(self.pending) - STEP_RECORD.size, KIND_COMMIT,
+                              rd, priv, flags, pc, instr, rd_value & 0xFFFFFFFF, mem_addr, mem_data & 0xFFFFFFFF)
+        return self._maybe_flush()
+
+    def trap(self, pc, cause, tval=0, priv=0):
+        STEP_RECORD.pack_into(self._slot(), len(self.pending) - STEP_RECORD.size, KIND_TRAP,
+                              0, priv, 0, pc, cause, tval & 0xFFFFFFFF, 0, 0)
+        return self._maybe_flush()
+
+    def interrupt(self, pc, cause, priv=0):
+        STEP_RECORD.pack_into(self._slot(), len(self.pending) - STEP_RECORD.size, KIND_INTERRUPT,
+                              0, priv, 0, pc, cause, 0, 0, 0)
+        return self._maybe_flush()
+
+    def _slot(self):
+        self.pending += bytes(STEP_RECORD.size)
+        self.pending_count += 1
+        return self.pending
+
+    def _maybe_flush(self):
+        if self.pending_count >= self.batch_size:
+            return self.flush()
+        return []
+
+    def flush(self):
+        """Gửi lô hiện tại, trả về danh sách verdict lệch (rỗng nếu khớp)."""
+        if not self.pending_count:
+            return []
+        self.transport.send(MSG_BATCH, bytes(self.pending))
+        self.pending = bytearray()
+        self.pending_count = 0
+        msg_type, payload = self.transport.recv()
+        checked, n = VERDICT_HEADER.unpack_from(payload, 0)
+        self.checked += checked
+        verdicts = [VERDICT_RECORD.unpack_from(payload, VERDICT_HEADER.size + i * VERDICT_RECORD.size)
+                    for i in range(n)]
+        self.mismatches.extend(verdicts)
+        return verdicts
+
+    def finish(self):
+        self.flush()
+        self.transport.send(MSG_END)
+        _, payload = self.transport.recv()
+        return struct.unpack("<Q", payload)[0]
+
+
+def format_verdict(verdict):
+    index, mask, pc, instr, rd_value, mem_addr, mem_data = verdict
+    fields = [name for bit, name in ((MISMATCH_PC, "pc"), (MISMATCH_INSTR, "instr"), (MISMATCH_RD, "rd"),
+                                     (MISMATCH_MEM, "mem"), (MISMATCH_PRIV, "priv"),
+                                     (MISMATCH_END, "end of program"),
+                                     (MISMATCH_EXCEPTION, "exception")) if mask & bit]
+    return (f"Mismatch ({', '.join(fields)}) at batch record {index}: ISS pc=0x{pc:08x} "
+            f"instr=0x{instr:08x} rd=0x{rd_value:08x} mem[0x{mem_addr:08x}]=0x{mem_data:08x}")
+
+
+def run_standin_rtl(client, image, max_instructions):
+    """Script thay thế RTL: một RISCV_ISS thứ hai đóng vai DUT và đẩy record sang reference model."""
+    dut = RISCV_ISS()
+    dut.verbose = False
+    dut.load_program_from_binary_file(image)
+    capture = RetireCapture()
+    dut.tracer = capture
+    for _ in range(max_instructions):
+        pc = dut.pc
+        instr = dut.load_word(pc)
+        if instr == 0:
+            break
+        priv = dut.privilege_level
+        dut.step()
+        verdicts = client.commit(pc, instr, capture.rd, capture.rd_value, capture.mem_addr,
+                                 capture.mem_data, capture.flags, priv)
+        if verdicts:
+            return verdicts
+    return client.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Lockstep co-simulation bridge for RISCV_ISS")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("serve", help="run the ISS reference model")
+    p.add_argument("image", help="text.bin program image")
+    p.add_argument("--shm", metavar="NAME", help="use shared-memory rings instead of stdin/stdout")
+
+    p = sub.add_parser("demo", help="drive a reference model with a stand-in RTL (second ISS)")
+    p.add_argument("image")
+    p.add_argument("--shm", metavar="NAME")
+    p.add_argument("--batch", type=int, default=512)
+    p.add_argument("--max", type=int, default=100000)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        iss = RISCV_ISS()
+        iss.verbose = False
+        iss.load_program_from_binary_file(args.image)
+        if args.shm:
+            transport = SharedMemoryTransport(args.shm, server=True)
+        else:
+            transport = PipeTransport(sys.stdin.buffer, sys.stdout.buffer)
+        LockstepServer(iss, transport).serve()
+        transport.close()
+        return 0
+
+    import subprocess
+    cmd = [sys.executable, os.path.abspath(__file__), "serve", args.image]
+    if args.shm:
+        transport = SharedMemoryTransport(args.shm, server=False, create=True)
+        server = subprocess.Popen(cmd + ["--shm", args.shm])
+    else:
+        server = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        transport = PipeTransport(server.stdout, server.stdin)
+    client = LockstepClient(transport, args.batch)
+    start = time.perf_counter()
+    verdicts = run_standin_rtl(client, args.image, args.max)
+    total = client.finish()
+    elapsed = time.perf_counter() - start
+    server.wait()
+    transport.close()
+    for verdict in verdicts:
+        print(format_verdict(verdict))
+    print(f"Checked {total} instruction(s) in {elapsed:.3f}s")
+    return 1 if verdicts else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,257 @@
+import argparse
+import contextlib
+import json
+import os
+import statistics
+import sys
+import time
+from functools import partial
+
+import RISCV_asembler as asm
+from Bench import host_info
+from DebugModule import DebugModule
+from ISS import RISCV_ISS
+
+# Microbenchmark cho từng lớp lệnh / thao tác riêng lẻ của RISCV_ISS.
+#
+# Lệnh được chạy qua đúng đường dispatch thật: step() -> dispatch[opcode] -> execute_*.
+# Bộ nhớ chứa BATCH bản sao của cùng một lệnh, pc được đặt lại về 0 sau mỗi BATCH lệnh.
+# Ngoài ra đo riêng: đọc/ghi CSR (CSR.py), vào trap qua raise_exception() và
+# DebugModule.check_breakpoint().
+#
+# Mỗi case: warm-up, tự chọn số lần lặp sao cho một mẫu dài ít nhất --min-time giây,
+# lấy --repeat mẫu; kết quả là median ns/op (đã trừ chi phí vòng lặp đo) kèm MAD.
+# --save ghi kết quả ra JSON, --baseline so sánh với file đã lưu trước đó.
+
+MEM_SIZE = 0x10000
+BATCH = 256              # Số bản sao của lệnh trong bộ nhớ
+DATA_BASE = 0x8000       # Vùng dữ liệu cho load/store (x31 trỏ vào đây)
+DATA_REG = 31
+
+
+def _word(bits):
+    return int(bits, 2)
+
+
+def _noop():
+    pass
+
+
+def _new_iss():
+    iss = RISCV_ISS(MEM_SIZE)
+    iss.verbose = False
+    iss.privilege_level = 0b01
+    iss.regs[5] = 0x1234
+    iss.regs[6] = 0x5678
+    iss.regs[7] = 3
+    iss.regs[DATA_REG] = DATA_BASE
+    return iss
+
+
+def _step_case(word, setup=None):
+    """Case chạy một lệnh qua step(): trả về (op, reset)."""
+    iss = _new_iss()
+    iss.load_program_words([word] * BATCH)
+
+    def reset():
+        iss.pc = 0
+        if setup is not None:
+            setup(iss)
+    return iss.step, reset
+
+
+def _jalr_setup(iss):
+    iss.regs[1] = 0  # jalr x1, 4(x1): x1 luôn bằng địa chỉ lệnh đang chạy
+
+
+def _ecall_case():
+    # ecall tại địa chỉ 0, stvec = 0 (direct): mỗi lần trap lại quay về chính lệnh ecall
+    iss = _new_iss()
+    iss.load_program_words([0x00000073])
+    iss.csrs["stvec"].write("0" * 32)
+
+    def reset():
+        iss.pc = 0
+        iss.privilege_level = 0b01
+    return iss.step, reset
+
+
+def _raise_exception_case():
+    iss = _new_iss()
+    return partial(iss.raise_exception, "Illegal instruction", None, 0), _noop
+
+
+def _csr_read_case(name):
+    iss = _new_iss()
+    return iss.csrs[name].read, _noop
+
+
+def _csr_write_case(name, value):
+    iss = _new_iss()
+    return partial(iss.csrs[name].write, f"{value:032b}"), _noop
+
+
+def _breakpoint_case(hit):
+    iss = _new_iss()
+    dm = DebugModule(iss)
+    for addr in range(0x1000, 0x1100, 4):
+        dm.set_breakpoint(addr)
+    if hit:
+        # Breakpoint trúng khi đang ở debug mode: chỉ đo phần kiểm tra, không vào vòng lặp lệnh debug
+        dm.in_debug_mode = True
+        dm.set_breakpoint(0)
+    iss.pc = 0
+    return dm.check_breakpoint, _noop
+
+
+# name -> hàm tạo (op, reset)
+CASES = {
+    "rtype.add": partial(_step_case, _word(asm.encode_r_type("add", 5, 6, 7))),
+    "rtype.sra": partial(_step_case, _word(asm.encode_r_type("sra", 5, 6, 7))),
+    "itype.addi": partial(_step_case, _word(asm.encode_i_type("addi", 5, 6, 1))),
+    "itype.slli": partial(_step_case, _word(asm.encode_i_type("slli", 5, 6, 3))),
+    "load.lw": partial(_step_case, _word(asm.encode_i_type("lw", 5, DATA_REG, 16))),
+    "load.lbu": partial(_step_case, _word(asm.encode_i_type("lbu", 5, DATA_REG, 16))),
+    "store.sw": partial(_step_case, _word(asm.encode_s_type("sw", 6, DATA_REG, 16))),
+    "utype.lui": partial(_step_case, _word(asm.encode_u_type("lui", 5, 0x12345))),
+    "utype.auipc": partial(_step_case, _word(asm.encode_u_type("auipc", 5, 0x12345))),
+    "branch.taken": partial(_step_case, _word(asm.encode_b_type("beq", 0, 0, 4))),
+    "branch.not_taken": partial(_step_case, _word(asm.encode_b_type("bne", 0, 0, 8))),
+    "jal": partial(_step_case, _word(asm.encode_j_type("jal", 0, 4))),
+    "jalr": partial(_step_case, _word(asm.encode_i_type("jalr", 1, 1, 4)), _jalr_setup),
+    "system.csrrw": partial(_step_case, _word(asm.encode_i_type("csrrw", 5, 6, 0x140))),
+    "system.csrrs": partial(_step_case, _word(asm.encode_i_type("csrrs", 5, 0, 0x100))),
+    "system.ecall": _ecall_case,
+    "csr.read.sscratch": partial(_csr_read_case, "sscratch"),
+    "csr.write.sscratch": partial(_csr_write_case, "sscratch", 0xDEADBEEF),
+    "csr.read.sstatus": partial(_csr_read_case, "sstatus"),
+    "csr.write.sstatus": partial(_csr_write_case, "sstatus", 0x00000002),
+    "trap.raise_exception": _raise_exception_case,
+    "debug.check_breakpoint": partial(_breakpoint_case, False),
+    "debug.check_breakpoint.hit": partial(_breakpoint_case, True),
+}
+
+
+def _time(op, reset, number):
+    """Thời gian (giây) cho number lần op(), reset() được gọi trước mỗi BATCH lần."""
+    batches, rest = divmod(number, BATCH)
+    inner = range(BATCH)
+    start = time.perf_counter()
+    for _ in range(batches):
+        reset()
+        for _ in inner:
+            op()
+    reset()
+    for _ in range(rest):
+        op()
+    return time.perf_counter() - start
+
+
+def _autorange(op, reset, min_time):
+    """Giống timeit.Timer.autorange: tăng number tới khi một mẫu dài ít nhất min_time giây."""
+    number = BATCH
+    while True:
+        if _time(op, reset, number) >= min_time:
+            return number
+        number *= 2
+
+
+def _mad(values):
+    median = statistics.median(values)
+    return statistics.median(abs(v - median) for v in values)
+
+
+def measure(op, reset, repeat=15, min_time=0.02, warmup=0.05):
+    """Đo một case, trả về dict: ns/op (median, min, MAD) sau khi trừ chi phí vòng lặp đo."""
+    deadline = time.perf_counter() + warmup
+    while time.perf_counter() < deadline:
+        _time(op, reset, BATCH)
+    number = _autorange(op, reset, min_time)
+    samples = [_time(op, reset, number) for _ in range(repeat)]
+    overhead = statistics.median(_time(_noop, _noop, number) for _ in range(repeat))
+    per_op = [max(s - overhead, 0.0) / number * 1e9 for s in samples]
+    return {
+        "ns_per_op": statistics.median(per_op),
+        "ns_min": min(per_op),
+        "ns_mad": _mad(per_op),
+        "number": number,
+        "repeat": repeat,
+    }
+
+
+def run_cases(names=None, repeat=15, min_time=0.02, warmup=0.05):
+    results = {}
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for name in names or CASES:
+            op, reset = CASES[name]()
+            results[name] = measure(op, reset, repeat, min_time, warmup)
+    return {"host": host_info(), "timestamp": time.time(), "results": results}
+
+
+def compare(report, baseline, threshold=0.15):
+    """
+    So sánh với baseline. Một case bị coi là chậm đi khi median tăng quá threshold
+    và quá 3 lần MAD (tương đối) của cả hai lần đo. Trả về danh sách (name, ratio, regressed).
+    """
+    rows = []
+    for name, cur in report["results"].items():
+        base = baseline["results"].get(name)
+        if base is None or base["ns_per_op"] <= 0:
+            continue
+        ratio = cur["ns_per_op"] / base["ns_per_op"]
+        noise = 3 * max(cur["ns_mad"] / max(cur["ns_per_op"], 1e-9), base["ns_mad"] / base["ns_per_op"])
+        rows.append((name, ratio, ratio > 1 + max(threshold, noise)))
+    return rows
+
+
+def format_results(report, rows=None):
+    ratios = {name: (ratio, regressed) for name, ratio, regressed in rows or ()}
+    header = f"{'case':28} {'ns/op':>10} {'min':>10} {'MAD':>8} {'number':>9}"
+    if rows is not None:
+        header += f" {'vs base':>9}"
+    lines = [header]
+    for name, r in report["results"].items():
+        line = (f"{name:28} {r['ns_per_op']:10.1f} {r['ns_min']:10.1f} "
+                f"{r['ns_mad']:8.1f} {r['number']:9d}")
+        if name in ratios:
+            ratio, regressed = ratios[name]
+            line += f" {(ratio - 1) * 100:+8.1f}%" + ("  REGRESSION" if regressed else "")
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-instruction-class microbenchmarks for RISCV_ISS")
+    parser.add_argument("cases", nargs="*", help="subset of cases (prefix match, e.g. 'csr' or 'load.lw')")
+    parser.add_argument("--repeat", type=int, default=15, help="samples per case (median is reported)")
+    parser.add_argument("--min-time", type=float, default=0.02, help="minimum seconds per sample")
+    parser.add_argument("--warmup", type=float, default=0.05, help="warm-up seconds per case")
+    parser.add_argument("--save", default=None, help="write results as JSON")
+    parser.add_argument("--baseline", default=None, help="compare against a JSON file written by --save")
+    parser.add_argument("--threshold", type=float, default=0.15, help="relative slowdown reported as regression")
+    parser.add_argument("--list", action="store_true", help="list cases and exit")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        print("\n".join(CASES))
+        return 0
+    names = [name for name in CASES if not args.cases or any(name.startswith(p) for p in args.cases)]
+    if not names:
+        parser.error(f"no case matches: {', '.join(args.cases)}")
+
+    report = run_cases(names, args.repeat, args.min_time, args.warmup)
+    rows = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            rows = compare(report, json.load(f), args.threshold)
+    print(format_results(report, rows))
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+    if rows and any(regressed for _, _, regressed in rows):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,6 @@
-import re
+import collections
 import struct
-text_file=0
+# re chỉ được import khi dịch lần đầu (tokenize) để import module nhanh
 # Định nghĩa các mã opcode và func3, func7
 opcode_map = {
     "add": ("0110011", "000", "0000000"),  # add rd, rs1, rs2
@@ -30,7 +30,7 @@ opcode_map = {
     "srai":  ("0010011", "101", "0100000"),# srai rd, rs1, imm
     "ori":  ("0010011", "110", ""),        # ori rd, rs1, imm
     "andi":  ("0010011", "111", ""),       # andi rd, rs1, imm
-    "jalr":  ("1101111", "", ""),          # jal rsd, imm *
+    "jalr":  ("1100111", "000", ""),       # jalr rd, rs1, imm
     "slti":  ("0010011", "010", ""),       # slti rd, rs1, imm
     "sltiu":  ("0010011", "011", ""),      # sltiu rd, rs1, imm
     "csrw":   ("1110011", "001", ""),      # csrw csr, rs1
@@ -46,13 +46,19 @@ opcode_map = {
     "blt":  ("1100011", "100", ""),        # blt rs1, rs2, offset
     "bge":  ("1100011", "101", ""),        # bge rs1, rs2, offset
     "bgeu":  ("1100011", "111", ""),       # bgeu rs1, rs2, offset
-    "bltu":  ("1100011", "111", ""),       # bltu rs1, rs2, offset
+    "bltu":  ("1100011", "110", ""),       # bltu rs1, rs2, offset
     
     "lui":  ("0110111", "", ""),           # lui rd, imm
+    "auipc":  ("0010111", "", ""),         # auipc rd, imm
     "jal":  ("1101111", "", ""),           # jal rsd, imm
     "j":  ("1101111", "", ""),             # j label
     
     "csrrw": ("1110011", "001", ""),
+    "csrrs": ("1110011", "010", ""),
+    "csrrc": ("1110011", "011", ""),
+    "csrrwi": ("1110011", "101", ""),      # rs1 là uimm 5 bit
+    "csrrsi": ("1110011", "110", ""),
+    "csrrci": ("1110011", "111", ""),
     "ecall": ("1110011", "000", "0000000"), # ecall
     "ebreak": ("1110011", "000", "000000000001"),# ebreak
     "sret": ("1110011", "000", "000100000010"),  # sret
@@ -87,7 +93,7 @@ def encode_s_type(inst, rs2, rs1, imm):
     opcode, func3, _ = opcode_map[inst]
     rs2_bin = format(rs2, '05b')
     rs1_bin = format(rs1, '05b')
-    imm_bin2 = format(imm & 0xfff, '05b')  # Chỉ lấy 5 bit cuối
+    imm_bin2 = format(imm & 0x1f, '05b')  # Chỉ lấy 5 bit cuối
     imm_bin1 = format((imm >> 5) & 0x7F, '07b')  # Lấy 7 bit đầu
     return imm_bin1 + rs2_bin + rs1_bin + func3 + imm_bin2 + opcode
 
@@ -134,320 +140,582 @@ def encode_j_type(inst, rd, imm):
     return instruction
 
 
-# Hàm chính để dịch lệnh
-def assemble(instruction):
-    # Loại bỏ các ký tự không mong muốn như dấu phẩy
-    instruction = instruction.replace(',', '')
-    
-    parts = instruction.split()
-    inst = parts[0]
-    
+# Thanh ghi: xN và tên ABI -> số thanh ghi
+REGISTERS = {f"x{i}": i for i in range(32)}
+REGISTERS.update({
+    "zero": 0, "ra": 1, "sp": 2, "gp": 3, "tp": 4,
+    "t0": 5, "t1": 6, "t2": 7,
+    "s0": 8, "fp": 8, "s1": 9,
+    "a0": 10, "a1": 11, "a2": 12, "a3": 13, "a4": 14, "a5": 15, "a6": 16, "a7": 17,
+    "s2": 18, "s3": 19, "s4": 20, "s5": 21, "s6": 22, "s7": 23,
+    "s8": 24, "s9": 25, "s10": 26, "s11": 27,
+    "t3": 28, "t4": 29, "t5": 30, "t6": 31,
+})
+
+# S-mode Control and Status Registers (CSR) - 11 Registers
+CSRS = {
+    "sstatus": 0x100,
+    "sie": 0x104,
+    "stvec": 0x105,
+    "scounteren": 0x106,
+    "senvcfg": 0x10A,
+    "sscratch": 0x140,
+    "sepc": 0x141,
+    "scause": 0x142,
+    "stval": 0x143,
+    "sip": 0x144,
+    "satp": 0x180,
+}
+
+R_TYPE = frozenset(["add", "sub", "sll", "slt", "sltu", "xor", "srl", "sra", "or", "and"])
+LOADS = frozenset(["lb", "lh", "lw", "ld", "lbu", "lhu"])
+I_ARITH = frozenset(["addi", "slti", "slli", "srli", "srai", "sltiu", "xori", "ori", "andi"])
+STORES = frozenset(["sb", "sh", "sw", "sd"])
+BRANCHES = frozenset(["beq", "bne", "blt", "bge", "bltu", "bgeu"])
+SYSTEM = {
+    "ecall": "00000000000000000000000001110011",
+    "ebreak": "00000000000100000000000001110011",
+    "sret": "00010000001000000000000001110011",
+    "mret": "00110000001000000000000001110011",
+    "mnret": "01110000001000000000000001110011",
+    "wfi": "00010000010100000000000001110011",
+}
+# Số toán hạng của từng lệnh (mặc định 3)
+OPERAND_COUNTS = dict.fromkeys(SYSTEM, 0)
+OPERAND_COUNTS.update(dict.fromkeys(LOADS | STORES, 2))
+OPERAND_COUNTS.update({"j": 1, "jal": 2, "lui": 2, "li": 2, "la": 2, "csrw": 2, "sfence.vma": 2})
+DATA_DIRECTIVES = (".word", ".half", ".byte", ".ascii")
+DATA_SIZES = {".word": 4, ".half": 2, ".byte": 1}
+
+# Lexer: một dòng -> Token MNEMONIC rồi các toán hạng có kiểu. value của REGISTER là số
+# thanh ghi, của IMMEDIATE là số nguyên, của SYMBOL là tên, của MEMORY là (offset, base).
+MNEMONIC, REGISTER, IMMEDIATE, SYMBOL, MEMORY = "mnemonic", "register", "immediate", "symbol", "memory"
+Token = collections.namedtuple("Token", "kind value text")
+
+TOKEN_PATTERN = r"""
+    (?P<memory>(?P<offset>[^\s,()]*)\(\s*(?P<base>[^\s,()]+)\s*\))
+  | (?P<immediate>[-+]?(?:0[xX][0-9a-fA-F]+|\d+))(?![\w.])
+  | (?P<name>[A-Za-z_.$][\w.$]*)
+  | (?P<separator>[\s,]+)
+  | (?P<invalid>\S)
+"""
+_patterns = None
+
+
+def _compiled_patterns():
+    global _patterns
+    if _patterns is None:
+        import re
+        _patterns = (re.compile(TOKEN_PATTERN, re.VERBOSE), re.compile(r'"(.*)"'))
+    return _patterns
+
+
+def _operand(text):
+    if text in REGISTERS:
+        return Token(REGISTER, REGISTERS[text], text)
+    if text.lstrip('+-')[:1].isdigit():
+        # Như bản cũ: có 'x' là hex, còn lại là thập phân ("010" = 10)
+        return Token(IMMEDIATE, int(text, 16) if 'x' in text.lower() else int(text), text)
+    return Token(SYMBOL, text, text)
+
+
+# Tách dòng lệnh thành Token (dùng chung cho lệnh và chỉ thị dữ liệu)
+def tokenize(line):
+    token_pattern = _compiled_patterns()[0]
+    parts = line.split(None, 1)
+    if not parts:
+        raise ValueError("Empty instruction")
+    tokens = [Token(MNEMONIC, parts[0], parts[0])]
+    if len(parts) == 2:
+        for match in token_pattern.finditer(parts[1]):
+            kind = match.lastgroup
+            if kind == "separator":
+                continue
+            text = match.group()
+            if kind == "memory":
+                offset = match.group("offset")
+                offset = _operand(offset) if offset else Token(IMMEDIATE, 0, "")
+                tokens.append(Token(MEMORY, (offset, _operand(match.group("base"))), text))
+            elif kind == "invalid":
+                raise ValueError(f"Unexpected character {text!r}")
+            else:
+                tokens.append(_operand(text))
+    return tokens
+
+
+class UndefinedSymbol(ValueError):
+    """Toán hạng dùng nhãn chưa khai báo (assemble_file dịch lại lệnh khi đủ bảng nhãn)."""
+
+
+def _register(token):
+    if token.kind != REGISTER:
+        raise ValueError(f"Expected a register: {token.text}")
+    return token.value
+
+
+# %hi/%lo của địa chỉ tuyệt đối: phần cao được làm tròn theo bit 11 vì phần thấp cộng có dấu
+def hi20(value):
+    return ((value + 0x800) >> 12) & 0xFFFFF
+
+
+def lo12(value):
+    return ((value & 0xFFF) ^ 0x800) - 0x800
+
+
+def _value(token, address, label_table, kind="pair"):
+    # Nhãn theo kiểu relocation của vị trí toán hạng (xem relocation_kind): branch/jal lấy offset
+    # so với địa chỉ lệnh, lui lấy %hi, lệnh I/S lấy %lo, li/la lấy cả địa chỉ tuyệt đối.
+    # Tên thanh ghi ở vị trí immediate cũng được tra như nhãn (nhãn "s0:" trong chương trình cũ).
+    if token.kind == IMMEDIATE:
+        return token.value
+    if token.kind in (SYMBOL, REGISTER):
+        if token.text not in label_table:
+            raise UndefinedSymbol(f"Undefined symbol: {token.text}")
+        value = label_table[token.text]
+        if kind in PC_RELATIVE_KINDS:
+            return value - address
+        if kind == "u":
+            return hi20(value)
+        return lo12(value) if kind in ("i", "s") else value
+    raise ValueError(f"Expected an immediate or label: {token.text}")
+
+
+def _memory(token, address, label_table, kind):
+    if token.kind != MEMORY:
+        raise ValueError(f"Expected offset(register): {token.text}")
+    offset, base = token.value
+    return _value(offset, address, label_table, kind), _register(base)
+
+
+def _csr(token):
+    if token.kind == SYMBOL and token.value in CSRS:
+        return CSRS[token.value]
+    if token.kind == IMMEDIATE:
+        return token.value
+    raise ValueError(f"Unknown CSR: {token.text}")
+
+
+# li/la: addi nếu vừa 12 bit, ngược lại (hoặc khi wide) lui + addi
+def _load_immediate(rd, imm, wide=False):
+    if -2048 <= imm <= 2047 and not wide:  # Trường hợp immediate nằm trong 12-bit
+        return encode_i_type("addi", rd, 0, imm)  # li rd, imm → addi rd, x0, imm
+    upper_20 = (imm >> 12) & 0xFFFFF  # Lấy 20 bit cao
+    lower_12 = imm & 0xFFF  # Lấy 12 bit thấp
+    if lower_12 & (1 << 11):  # Nếu bit thứ 11 của lower_12 = 1, cần tăng upper_20
+        upper_20 += 1
+    lui_code = encode_u_type("lui", rd, upper_20)  # lui rd, upper_20
+    low_code = encode_i_type("addi", rd, rd, lower_12)  # addi rd, rd, lower_12
+    return lui_code + '\n' + low_code
+
+
+# Dịch một lệnh đã tách Token; nhãn được thay bằng địa chỉ tuyệt đối (offset so với address
+# với branch/jal)
+def encode_instruction(tokens, address=0, label_table=None):
+    if label_table is None:
+        label_table = {}
+    inst = tokens[0].value
+    ops = tokens[1:]
+    count = OPERAND_COUNTS.get(inst, 3)
+    if len(ops) != count:
+        if inst not in opcode_map and inst not in ("li", "la"):
+            raise ValueError(f"Unknown instruction: {inst}")
+        raise ValueError(f"{inst} expects {count} operand(s), got {len(ops)}")
+
     #R-type
-    if inst in ["add", "sub", "sll", "slt", "sltu", "xor", "srl", "sra", "or", "and"]:
-        rd = int(parts[1][1:])  # Lấy số từ "rs1", "rs2".
-        rs1 = int(parts[2][1:])
-        rs2 = int(parts[3][1:])
-        return encode_r_type(inst, rd, rs1, rs2)
+    if inst in R_TYPE:
+        return encode_r_type(inst, _register(ops[0]), _register(ops[1]), _register(ops[2]))
     #I-type
-    elif inst in ["lb", "lh", "lw", "ld", "lbu", "lhu"]:
-        rd = int(parts[1][1:])
-        offset, rs1 = parts[2].split('(')
-        rs1 = int(rs1[:-1][1:])  # Lấy "x1" từ "(x1)"
-        offset = int(offset)
-        return encode_i_type(inst, rd, rs1, offset)
-    elif inst in ["addi", "slti","slli", "srli", "srai", "sltiu", "xori", "ori", "andi"]:
-        rd = int(parts[1][1:])
-        rs1 = int(parts[2][1:])
-        if 'x' in parts[3]:
-            imm = int(parts[3], 16)
-        else:
-            imm = int(parts[3])
-        return encode_i_type(inst, rd, rs1, imm)
-
+    elif inst in LOADS:
+        offset, rs1 = _memory(ops[1], address, label_table, "i")
+        return encode_i_type(inst, _register(ops[0]), rs1, offset)
+    elif inst in I_ARITH:
+        return encode_i_type(inst, _register(ops[0]), _register(ops[1]), _value(ops[2], address, label_table, "i"))
     #S-type
-    elif inst in ["sb","sh", "sw", "sd"]:
-        rs2 = int(parts[1][1:])
-        offset, rs1 = parts[2].split('(')
-        rs1 = int(rs1[:-1][1:])
-        offset = int(offset)
-        return encode_s_type(inst, rs2, rs1, offset)
+    elif inst in STORES:
+        offset, rs1 = _memory(ops[1], address, label_table, "s")
+        return encode_s_type(inst, _register(ops[0]), rs1, offset)
     #U-type
-    elif inst in ["lui"]:
-        # lui rd, imm
-        rd = int(parts[1][1:])
-        if 'x' in parts[2]:
-            imm = int(parts[2], 16)
-        else:
-            imm = int(parts[2])
-        return encode_u_type(inst, rd, imm)
+    elif inst == "lui":
+        return encode_u_type(inst, _register(ops[0]), _value(ops[1], address, label_table, "u"))
     #B-type
-    elif inst in ["beq", "bne", "blt", "bge", "bltu", "bgeu"]:
-        rs1 = int(parts[1][1:])  # Lấy số từ phần "rs1"
-        rs2 = int(parts[2][1:])  # Lấy số từ phần "rs2"
-        if 'x' in parts[3]:
-            imm = int(parts[3], 16)
-        else:
-            imm = int(parts[3])
-        return encode_b_type(inst, rs1, rs2, imm)
+    elif inst in BRANCHES:
+        return encode_b_type(inst, _register(ops[0]), _register(ops[1]),
+                             _value(ops[2], address, label_table, "branch"))
     #J-type
-    elif inst in ["jal"]:
-        rd = int(parts[1][1:])  # Lấy số từ phần "rd"
-        if 'x' in parts[2]:
-            imm = int(parts[2], 16)
-        else:
-            imm = int(parts[2])
-        return encode_j_type(inst, rd, imm)
-    elif inst in ["j"]:
-        rd = 0
-        imm = int(parts[1])
-        return encode_j_type(inst, rd, imm)
-    elif inst == "li":
-        rd = int(parts[1][1:])  # Lấy số từ "rd"
-        imm = int(parts[2], 0)  # Chuyển đổi tự động từ hex hoặc decimal
-        if -2048 <= imm <= 2047:  # Trường hợp immediate nằm trong 12-bit
-            return encode_i_type("addi", rd, 0, imm)  # li rd, imm → addi rd, x0, imm
-        else:  # Trường hợp immediate vượt quá 12-bit
-            upper_20 = (imm >> 12) & 0xFFFFF  # Lấy 20 bit cao
-            lower_12 = imm & 0xFFF  # Lấy 12 bit thấp
-
-            if lower_12 & (1 << 11):  # Nếu bit thứ 11 của lower_12 = 1, cần tăng upper_20
-                upper_20 += 1
-            
-            lui_code = encode_u_type("lui", rd, upper_20)  # lui rd, upper_20
-            addi_code = encode_i_type("addi", rd, rd, lower_12)  # addi rd, rd, lower_12
-
-            return lui_code + '\n' + addi_code
-    elif inst == "la":
-        rd = int(parts[1][1:])  # Lấy số từ "rd"
-        imm = int(parts[2], 0)  # Chuyển đổi tự động từ hex hoặc decimal
-        if -2048 <= imm <= 2047:  # Trường hợp immediate nằm trong 12-bit
-            return encode_i_type("addi", rd, 0, imm)  # li rd, imm → addi rd, x0, imm
-        else:  # Trường hợp immediate vượt quá 12-bit
-            upper_20 = (imm >> 12) & 0xFFFFF  # Lấy 20 bit cao
-            lower_12 = imm & 0xFFF  # Lấy 12 bit thấp
-
-            if lower_12 & (1 << 11):  # Nếu bit thứ 11 của lower_12 = 1, cần tăng upper_20
-                upper_20 += 1
-            
-            lui_code = encode_u_type("lui", rd, upper_20)  # lui rd, upper_20
-            addi_code = encode_i_type("addiw", rd, rd, lower_12)  # addi rd, rd, lower_12
-
-            return lui_code + '\n' + addi_code
-
-    elif inst in ["ecall", "ebreak", "sret", "mret", "mnret", "wfi", "sfence.vma", "csrrw"]:
-        if inst == "csrrw":
-            rd = int(parts[1][1:])   # Lấy số từ "x5" -> 5
-            csr = int(parts[2])# Địa chỉ CSR có thể là số hex (vd: 0x300 -> 768)
-            rs1 = int(parts[3][1:])  # Lấy số từ "x10" -> 10
-
-            opcode = "1110011"
-            funct3 = "001"
-
-            # Chuyển tất cả các giá trị thành chuỗi nhị phân với số bit tương ứng
-            rd_bin = f"{rd:05b}"   # 5-bit
-            rs1_bin = f"{rs1:05b}" # 5-bit
-            csr_bin = '000' + str(csr)
-            # Kết hợp các thành phần theo đúng cấu trúc
-            binary_code = csr_bin + rs1_bin + funct3 + rd_bin + opcode
-            return binary_code
-        if inst == "csrw":
-            csr = int(parts[1])# Địa chỉ CSR có thể là số hex (vd: 0x300 -> 768)
-            rs1 = int(parts[2][1:])  # Lấy số từ "x10" -> 10
-
-            opcode = "1110011"
-            funct3 = "001"
-
-            # Chuyển tất cả các giá trị thành chuỗi nhị phân với số bit tương ứng
-            rd_bin = "00000"   # 5-bit
-            rs1_bin = f"{rs1:05b}" # 5-bit
-            csr_bin = '000' + str(csr)
-            # Kết hợp các thành phần theo đúng cấu trúc
-            binary_code = csr_bin + rs1_bin + funct3 + rd_bin + opcode
-            return binary_code
-        if inst == "ecall":
-            return "00000000000000000000000001110011"
-        elif inst == "ebreak":
-            return "00000000000100000000000001110011"
-        elif inst == "sret":
-            return "00010000001000000000000001110011"
-        elif inst == "mret":
-            return "00110000001000000000000001110011"
-        elif inst == "mnret":
-            return "01110000001000000000000001110011"
-        elif inst == "wfi":
-            return "00010000010100000000000001110011"
-        elif inst == "sfence.vma":
-            rs1 = format(int(parts[1][1:]), '05b')  # Lấy số từ phần "rs1"
-            rs2 = format(int(parts[2][1:]), '05b') # Lấy số từ phần "rs2"
-            return "0001001" + rs2 + rs1 + "000000001110011"
-    else:
-        raise ValueError(f"Unknown instruction: {inst}")
-
-# Hàm đổi tên thanh ghi
-def replace_registers(instruction):
-    register_map = {
-    "zero": "x0", " ra": "x1", "sp": "x2", "gp": "x3", "tp ": "x4",
-    "t0": "x5", "t1": "x6", "t2": "x7",
-    "s0": "x8", "fp": "x8", "s1": "x9",
-    "a0": "x10", "a1": "x11", "a2": "x12", "a3": "x13", "a4": "x14", "a5": "x15",
-    "a6": "x16", "a7": "x17",
-    "s2": "x18", "s3": "x19", "s4": "x20", "s5": "x21", "s6": "x22", "s7": "x23",
-    "s8": "x24", "s9": "x25", "s10": "x26", "s11": "x27",
-    "t3": "x28", "t4": "x29", "t5": "x30", "t6": "x31",
-    # S-mode Control and Status Registers (CSR) - 11 Registers
-    "sstatus": "0100000000",
-    "stvec": "0100000101",
-    "sip": "0101000100",
-    "sie": "0100000100",
-    "scounteren": "0100000110",
-    "sscratch": "0101000000",
-    "sepc": "0101000001",
-    "scause": "0101000010",
-    "stval": "0101000011",
-    "senvcfg": "0100001010",
-    "satp": "0110000000",
-    }
-
-    for reg, num in register_map.items():
-        instruction = instruction.replace(reg, num)
+    elif inst == "jal":
+        return encode_j_type(inst, _register(ops[0]), _value(ops[1], address, label_table, "jal"))
+    elif inst == "j":
+        return encode_j_type(inst, 0, _value(ops[0], address, label_table, "jal"))
+    elif inst in ("li", "la"):
+        # Toán hạng là nhãn: luôn 2 lệnh để kích thước không phụ thuộc giá trị (xem instruction_size)
+        return _load_immediate(_register(ops[0]), _value(ops[1], address, label_table),
+                               wide=ops[1].kind != IMMEDIATE)
+    elif inst == "csrrw":
+        return format(_csr(ops[1]), '012b') + format(_register(ops[2]), '05b') + "001" + format(_register(ops[0]), '05b') + "1110011"
+    elif inst == "csrw":
+        # csrw csr, rs1 = csrrw x0, csr, rs1
+        return format(_csr(ops[0]), '012b') + format(_register(ops[1]), '05b') + "001" + "00000" + "1110011"
+    elif inst in SYSTEM:
+        return SYSTEM[inst]
+    elif inst == "sfence.vma":
+        return "0001001" + format(_register(ops[1]), '05b') + format(_register(ops[0]), '05b') + "000000001110011"
+    raise ValueError(f"Unknown instruction: {inst}")
+
+
+# Số byte mã máy của một lệnh, biết được ngay khi tách Token (trước khi có bảng nhãn)
+def instruction_size(tokens):
+    if tokens[0].value in ("li", "la") and len(tokens) == 3:
+        operand = tokens[2]
+        return 4 if operand.kind == IMMEDIATE and -2048 <= operand.value <= 2047 else 8
+    return 4
 
-    return instruction
 
-# Bảng địa chỉ nhãn
-def build_label_table(input_filename):
-    global text_file
-    label_table = {}
+# Hàm chính để dịch lệnh
+def assemble(instruction, address=0, label_table=None):
+    return encode_instruction(tokenize(instruction), address, label_table)
+
+# Dịch một chỉ thị dữ liệu, nối các byte vào memory
+def parse_data_directive(directive, memory):
+    if directive.startswith('.ascii'):
+        match = _compiled_patterns()[1].search(directive)
+        if match:
+            memory += match.group(1).encode('ascii')
+        return
+    tokens = tokenize(directive.split('#', 1)[0])
+    size = DATA_SIZES.get(tokens[0].value)
+    if size is None:
+        raise ValueError(f"Unknown directive: {tokens[0].value}")
+    for token in tokens[1:]:
+        if token.kind != IMMEDIATE:
+            raise ValueError(f"Expected a number: {token.text}")
+        memory += (token.value & ((1 << 8 * size) - 1)).to_bytes(size, 'little')  # little endian
+
+# Chia vùng dữ liệu thành từng từ 32-bit (4 byte, little endian) dạng chuỗi nhị phân
+def pack_data_words(memory):
+    memory = memory + bytes(-len(memory) % 4)  # Pad to multiple of 4 bytes
+    return [format(int.from_bytes(memory[i:i + 4], 'little'), '032b') for i in range(0, len(memory), 4)]
+
+class ProgramImage:
+    """
+    Chương trình đã dịch trong bộ nhớ; RISCV_ISS.load_image() nạp mỗi section bằng một lần
+    copy. text/data là bytes bất biến nên chia sẻ được giữa các process worker (pickle) mà
+    không phải dịch lại.
+
+    Args:
+        text: Mã máy (little endian), nạp tại text_base.
+        data: Vùng dữ liệu (.word/.half/.byte/.ascii), nạp tại data_base.
+        data_base: Địa chỉ vùng dữ liệu.
+        entry: Địa chỉ bắt đầu (nhãn _start nếu có, ngược lại text_base).
+        symbols: Nhãn -> địa chỉ (cả nhãn trong .data).
+        line_addresses: Số dòng nguồn -> địa chỉ lệnh sinh ra từ dòng đó (image do Linker
+            tạo: (tên object, số dòng) -> địa chỉ).
+        errors: Các dòng "Error: ..."; image có lỗi không nạp được.
+        text_base: Địa chỉ vùng code.
+    """
+
+    def __init__(self, text, data=b"", data_base=0, entry=0, symbols=None, line_addresses=None, errors=(),
+                 text_base=0):
+        self.text = bytes(text)
+        self.data = bytes(data)
+        self.data_base = data_base
+        self.entry = entry
+        self.symbols = symbols or {}
+        self.line_addresses = line_addresses or {}
+        self.errors = list(errors)
+        self.text_base = text_base
+
+    def to_dict(self):
+        return {
+            "text": self.text.hex(),
+            "data": self.data.hex(),
+            "text_base": self.text_base,
+            "data_base": self.data_base,
+            "entry": self.entry,
+            "symbols": self.symbols,
+            # Khóa là số dòng, hoặc (tên object, số dòng) với image do Linker tạo
+            "line_addresses": [[list(line) if isinstance(line, tuple) else line, address]
+                               for line, address in self.line_addresses.items()],
+            "errors": self.errors,
+        }
+
+    @classmethod
+    def from_dict(cls, obj):
+        return cls(bytes.fromhex(obj["text"]), bytes.fromhex(obj["data"]), obj["data_base"], obj["entry"],
+                   obj["symbols"], {tuple(line) if isinstance(line, list) else line: address
+                                    for line, address in obj["line_addresses"]},
+                   obj["errors"], obj["text_base"])
+
+    def words(self):
+        """Mã máy dưới dạng danh sách word 32 bit (như load_program_words)."""
+        return list(struct.unpack(f"<{len(self.text) // 4}I", self.text))
+
+    def memory(self, mem_size):
+        """Ảnh bộ nhớ mem_size byte chứa text và data (dùng cho RISCV_ISS.reset(image))."""
+        memory = bytearray(mem_size)
+        end = max(self.text_base + len(self.text), self.data_base + len(self.data))
+        if end > mem_size:
+            raise ValueError(f"Program image needs 0x{end:x} bytes of memory")
+        memory[self.text_base:self.text_base + len(self.text)] = self.text
+        memory[self.data_base:self.data_base + len(self.data)] = self.data
+        return memory
+
+
+class ObjectFile:
+    """
+    Object relocatable do assemble_object() tạo, Linker.link() gán địa chỉ và vá relocation.
+    Branch/jal tới nhãn trong cùng .text đã được dịch sẵn (offset tương đối pc không đổi khi
+    dời cả section); mọi tham chiếu khác (nhãn ở file khác, trong .data, hay địa chỉ tuyệt đối
+    của nhãn cho li/la/lui/lệnh I/S) trở thành relocation.
+
+    Args:
+        name: Tên object (thường là tên file nguồn), dùng trong thông báo lỗi.
+        text / data: Nội dung hai section, offset tính từ đầu section.
+        symbols: Nhãn -> (".text" | ".data", offset).
+        relocations: Danh sách (offset trong .text, kiểu, symbol); kiểu là một trong
+            RELOCATION_KINDS, "pair" vá cặp lui + addi của li/la.
+        line_addresses: Số dòng nguồn -> offset trong .text.
+        errors: Các dòng "Error: ..." khi dịch.
+    """
+
+    def __init__(self, name, text, data=b"", symbols=None, relocations=(), line_addresses=None, errors=()):
+        self.name = name
+        self.text = bytes(text)
+        self.data = bytes(data)
+        self.symbols = symbols or {}
+        self.relocations = list(relocations)
+        self.line_addresses = line_addresses or {}
+        self.errors = list(errors)
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "text": self.text.hex(),
+            "data": self.data.hex(),
+            "symbols": self.symbols,
+            "relocations": self.relocations,
+            "line_addresses": self.line_addresses,
+            "errors": self.errors,
+        }
+
+    @classmethod
+    def from_dict(cls, obj):
+        return cls(obj["name"], bytes.fromhex(obj["text"]), bytes.fromhex(obj["data"]),
+                   {name: tuple(where) for name, where in obj["symbols"].items()},
+                   [tuple(relocation) for relocation in obj["relocations"]],
+                   {int(line): offset for line, offset in obj["line_addresses"].items()}, obj["errors"])
+
+
+RELOCATION_KINDS = ("branch", "jal", "u", "i", "s", "pair")
+PC_RELATIVE_KINDS = ("branch", "jal")  # Các kiểu còn lại dùng địa chỉ tuyệt đối của symbol
+
+
+# Kiểu relocation theo vị trí immediate của lệnh (cách encoder đặt bit của toán hạng nhãn)
+def relocation_kind(inst):
+    if inst in BRANCHES:
+        return "branch"
+    if inst in ("jal", "j"):
+        return "jal"
+    if inst == "lui":
+        return "u"
+    if inst in STORES:
+        return "s"
+    if inst in ("li", "la"):
+        return "pair"
+    return "i"
+
+
+class _LabelUses(dict):
+    """Bảng nhãn ghi lại các nhãn được tra (used) khi dịch một lệnh."""
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.used = []
+
+    def __getitem__(self, name):
+        self.used.append(name)
+        return super().__getitem__(name)
+
+
+class _ExternalSymbols(_LabelUses):
+    """Bảng nhãn khi dịch object: nhãn chưa có trả về địa chỉ lệnh (field = 0) và được ghi lại."""
+
+    def __init__(self, label_table, address):
+        super().__init__(label_table)
+        self.address = address
+        self.missing = []
+
+    def __contains__(self, name):
+        return True
+
+    def __missing__(self, name):
+        self.missing.append(name)
+        return self.address
+
+
+# Lượt dịch duy nhất. Trả về (text, sizes, fixups, label_table, data_labels, data, data_errors,
+# line_addresses); text chứa None ở các vị trí trong fixups (nhãn chưa khai báo trong file, và
+# khi relocatable thì cả lệnh dùng địa chỉ tuyệt đối của nhãn, chỉ biết được khi link).
+def _assemble_pass(lines, relocatable=False):
+    label_table = _LabelUses() if relocatable else {}
+    data_labels = {}  # Nhãn trong .data -> offset trong vùng dữ liệu
+    text = []       # Mã máy theo thứ tự; None = chờ fixup
+    sizes = []      # Số byte của từng phần tử trong text
+    fixups = []     # (vị trí trong text, địa chỉ lệnh, dòng, Token)
+    line_addresses = {}
+    data = bytearray()
+    data_errors = []
+    in_text = False
     current_address = 0  # Địa chỉ bắt đầu
-    with open(input_filename, 'r') as infile:
-        for line in infile:
-            line = line.strip()
-            if line.startswith('.text'):
-                text_file=1
-                continue
-            if not line or line.startswith('#'):  # Bỏ qua dòng rỗng hoặc chú thích
-                continue
-            if text_file == 0 :
-                continue
-            if line.endswith(':'):  # Nhãn
-                label = line[:-1]  # Loại bỏ dấu ":" khỏi nhãn
-                label_table[label] = current_address
-                
-            else:
-                current_address += 4  # Tăng địa chỉ hiện tại lên 4 byte cho mỗi lệnh
-    return label_table
-
-#Hàm xử lý nhãn trùng
-def resolve_labels(line, label_table, current_address):
-    for label, address in label_table.items():
-        # Tìm kiếm chính xác nhãn bằng regex: r'\b' để xác định ranh giới từ
-        pattern = fr'\b{label}\b'
-        if re.search(pattern, line):
-            # Tính toán offset
-            offset = address - current_address
-            # Thay thế nhãn bằng offset
-            line = re.sub(pattern, str(offset), line)
-    return line
-
-def parse_data_section(lines):
-    memory = []
-
-    for line in lines:
+    for number, line in enumerate(lines, 1):
         line = line.strip()
-        if not line or line.startswith('.data'):
+        if not line or line.startswith('#'):  # Bỏ qua dòng rỗng hoặc chú thích
+            continue
+        if line.startswith('.text'):
+            in_text = True
+            continue
+        if line.startswith('.data'):
+            in_text = False
             continue
+        # Tách nhãn và nội dung của chỉ thị dữ liệu
+        label, sep, directive = line.partition(':')
+        directive = directive.strip() if sep and '"' not in label else line
+        if directive.startswith(DATA_DIRECTIVES):
+            if directive is not line:
+                data_labels[label.strip()] = len(data)
+            try:
+                parse_data_directive(directive, data)
+            except ValueError as e:
+                data_errors.append(f"Error: {e} -> Line: {line}")
+            continue
+        if line.endswith(':'):  # Nhãn
+            if in_text:
+                label_table[line[:-1]] = current_address
+            else:
+                data_labels[line[:-1]] = len(data)
+            continue
+        if not in_text:
+            continue
+        line = line.split('#', 1)[0].rstrip()  # Bỏ chú thích cuối dòng
+        line_addresses[number] = current_address
+        size = 4
+        try:
+            tokens = tokenize(line)
+            size = instruction_size(tokens)
+            if relocatable:
+                label_table.used.clear()
+            code = encode_instruction(tokens, current_address, label_table)
+            if relocatable and label_table.used and relocation_kind(tokens[0].value) not in PC_RELATIVE_KINDS:
+                raise UndefinedSymbol("Absolute symbol address")
+            text.append(code)
+        except UndefinedSymbol:
+            fixups.append((len(text), current_address, line, tokens))
+            text.append(None)
+        except ValueError as e:
+            text.append(f"Error: {e} -> Line: {line}")
+        sizes.append(size)
+        current_address += size  # Tăng địa chỉ hiện tại theo số byte mã máy của lệnh
+    return text, sizes, fixups, label_table, data_labels, data, data_errors, line_addresses
+
+
+# Ghép mã máy thành bytes; lệnh lỗi giữ chỗ bằng word 0 để địa chỉ các lệnh sau không đổi
+def _text_bytes(text, sizes):
+    return b"".join(bytes(size) if binary.startswith("Error") else
+                    b"".join(int(word, 2).to_bytes(4, 'little') for word in binary.split('\n'))
+                    for binary, size in zip(text, sizes))
+
+
+# Dịch các dòng nguồn; trả về (ProgramImage, các dòng của text.bin, các dòng của data.bin)
+def _assemble(lines, data_base=None):
+    text, sizes, fixups, label_table, data_labels, data, data_errors, line_addresses = _assemble_pass(lines)
+    if data_base is None:
+        data_base = (sum(sizes) + 0xFFF) & ~0xFFF  # Trang 4 KiB ngay sau code
+    symbols = {label: data_base + offset for label, offset in data_labels.items()}
+    symbols.update(label_table)
+    for index, address, line, tokens in fixups:
+        try:
+            text[index] = encode_instruction(tokens, address, symbols)
+        except ValueError as e:
+            text[index] = f"Error: {e} -> Line: {line}"
+
+    errors = [code for code in text if code.startswith("Error")] + data_errors
+    image = ProgramImage(_text_bytes(text, sizes), data, data_base, label_table.get("_start", 0), symbols,
+                         line_addresses, errors)
+    return image, text, pack_data_words(data) + data_errors
+
+
+def assemble_object(source, name="<source>"):
+    """
+    Dịch chương trình assembly thành ObjectFile relocatable (chưa gán địa chỉ, xem Linker.py).
+
+    Args:
+        source: Mã nguồn (cùng cú pháp với file .s).
+        name: Tên object.
+    """
+    text, sizes, fixups, label_table, data_labels, data, data_errors, line_addresses = \
+        _assemble_pass(source.splitlines(), relocatable=True)
+    relocations = []
+    for index, address, line, tokens in fixups:
+        external = _ExternalSymbols(label_table, address)
+        try:
+            text[index] = encode_instruction(tokens, address, external)
+        except ValueError as e:
+            text[index] = f"Error: {e} -> Line: {line}"
+            continue
+        kind = relocation_kind(tokens[0].value)
+        for symbol in external.missing if kind in PC_RELATIVE_KINDS else external.used:
+            relocations.append((address, kind, symbol))
 
-        # Tách nhãn và nội dung
-        if ':' in line:
-            label, directive = line.split(':', 1)
-            directive = directive.strip()
-        else:
-            directive = line
-
-        # Xử lý từng loại chỉ thị
-        if directive.startswith('.word'):
-            nums = re.findall(r'-?\d+', directive)
-            for num in nums:
-                val = int(num)
-                memory.extend(struct.pack('<I', val))  # 4 bytes little endian
-
-        elif directive.startswith('.half'):
-            nums = re.findall(r'-?\d+', directive)
-            for num in nums:
-                val = int(num)
-                memory.extend(struct.pack('<H', val))  # 2 bytes little endian
-
-        elif directive.startswith('.byte'):
-            nums = re.findall(r'0x[0-9a-fA-F]+|\d+', directive)
-            for num in nums:
-                val = int(num, 0)  # auto-detect base (hex or dec)
-                memory.append(val)
-
-        elif directive.startswith('.ascii'):
-            match = re.search(r'"(.*)"', directive)
-            if match:
-                content = match.group(1)
-                memory.extend(content.encode('ascii'))
-
-    # Pad to multiple of 4 bytes
-    while len(memory) % 4 != 0:
-        memory.append(0)
-
-    # Chia thành từng từ 32-bit (4 byte), little endian
-    output = []
-    for i in range(0, len(memory), 4):
-        word = memory[i:i+4]
-        word_le = word[::-1]  # Little endian
-        binary_str = ''.join(f'{b:08b}' for b in word_le)
-        output.append(binary_str)
-
-    return output
-# Hàm xử lí file
+    symbols = {label: (".data", offset) for label, offset in data_labels.items()}
+    symbols.update((label, (".text", offset)) for label, offset in label_table.items())
+    errors = [code for code in text if code.startswith("Error")] + data_errors
+    return ObjectFile(name, _text_bytes(text, sizes), data, symbols, relocations, line_addresses, errors)
 
-def assemble_file(input_filename, output_filename, output_filename2):
-    global text_file
-    # Xây dựng bảng nhãn
-    label_table = build_label_table(input_filename)
-    text_file = 0
-    # Duyệt lại file để dịch lệnh
-    current_address = 0  # Địa chỉ bắt đầu
-    with open(input_filename, 'r') as infile, open(output_filename, 'w') as outfile:
-        for line in infile:
-            line = line.strip()
-            if line.startswith('.text'):
-                text_file=1
-                continue
-            if text_file == 0 :
-                continue
-            if not line or line.startswith('#'):  # Bỏ qua dòng rỗng hoặc chú thích
-                continue
 
-            if line.endswith(':'):  # Bỏ qua nhãn
-                continue
-            
-            # Thay thế nhãn bằng địa chỉ trong bảng nhãn
-            line = resolve_labels(line, label_table, current_address)
-
-            line = replace_registers(line)  # Thay thế tất cả các thanh ghi
-            current_address += 4
-            
-            
-            try:
-                binary_code = assemble(line)  # Gọi hàm assemble để dịch lệnh
-                
-                outfile.write( binary_code + '\n')
-            except ValueError as e:
-                outfile.write(f"Error: {e} -> Line: {line}\n")
-                
-                
-    with open(input_filename, 'r') as infile:
-        lines = infile.readlines()
+def assemble_string(source, data_base=None):
+    """
+    Dịch chương trình assembly trong bộ nhớ, không đọc/ghi file.
+
+    Args:
+        source: Mã nguồn (cùng cú pháp với file .s).
+        data_base: Địa chỉ vùng dữ liệu (mặc định: trang 4 KiB đầu tiên sau code).
+
+    Returns:
+        ProgramImage.
+    """
+    return _assemble(source.splitlines(), data_base)[0]
 
-    binary_lines = parse_data_section(lines)
 
-    with open(output_filename2, 'w') as outfile:
-        for line in binary_lines:
-            outfile.write(line + '\n')
+# Hàm xử lí file
+def assemble_file(input_filename, output_filename=None, output_filename2=None, data_base=None):
+    """
+    Dịch file assembly trong một lượt đọc. Mỗi dòng được tách Token một lần; nhãn được tra
+    bằng dict, lệnh dùng nhãn chưa khai báo (tham chiếu tới trước) giữ chỗ trong danh sách
+    fixup và được dịch lại từ Token ở cuối lượt. Mỗi file output được ghi bằng một lần write.
+
+    Args:
+        input_filename: File nguồn; lệnh sau .text (tới .data), dữ liệu là các chỉ thị
+            .word/.half/.byte/.ascii.
+        output_filename: File mã máy (mỗi dòng một lệnh dạng chuỗi '0'/'1' hoặc "Error: ...");
+            None thì không ghi.
+        output_filename2: File dữ liệu (mỗi dòng một word; chỉ thị lỗi -> "Error: ...");
+            None thì không ghi.
+        data_base: Như assemble_string().
+
+    Returns:
+        ProgramImage.
+    """
+    with open(input_filename, 'r') as infile:
+        lines = infile.read().splitlines()
+    image, text, data = _assemble(lines, data_base)
+    if output_filename is not None:
+        with open(output_filename, 'w') as outfile:
+            outfile.write(''.join(code + '\n' for code in text))
+    if output_filename2 is not None:
+        with open(output_filename2, 'w') as outfile:
+            outfile.write(''.join(word + '\n' for word in data))
+    return image
 
 # Sử dụng hàm để đọc từ file "test.asm" và ghi kết quả ra file "binary.bin"
-assemble_file("test_label.s", "text.bin", "data.bin")
+if __name__ == "__main__":
+    assemble_file("test_label.s", "text.bin", "data.bin")
 
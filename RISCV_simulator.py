@@ -1,6 +1,5 @@
 # RISC-V Instruction Set Simulator in Python
 # Data Structures
-from Debug_Module import DebugModule
 registerFiles = {f"{i}": 0 for i in range(32)}  # Register file without 'x'\
 dataMemory = {}  # Data memory
 IO = {}
@@ -428,36 +427,10 @@ class DScratch1(CSR32):
     def __init__(self):
         super().__init__("dscratch1")
 
-sstatus = SStatus()
-stvec = STVec()
-stvec.write(handler_base_addr)
-sip = SIP()
-sie = SIE()
-scounteren = SCOUNTEREN()
-sscratch = SSCRATCH()
-sepc = SEPC()
-scause = SCause()
-stval = STval()
-senvcfg = SENVCFG()
-satp = SATP()
-
-dcsr = DCSR()
-dpc = DPC()
-dscratch0 = DScratch0()
-dscratch1 = DScratch1()
-csrs = {
-    "sstatus": sstatus,
-    "stvec": stvec,
-    "sip": sip,
-    "sie": sie,
-    "scounteren": scounteren,
-    "sscratch": sscratch,
-    "sepc": sepc,
-    "scause": scause,
-    "stval": stval,
-    "senvcfg": senvcfg,
-    "satp": satp,
-}
+# Các thanh ghi CSR được tạo trong reset_state() (lần chạy đầu tiên), không tạo lúc import module
+sstatus = stvec = sip = sie = scounteren = sscratch = sepc = scause = stval = senvcfg = satp = None
+dcsr = dpc = dscratch0 = dscratch1 = None
+csrs = {}
 
 
 
@@ -1153,6 +1126,72 @@ def execute_instruction(format, opcode, func3, func7, rd, rs1, rs2, imm, inst):
         return "Illegal"
     return result
 
+# Chạy một lệnh tại pc (instructions: các dòng nhị phân của text.bin)
+def step(instructions):
+    global pc
+    if stvec is None:
+        reset_state()
+    inst = instructions[pc // 4].strip()
+    if inst[0] == 'E':
+        scause.set_cause_by_description("Illegal instruction")
+        handle_exception(pc)
+        return
+
+    format, opcode, func3, func7, rd, rs1, rs2, imm = instDecoder(inst)
+
+    if debug_mode:
+        run_debug_loop(instructions)
+    else:
+        run_normal_instruction(format, opcode, func3, func7, rd, rs1, rs2, imm, inst)
+
+    registerFiles['0'] = 0
+
+# Đưa toàn bộ trạng thái toàn cục về lúc khởi động (để chạy nhiều chương trình trong cùng process)
+def reset_state():
+    global pc, debug_mode, SUPERVISOR_MODE
+    global sstatus, stvec, sip, sie, scounteren, sscratch, sepc, scause, stval, senvcfg, satp
+    global dcsr, dpc, dscratch0, dscratch1
+    pc = 0
+    debug_mode = False
+    SUPERVISOR_MODE = True
+    for i in range(32):
+        registerFiles[str(i)] = 0
+    dataMemory.clear()
+    IO.clear()
+    stack.clear()
+
+    sstatus = SStatus()
+    stvec = STVec()
+    stvec.write(handler_base_addr)
+    sip = SIP()
+    sie = SIE()
+    scounteren = SCOUNTEREN()
+    sscratch = SSCRATCH()
+    sepc = SEPC()
+    scause = SCause()
+    stval = STval()
+    senvcfg = SENVCFG()
+    satp = SATP()
+
+    dcsr = DCSR()
+    dpc = DPC()
+    dscratch0 = DScratch0()
+    dscratch1 = DScratch1()
+    csrs.clear()
+    csrs.update({
+        "sstatus": sstatus,
+        "stvec": stvec,
+        "sip": sip,
+        "sie": sie,
+        "scounteren": scounteren,
+        "sscratch": sscratch,
+        "sepc": sepc,
+        "scause": scause,
+        "stval": stval,
+        "senvcfg": senvcfg,
+        "satp": satp,
+    })
+
 # Main loop for simulation
 def simulate():
     global pc, debug_mode
@@ -1166,20 +1205,7 @@ def simulate():
             if numb_inst > 100:
                 break
 
-            inst = instructions[pc // 4].strip()
-            if inst[0] == 'E':
-                scause.set_cause_by_description("Illegal instruction")
-                handle_exception(pc)
-                continue
-
-            format, opcode, func3, func7, rd, rs1, rs2, imm = instDecoder(inst)
-
-            if debug_mode:
-                run_debug_loop(instructions)
-            else:
-                run_normal_instruction(format, opcode, func3, func7, rd, rs1, rs2, imm, inst)
-
-            registerFiles['0'] = 0
+            step(instructions)
 
     except FileNotFoundError:
         print("Error: text.bin file not found!")
@@ -0,0 +1,280 @@
+import bisect
+import contextlib
+
+# Record/replay cho RISCV_ISS và reverse debugging (reverse-step, reverse-continue, goto).
+#
+# Trong lúc ghi, Recorder chạy ISS bằng run() theo từng đoạn và:
+#   - chụp Snapshot (thanh ghi, CSR, privilege, bộ nhớ theo trang) mỗi interval lệnh.
+#     Trang không đổi so với snapshot trước được dùng chung (bytes bất biến), nên snapshot
+#     chỉ tốn bộ nhớ cho các trang đã bị ghi.
+#   - ghi lại mọi đầu vào không xác định theo instret: ngắt (interrupt()) và giá trị đọc
+#     từ bên ngoài (input(), cho dịch vụ ecall/MMIO của host).
+# Đi tới instret N = khôi phục snapshot gần nhất trước N rồi replay tới N ở tốc độ run()
+# (breakpoint/trigger/trace/coverage tạm tắt), đầu vào được phát lại đúng instret đã ghi.
+# Sửa trạng thái hart từ debugger (truncate()) làm tương lai đã ghi không còn đúng: các
+# snapshot và sự kiện sau instret hiện tại bị bỏ.
+
+DEFAULT_INTERVAL = 100000
+PAGE_SHIFT = 12
+
+EVENT_INTERRUPT = "interrupt"
+
+
+class Snapshot:
+    __slots__ = ("instret", "pc", "regs", "priv", "csrs", "pages", "halted",
+                 "trap_counts", "priv_transitions", "event_index")
+
+    def __repr__(self):
+        return f"Snapshot(instret={self.instret}, pc=0x{self.pc:08x})"
+
+
+def take_snapshot(iss, previous=None, event_index=0):
+    """Chụp trạng thái hart; trang giống previous được dùng chung thay vì copy."""
+    snap = Snapshot()
+    snap.instret = iss.instret
+    snap.pc = iss.pc
+    snap.regs = tuple(iss.regs)
+    snap.priv = iss.privilege_level
+    snap.csrs = {name: csr.value for name, csr in iss.csrs.items()}
+    snap.halted = iss.halted
+    snap.trap_counts = tuple(iss.trap_counts)
+    snap.priv_transitions = tuple(iss.priv_transitions)
+    snap.event_index = event_index
+    size = 1 << PAGE_SHIFT
+    memory = memoryview(iss.memory)
+    old = previous.pages if previous is not None and len(previous.pages) * size >= len(memory) else None
+    pages = []
+    for i, start in enumerate(range(0, len(memory), size)):
+        chunk = memory[start:start + size]
+        if old is not None and chunk == old[i]:
+            pages.append(old[i])
+        else:
+            pages.append(bytes(chunk))
+    snap.pages = tuple(pages)
+    return snap
+
+
+def restore_snapshot(iss, snap):
+    iss.regs[:] = snap.regs
+    iss.pc = snap.pc
+    iss.privilege_level = snap.priv
+    for name, value in snap.csrs.items():
+        iss.csrs[name].value = value
+    iss.halted = snap.halted
+    iss.trap_counts[:] = snap.trap_counts
+    iss.priv_transitions[:] = snap.priv_transitions
+    iss.instret = snap.instret
+    size = 1 << PAGE_SHIFT
+    for i, page in enumerate(snap.pages):
+        iss.memory[i * size:i * size + len(page)] = page
+    iss.breakpoint_hit = None
+    iss.trigger_hit = None
+    iss.trigger_pc = None
+    iss.invalidate_blocks()
+
+
+class Recorder:
+    """
+    Ghi và phát lại một lần chạy của RISCV_ISS.
+
+    Args:
+        iss: Hart cần ghi; trạng thái lúc tạo Recorder là snapshot đầu tiên.
+        interval: Số lệnh giữa hai snapshot.
+    """
+
+    def __init__(self, iss, interval=DEFAULT_INTERVAL):
+        if interval <= 0:
+            raise ValueError("Snapshot interval must be positive")
+        self.iss = iss
+        self.interval = interval
+        self.events = []        # (instret, kind, value) theo thứ tự xảy ra
+        self.cursor = 0         # Sự kiện tiếp theo chưa phát lại / chưa xảy ra
+        self.snapshots = [take_snapshot(iss)]
+        self.horizon = iss.instret  # instret xa nhất đã ghi
+
+    @property
+    def start(self):
+        return self.snapshots[0].instret
+
+    # Đầu vào không xác định
+
+    def interrupt(self, cause_code):
+        """Đưa ngắt vào hart ngay bây giờ và ghi lại (thay cho iss.raise_interrupt)."""
+        self._record(EVENT_INTERRUPT, cause_code)
+        self.iss.raise_interrupt(cause_code)
+
+    def input(self, kind, read):
+        """
+        Giá trị đọc từ bên ngoài (ví dụ kind = "READ_INT", read = hàm hỏi người dùng): khi
+        replay trả về giá trị đã ghi tại instret này, ngược lại gọi read() và ghi lại.
+        """
+        if self.cursor < len(self.events):
+            instret, recorded_kind, value = self.events[self.cursor]
+            if instret == self.iss.instret and recorded_kind == kind:
+                self.cursor += 1
+                return value
+        value = read()
+        self._record(kind, value)
+        return value
+
+    def _record(self, kind, value):
+        if self.iss.instret < self.horizon or self.cursor < len(self.events):
+            self.truncate()  # Đầu vào mới trong quá khứ: tương lai đã ghi không còn đúng
+        self.events.append((self.iss.instret, kind, value))
+        self.cursor = len(self.events)
+
+    def truncate(self):
+        """Bỏ snapshot và sự kiện sau trạng thái hiện tại (hart vừa bị sửa từ debugger)."""
+        instret = self.iss.instret
+        while len(self.snapshots) > 1 and self.snapshots[-1].instret > instret:
+            self.snapshots.pop()
+        del self.events[self.cursor:]
+        self.horizon = instret
+
+    # Chạy tiến
+
+    def _apply_due_events(self):
+        iss = self.iss
+        events = self.events
+        while self.cursor < len(events):
+            instret, kind, value = events[self.cursor]
+            if instret > iss.instret or (instret == iss.instret and kind != EVENT_INTERRUPT):
+                break  # input() tự lấy giá trị khi host đọc
+            self.cursor += 1
+            if instret == iss.instret:
+                iss.raise_interrupt(value)
+
+    def _maybe_snapshot(self):
+        iss = self.iss
+        last = self.snapshots[-1]
+        if iss.instret > last.instret and (iss.instret - self.start) % self.interval == 0:
+            self.snapshots.append(take_snapshot(iss, last, self.cursor))
+
+    def run(self, max_instructions=None):
+        """
+        Như iss.run(): chạy tới khi kết thúc, chạm breakpoint/trigger hoặc đủ max_instructions,
+        đồng thời chụp snapshot và phát lại (hoặc ghi) đầu vào. Trả về số lệnh đã retire.
+        """
+        iss = self.iss
+        start = iss.instret
+        limit = None if max_instructions is None else start + max_instructions
+        first = True
+        while not iss.halted and iss.instret != limit:
+            if not first:
+                # run() bỏ qua breakpoint tại pc lúc gọi: chỉ đúng cho đoạn đầu tiên
+                breakpoint = iss.breakpoints.get(iss.pc)
+                if breakpoint is not None and breakpoint.hit(iss):
+                    iss.breakpoint_hit = breakpoint
+                    break
+            first = False
+            self._apply_due_events()
+            target = self.start + ((iss.instret - self.start) // self.interval + 1) * self.interval
+            if self.cursor < len(self.events) and self.events[self.cursor][0] > iss.instret:
+                target = min(target, self.events[self.cursor][0])
+            if limit is not None:
+                target = min(target, limit)
+            iss.run(target - iss.instret)
+            self.horizon = max(self.horizon, iss.instret)
+            self._maybe_snapshot()
+            if iss.breakpoint_hit is not None or iss.trigger_hit is not None or iss.haltreq_hit:
+                break
+        return iss.instret - start
+
+    # Đi lùi
+
+    @contextlib.contextmanager
+    def _replaying(self):
+        """Tắt breakpoint, watchpoint, icount, trace, coverage và verbose trong lúc replay."""
+        iss = self.iss
+        saved = (iss.breakpoints, iss.watchpoints, iss.icount_trigger, iss.tracer, iss.coverage, iss.verbose)
+        iss.breakpoints = {}
+        if saved[1]:
+            iss.set_watchpoints(())
+        iss.icount_trigger = iss.tracer = iss.coverage = None
+        iss.verbose = False
+        try:
+            yield
+        finally:
+            iss.breakpoints, _, iss.icount_trigger, iss.tracer, iss.coverage, iss.verbose = saved
+            if saved[1]:
+                iss.set_watchpoints(saved[1])
+            iss.invalidate_blocks()  # Block decode lúc không có breakpoint không tách tại breakpoint
+
+    def _restore(self, index):
+        snap = self.snapshots[index]
+        restore_snapshot(self.iss, snap)
+        self.cursor = snap.event_index
+
+    def _snapshot_index(self, instret):
+        """Index snapshot cuối cùng có instret <= instret."""
+        keys = [snap.instret for snap in self.snapshots]
+        return bisect.bisect_right(keys, instret) - 1
+
+    def goto(self, instret):
+        """Đưa hart tới đúng trạng thái sau instret lệnh (trong quá khứ hoặc tương lai)."""
+        iss = self.iss
+        if instret < self.start:
+            raise ValueError(f"Recording starts at instret {self.start}")
+        if instret < iss.instret or self._snapshot_index(instret) > self._snapshot_index(iss.instret):
+            self._restore(self._snapshot_index(instret))
+        with self._replaying():
+            while iss.instret < instret and not iss.halted:
+                self.run(instret - iss.instret)
+        return iss.instret
+
+    def reverse_step(self, count=1):
+        return self.goto(max(self.start, self.iss.instret - count))
+
+    def reverse_continue(self):
+        """
+        Lùi tới lần dừng (breakpoint/trigger) gần nhất trước instret hiện tại; không có thì
+        về đầu bản ghi. Trả về object đã làm dừng hoặc None.
+        """
+        iss = self.iss
+        end = iss.instret
+        hitcounts = {pc: bp.hitcount for pc, bp in iss.breakpoints.items()}
+        icount, iss.icount_trigger = iss.icount_trigger, None
+        found = None
+        try:
+            index = self._snapshot_index(end - 1) if end > self.start else -1
+            while index >= 0 and found is None:
+                segment_end = end if index + 1 >= len(self.snapshots) else min(end, self.snapshots[index + 1].instret)
+                self._restore(index)
+                # run() không dừng ở breakpoint tại pc bắt đầu đoạn nên kiểm tra ở đây
+                breakpoint = iss.breakpoints.get(iss.pc)
+                if breakpoint is not None and iss.instret < end and breakpoint.hit(iss):
+                    found = (iss.instret, breakpoint)
+                with contextlib.ExitStack() as stack:
+                    stack.callback(setattr, iss, "verbose", iss.verbose)
+                    iss.verbose = False
+                    while iss.instret < segment_end and not iss.halted:
+                        self.run(segment_end - iss.instret)
+                        hit = iss.breakpoint_hit or iss.trigger_hit
+                        if hit is not None and iss.instret < end:
+                            found = (iss.instret, hit)
+                index -= 1
+        finally:
+            for pc, count in hitcounts.items():
+                iss.breakpoints[pc].hitcount = count
+            iss.icount_trigger = icount
+        self.goto(found[0] if found else self.start)
+        if found:
+            if found[1] in iss.breakpoints.values():
+                iss.breakpoint_hit = found[1]
+            else:
+                iss.trigger_hit = found[1]
+            return found[1]
+        return None
+
+    def memory_usage(self):
+        """Số byte bộ nhớ thực sự dùng cho các trang của mọi snapshot (trang chung tính một lần)."""
+        seen = {}
+        for snap in self.snapshots:
+            for page in snap.pages:
+                seen[id(page)] = len(page)
+        return sum(seen.values())
+
+    def describe(self):
+        return (f"recording from instret {self.start} to {self.horizon}, {len(self.snapshots)} snapshot(s) "
+                f"every {self.interval} instructions ({self.memory_usage()} bytes of pages), "
+                f"{len(self.events)} input event(s)")
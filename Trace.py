@@ -0,0 +1,320 @@
+import queue
+import struct
+import sys
+import threading
+import zlib
+
+# Binary execution trace cho RISCV_ISS.
+#
+# File layout (little-endian):
+#   header : magic(8s) version(H) record_size(H) flags(I)
+#   chunk  : payload_len(I) record_count(I) first_instret(Q) + payload
+# payload là các record cố định (TRACE_RECORD), nén zlib nếu header có TRACE_COMPRESSED.
+
+TRACE_MAGIC = b"RVTRACE\0"
+TRACE_VERSION = 1
+TRACE_COMPRESSED = 0x1
+
+TRACE_HEADER = struct.Struct("<8sHHI")
+CHUNK_HEADER = struct.Struct("<IIQ")
+# instret, pc, instr, rd_value, mem_addr, mem_data, rd, priv, flags, mem_size
+TRACE_RECORD = struct.Struct("<QIIIIIBBBB")
+
+# Record flags
+REC_RD_WRITE = 0x1
+REC_MEM_READ = 0x2
+REC_MEM_WRITE = 0x4
+REC_TRAP = 0x8       # Lệnh gây exception: không ghi rd, không truy cập bộ nhớ
+
+OPCODE_LOAD = 0b0000011
+OPCODE_STORE = 0b0100011
+# Các opcode có ghi vào rd
+RD_WRITE_OPCODES = frozenset((0b0110011, 0b0010011, 0b0000011, 0b0110111,
+                              0b0010111, 0b1101111, 0b1100111))
+LOAD_SIZES = {0b000: 1, 0b001: 2, 0b010: 4, 0b100: 1, 0b101: 2}
+STORE_SIZES = {0b000: 1, 0b001: 2, 0b010: 4, 0b011: 8}
+
+
+class TraceWriter:
+    """
+    Ghi trace nhị phân cho từng lệnh retire.
+
+    Record được ghi vào một ring buffer cấp phát sẵn (luôn giữ N lệnh gần nhất,
+    xem last()). Mỗi khi đủ một chunk, chunk được chuyển sang thread nền để
+    nén và ghi file, nên vòng lặp mô phỏng không phải chờ I/O.
+
+    Args:
+        path: File trace (None: chỉ giữ ring buffer trong bộ nhớ).
+        ring_size: Số record trong ring buffer (bội số của chunk_records).
+        chunk_records: Số record mỗi chunk ghi ra file.
+        start_pc / stop_pc: Bắt đầu / dừng ghi khi PC chạm địa chỉ này.
+        start_instret / stop_instret: Cửa sổ ghi theo số lệnh đã retire.
+        pc_range: (lo, hi) chỉ ghi các lệnh có lo <= pc < hi.
+        compress_level: Mức nén zlib (0: không nén).
+        index: Xây dựng index "<path>.idx" song song khi ghi (xem TraceIndex.py).
+    """
+
+    def __init__(self, path=None, ring_size=65536, chunk_records=4096,
+                 start_pc=None, stop_pc=None, start_instret=None, stop_instret=None,
+                 pc_range=None, compress_level=6, index=False):
+        chunk_records = min(chunk_records, ring_size)
+        if ring_size % chunk_records != 0:
+            raise ValueError("ring_size must be a multiple of chunk_records")
+
+        self.ring_size = ring_size
+        self.chunk_records = chunk_records
+        self.ring = bytearray(ring_size * TRACE_RECORD.size)
+        self.count = 0  # Tổng số record đã ghi vào ring
+
+        self.start_pc = start_pc
+        self.stop_pc = stop_pc
+        self.start_instret = start_instret
+        self.stop_instret = stop_instret
+        self.pc_range = pc_range
+        self.active = start_pc is None and start_instret is None
+        self.done = False
+
+        self.path = path
+        self.compress_level = compress_level
+        self.file = None
+        self.queue = None
+        self.thread = None
+        self.chunk_first_instret = 0
+        self.index = None
+        if path is not None:
+            if index:
+                from TraceIndex import TraceIndexBuilder
+                self.index = TraceIndexBuilder()
+            self.file = open(path, "wb")
+            flags = TRACE_COMPRESSED if compress_level else 0
+            self.file.write(TRACE_HEADER.pack(TRACE_MAGIC, TRACE_VERSION, TRACE_RECORD.size, flags))
+            self.queue = queue.Queue(maxsize=64)
+            self.thread = threading.Thread(target=self._writer_loop, daemon=True)
+            self.thread.start()
+
+    def attach(self, iss):
+        iss.tracer = self
+        return self
+
+    def detach(self, iss):
+        if iss.tracer is self:
+            iss.tracer = None
+        self.close()
+
+    # Trigger: kiểm tra điều kiện bắt đầu / dừng ghi
+    def _update_trigger(self, pc, instret):
+        if self.active:
+            if (self.stop_instret is not None and instret >= self.stop_instret) or \
+               (self.stop_pc is not None and pc == self.stop_pc):
+                self.active = False
+                # Chỉ có start_pc mới có thể mở lại cửa sổ ghi
+                self.done = self.start_pc is None or \
+                    (self.stop_instret is not None and instret >= self.stop_instret)
+        elif not self.done:
+            if (self.start_pc is None or pc == self.start_pc) and \
+               (self.start_instret is None or instret >= self.start_instret):
+                self.active = True
+        return self.active
+
+    def record(self, iss, pc, instr, priv):
+        """Ghi một record cho lệnh vừa retire (gọi từ RISCV_ISS.step)."""
+        if self.done:
+            return
+        instret = iss.instret - 1
+        if not self._update_trigger(pc, instret):
+            return
+        if self.pc_range is not None and not (self.pc_range[0] <= pc < self.pc_range[1]):
+            return
+
+        opcode = instr & 0x7F
+        rd = 0
+        rd_value = 0
+        mem_addr = 0
+        mem_data = 0
+        mem_size = 0
+        flags = 0
+        if iss.trapped:
+            flags = REC_TRAP  # Load/store lệch biên, ecall, CSR không hợp lệ: không có kết quả
+        elif opcode in RD_WRITE_OPCODES:
+            rd = (instr >> 7) & 0x1F
+            rd_value = iss.regs[rd] & 0xFFFFFFFF
+            flags = REC_RD_WRITE
+        if iss.mem_valid:
+            mem_addr = iss.mem_addr
+            mem_data = iss.mem_data & 0xFFFFFFFF
+            if opcode == OPCODE_LOAD:
+                mem_size = LOAD_SIZES.get((instr >> 12) & 0x7, 0)
+                flags |= REC_MEM_READ
+            else:
+                mem_size = STORE_SIZES.get((instr >> 12) & 0x7, 0)
+                flags |= REC_MEM_WRITE
+
+        count = self.count
+        slot = count % self.ring_size
+        if count % self.chunk_records == 0:
+            self.chunk_first_instret = instret
+        TRACE_RECORD.pack_into(self.ring, slot * TRACE_RECORD.size, instret, pc, instr,
+                               rd_value, mem_addr, mem_data, rd, priv, flags, mem_size)
+        count += 1
+        self.count = count
+        if count % self.chunk_records == 0:
+            self._emit_chunk(slot + 1 - self.chunk_records, self.chunk_records)
+
+    def _emit_chunk(self, first_slot, n):
+        if self.queue is None:
+            return
+        start = first_slot * TRACE_RECORD.size
+        payload = bytes(self.ring[start:start + n * TRACE_RECORD.size])
+        self.queue.put((n, self.chunk_first_instret, payload))
+
+    def _writer_loop(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            n, first_instret, payload = item
+            raw = payload
+            if self.compress_level:
+                payload = zlib.compress(payload, self.compress_level)
+            offset = self.file.tell()
+            self.file.write(CHUNK_HEADER.pack(len(payload), n, first_instret))
+            self.file.write(payload)
+            if self.index is not None:
+                self.index.add_chunk(offset, len(payload), raw)
+
+    def last(self, n=None):
+        """Trả về tối đa n record gần nhất (cũ -> mới) từ ring buffer."""
+        available = min(self.count, self.ring_size)
+        if n is None or n > available:
+            n = available
+        records = []
+        for i in range(self.count - n, self.count):
+            slot = i % self.ring_size
+            records.append(TRACE_RECORD.unpack_from(self.ring, slot * TRACE_RECORD.size))
+        return records
+
+    def dump_last(self, n=32):
+        for rec in self.last(n):
+            print(format_record(rec))
+
+    def close(self):
+        if self.file is None:
+            return
+        pending = self.count % self.chunk_records
+        if pending:
+            self._emit_chunk((self.count - pending) % self.ring_size, pending)
+        self.queue.put(None)
+        self.thread.join()
+        self.file.close()
+        self.file = None
+        if self.index is not None:
+            from TraceIndex import index_path_for
+            self.index.save(index_path_for(self.path))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class RetireCapture:
+    """Tracer nhẹ chỉ giữ thông tin retire của lệnh vừa chạy (rd, truy cập bộ nhớ)."""
+
+    def __init__(self):
+        self.rd = 0
+        self.rd_value = 0
+        self.flags = 0
+        self.mem_addr = 0
+        self.mem_data = 0
+
+    def record(self, iss, pc, instr, priv):
+        opcode = instr & 0x7F
+        flags = 0
+        self.rd = 0
+        self.rd_value = 0
+        self.mem_addr = 0
+        self.mem_data = 0
+        if iss.trapped:
+            flags = REC_TRAP
+        elif opcode in RD_WRITE_OPCODES and (instr >> 7) & 0x1F:
+            self.rd = (instr >> 7) & 0x1F
+            self.rd_value = iss.regs[self.rd] & 0xFFFFFFFF
+            flags = REC_RD_WRITE
+        if iss.mem_valid:
+            flags |= REC_MEM_READ if opcode == OPCODE_LOAD else REC_MEM_WRITE
+            self.mem_addr = iss.mem_addr
+            self.mem_data = iss.mem_data & 0xFFFFFFFF
+        self.flags = flags
+
+
+class TraceReader:
+    """Đọc file trace nhị phân do TraceWriter tạo ra."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            header = f.read(TRACE_HEADER.size)
+        if len(header) != TRACE_HEADER.size:
+            raise ValueError(f"Not a trace file: {path}")
+        magic, version, record_size, flags = TRACE_HEADER.unpack(header)
+        if magic != TRACE_MAGIC or record_size != TRACE_RECORD.size:
+            raise ValueError(f"Not a trace file: {path}")
+        self.version = version
+        self.compressed = bool(flags & TRACE_COMPRESSED)
+
+    def chunks(self):
+        """Duyệt (offset, record_count, first_instret, payload_len) của từng chunk, không giải nén."""
+        with open(self.path, "rb") as f:
+            offset = TRACE_HEADER.size
+            f.seek(offset)
+            while True:
+                header = f.read(CHUNK_HEADER.size)
+                if len(header) < CHUNK_HEADER.size:
+                    break
+                length, count, first_instret = CHUNK_HEADER.unpack(header)
+                yield offset, count, first_instret, length
+                offset += CHUNK_HEADER.size + length
+                f.seek(offset)
+
+    def decode_payload(self, payload):
+        if self.compressed:
+            payload = zlib.decompress(payload)
+        return payload
+
+    def records(self):
+        with open(self.path, "rb") as f:
+            for offset, count, _, length in self.chunks():
+                f.seek(offset + CHUNK_HEADER.size)
+                payload = self.decode_payload(f.read(length))
+                yield from TRACE_RECORD.iter_unpack(payload)
+
+
+def format_record(rec):
+    instret, pc, instr, rd_value, mem_addr, mem_data, rd, priv, flags, mem_size = rec
+    line = f"{instret:10d} {priv} 0x{pc:08x} (0x{instr:08x})"
+    if flags & REC_RD_WRITE:
+        line += f" x{rd:<2d} 0x{rd_value:08x}"
+    if flags & REC_MEM_READ:
+        line += f" mem[0x{mem_addr:08x}] -> 0x{mem_data:0{mem_size * 2}x}"
+    if flags & REC_MEM_WRITE:
+        line += f" mem[0x{mem_addr:08x}] <- 0x{mem_data:0{mem_size * 2}x}"
+    if flags & REC_TRAP:
+        line += " trap"
+    return line
+
+
+def main(argv):
+    if len(argv) < 2:
+        print("Usage: python Trace.py <trace file> [count]")
+        return 1
+    limit = int(argv[2]) if len(argv) > 2 else None
+    for i, rec in enumerate(TraceReader(argv[1]).records()):
+        if limit is not None and i >= limit:
+            break
+        print(format_record(rec))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,307 @@
+import argparse
+import bisect
+import mmap
+import struct
+import sys
+import zlib
+from array import array
+from functools import lru_cache
+
+from Trace import (TraceReader, TRACE_RECORD, CHUNK_HEADER, REC_MEM_READ, REC_MEM_WRITE,
+                   format_record)
+
+# Index cho file trace nhị phân (Trace.py), lưu ở "<trace>.idx".
+#
+# Checkpoint thưa: mỗi chunk của trace là một checkpoint (file offset, instret đầu tiên).
+# Inverted index: pc / địa chỉ word bị đọc / bị ghi -> danh sách chunk id có chứa nó.
+# Truy vấn chỉ giải nén các chunk cần thiết thay vì quét cả file.
+#
+# Layout file .idx (little-endian):
+#   header : magic(8s) version(H) reserved(H) chunk_count(I)
+#   chunks : chunk_count x (offset(Q) first_instret(Q) last_instret(Q) count(I) length(I))
+#   3 map  : pc, mem write, mem read -> key_count(I) + key_count x (key(I) n(I) n x chunk_id(I))
+
+INDEX_MAGIC = b"RVTIDX\0\0"
+INDEX_VERSION = 1
+INDEX_HEADER = struct.Struct("<8sHHI")
+INDEX_CHUNK = struct.Struct("<QQQII")
+INDEX_ENTRY = struct.Struct("<II")
+
+REC_INSTRET = 0
+REC_PC = 1
+REC_MEM_ADDR = 4
+REC_FLAGS = 8
+REC_MEM_SIZE = 9
+
+
+def index_path_for(trace_path):
+    return trace_path + ".idx"
+
+
+def _word_keys(addr, size):
+    """Các địa chỉ word (căn 4 byte) mà một truy cập [addr, addr + size) chạm tới."""
+    first = addr & ~0x3
+    last = (addr + max(size, 1) - 1) & ~0x3
+    return range(first, last + 4, 4)
+
+
+class TraceIndexBuilder:
+    """Xây dựng index từng chunk một (dùng bởi TraceWriter hoặc build_index)."""
+
+    def __init__(self):
+        self.chunks = []         # (offset, first_instret, last_instret, count, length)
+        self.pc_map = {}
+        self.write_map = {}
+        self.read_map = {}
+
+    @staticmethod
+    def _post(table, key, chunk_id):
+        postings = table.get(key)
+        if postings is None:
+            table[key] = array("I", (chunk_id,))
+        elif postings[-1] != chunk_id:
+            postings.append(chunk_id)
+
+    def add_chunk(self, offset, length, payload):
+        """payload: dữ liệu record đã giải nén của chunk."""
+        chunk_id = len(self.chunks)
+        count = len(payload) // TRACE_RECORD.size
+        first_instret = last_instret = 0
+        post = self._post
+        pc_map, write_map, read_map = self.pc_map, self.write_map, self.read_map
+        for rec in TRACE_RECORD.iter_unpack(payload):
+            post(pc_map, rec[REC_PC], chunk_id)
+            flags = rec[REC_FLAGS]
+            if flags & REC_MEM_WRITE:
+                for key in _word_keys(rec[REC_MEM_ADDR], rec[REC_MEM_SIZE]):
+                    post(write_map, key, chunk_id)
+            elif flags & REC_MEM_READ:
+                for key in _word_keys(rec[REC_MEM_ADDR], rec[REC_MEM_SIZE]):
+                    post(read_map, key, chunk_id)
+        if count:
+            first_instret = TRACE_RECORD.unpack_from(payload, 0)[REC_INSTRET]
+            last_instret = TRACE_RECORD.unpack_from(payload, len(payload) - TRACE_RECORD.size)[REC_INSTRET]
+        self.chunks.append((offset, first_instret, last_instret, count, length))
+
+    def save(self, path):
+        out = bytearray(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, 0, len(self.chunks)))
+        for chunk in self.chunks:
+            out += INDEX_CHUNK.pack(*chunk)
+        for table in (self.pc_map, self.write_map, self.read_map):
+            out += struct.pack("<I", len(table))
+            for key in sorted(table):
+                postings = table[key]
+                out += INDEX_ENTRY.pack(key, len(postings))
+                out += postings.tobytes()
+        with open(path, "wb") as f:
+            f.write(out)
+
+
+def build_index(trace_path, index_path=None):
+    """Quét một file trace có sẵn và ghi file index."""
+    reader = TraceReader(trace_path)
+    builder = TraceIndexBuilder()
+    with open(trace_path, "rb") as f:
+        for offset, count, first_instret, length in reader.chunks():
+            f.seek(offset + CHUNK_HEADER.size)
+            builder.add_chunk(offset, length, reader.decode_payload(f.read(length)))
+    builder.save(index_path or index_path_for(trace_path))
+    return builder
+
+
+class TraceQuery:
+    """
+    Truy vấn trace qua index: file trace được memory-map, chỉ các chunk liên quan
+    mới bị giải nén (và được cache lại).
+    """
+
+    def __init__(self, trace_path, index_path=None, cache_chunks=64):
+        self.reader = TraceReader(trace_path)
+        self.file = open(trace_path, "rb")
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._load_index(index_path or index_path_for(trace_path))
+        self._decode_chunk = lru_cache(maxsize=cache_chunks)(self._decode_chunk_uncached)
+
+    def _load_index(self, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        magic, version, _, n_chunks = INDEX_HEADER.unpack_from(data, 0)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            raise ValueError(f"Not a trace index: {path}")
+        pos = INDEX_HEADER.size
+        self.chunks = [INDEX_CHUNK.unpack_from(data, pos + i * INDEX_CHUNK.size) for i in range(n_chunks)]
+        pos += n_chunks * INDEX_CHUNK.size
+        self.chunk_first = [c[1] for c in self.chunks]
+
+        maps = []
+        for _ in range(3):
+            (n_keys,) = struct.unpack_from("<I", data, pos)
+            pos += 4
+            table = {}
+            for _ in range(n_keys):
+                key, n = INDEX_ENTRY.unpack_from(data, pos)
+                pos += INDEX_ENTRY.size
+                postings = array("I")
+                postings.frombytes(data[pos:pos + 4 * n])
+                pos += 4 * n
+                table[key] = postings
+            maps.append(table)
+        self.pc_map, self.write_map, self.read_map = maps
+
+    def close(self):
+        self.mm.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _decode_chunk_uncached(self, chunk_id):
+        offset, _, _, count, length = self.chunks[chunk_id]
+        start = offset + CHUNK_HEADER.size
+        payload = self.mm[start:start + length]
+        if self.reader.compressed:
+            payload = zlib.decompress(payload)
+        return list(TRACE_RECORD.iter_unpack(payload))
+
+    def chunk_records(self, chunk_id):
+        return self._decode_chunk(chunk_id)
+
+    # Checkpoint: tìm chunk chứa instret
+    def _locate(self, instret):
+        chunk_id = bisect.bisect_right(self.chunk_first, instret) - 1
+        if chunk_id < 0:
+            return 0, 0
+        records = self.chunk_records(chunk_id)
+        pos = bisect.bisect_left([r[REC_INSTRET] for r in records], instret)
+        if pos == len(records) and chunk_id + 1 < len(self.chunks):
+            return chunk_id + 1, 0
+        return chunk_id, pos
+
+    def record_at(self, instret):
+        chunk_id, pos = self._locate(instret)
+        if chunk_id >= len(self.chunks):
+            return None
+        records = self.chunk_records(chunk_id)
+        if pos < len(records) and records[pos][REC_INSTRET] == instret:
+            return records[pos]
+        return None
+
+    def window(self, instret, before=25, after=25):
+        """Các record xung quanh instret (tối đa before record trước, after record sau)."""
+        if not self.chunks:
+            return []
+        chunk_id, pos = self._locate(instret)
+        result = []
+        # Lùi lại before record
+        cid, p = chunk_id, pos
+        need = before
+        while need > 0 and cid >= 0:
+            records = self.chunk_records(cid)
+            take = min(need, p)
+            result[:0] = records[p - take:p]
+            need -= take
+            cid -= 1
+            if cid >= 0:
+                p = self.chunks[cid][3]
+        # Tiến tới after + 1 record (bao gồm record tại instret)
+        cid, p = chunk_id, pos
+        need = after + 1
+        while need > 0 and cid < len(self.chunks):
+            records = self.chunk_records(cid)
+            take = records[p:p + need]
+            result.extend(take)
+            need -= len(take)
+            cid += 1
+            p = 0
+        return result
+
+    def visits(self, pc):
+        """Duyệt các record có PC = pc theo thứ tự thời gian."""
+        for chunk_id in self.pc_map.get(pc, ()):
+            for rec in self.chunk_records(chunk_id):
+                if rec[REC_PC] == pc:
+                    yield rec
+
+    def first_visit(self, pc):
+        return next(self.visits(pc), None)
+
+    def _accesses_before(self, table, flag, addr, instret):
+        postings = table.get(addr & ~0x3, ())
+        for chunk_id in reversed(postings):
+            if self.chunks[chunk_id][1] >= instret:
+                continue
+            for rec in reversed(self.chunk_records(chunk_id)):
+                if rec[REC_INSTRET] >= instret or not rec[REC_FLAGS] & flag:
+                    continue
+                start = rec[REC_MEM_ADDR]
+                if start <= addr < start + max(rec[REC_MEM_SIZE], 1):
+                    return rec
+        return None
+
+    def last_write_before(self, addr, instret):
+        """Lần ghi gần nhất vào byte addr xảy ra trước instret (None nếu không có)."""
+        return self._accesses_before(self.write_map, REC_MEM_WRITE, addr, instret)
+
+    def last_read_before(self, addr, instret):
+        return self._accesses_before(self.read_map, REC_MEM_READ, addr, instret)
+
+
+def _print_records(records, mark=None):
+    for rec in records:
+        prefix = "=>" if mark is not None and rec[REC_INSTRET] == mark else "  "
+        print(prefix, format_record(rec))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build and query RISC-V binary trace indexes")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("build", help="build <trace>.idx")
+    p.add_argument("trace")
+
+    p = sub.add_parser("at", help="show instructions around instret N")
+    p.add_argument("trace")
+    p.add_argument("instret", type=int)
+    p.add_argument("--context", type=int, default=25)
+
+    p = sub.add_parser("pc", help="show instructions around the first visit to PC")
+    p.add_argument("trace")
+    p.add_argument("pc", type=lambda s: int(s, 0))
+    p.add_argument("--context", type=int, default=25)
+
+    p = sub.add_parser("lastwrite", help="last write to ADDR before instret N")
+    p.add_argument("trace")
+    p.add_argument("addr", type=lambda s: int(s, 0))
+    p.add_argument("instret", type=int)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        builder = build_index(args.trace)
+        print(f"Indexed {len(builder.chunks)} chunk(s), {len(builder.pc_map)} PC(s), "
+              f"{len(builder.write_map)} written word(s)")
+        return 0
+
+    with TraceQuery(args.trace) as q:
+        if args.command == "at":
+            _print_records(q.window(args.instret, args.context, args.context), mark=args.instret)
+        elif args.command == "pc":
+            rec = q.first_visit(args.pc)
+            if rec is None:
+                print(f"PC 0x{args.pc:08x} never executed")
+                return 1
+            _print_records(q.window(rec[REC_INSTRET], args.context, args.context), mark=rec[REC_INSTRET])
+        elif args.command == "lastwrite":
+            rec = q.last_write_before(args.addr, args.instret)
+            if rec is None:
+                print(f"No write to 0x{args.addr:08x} before instret {args.instret}")
+                return 1
+            print(format_record(rec))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,325 @@
+from CSR import TSelect, TData1, TData2, TRIGGER_CSR_ADDRESSES
+
+# Trigger module (RISC-V Debug spec, Sdtrig) cho RISCV_ISS: tselect/tdata1/tdata2.
+#
+# Hỗ trợ hai loại trigger:
+#   mcontrol (type 2): watchpoint load/store theo địa chỉ. match = 0 (bằng), 1 (NAPOT),
+#       2 (>=), 3 (<); chain = 1 nối trigger với trigger kế tiếp (ví dụ >= a chain < b
+#       = khoảng [a, b)). Khớp khi bất kỳ byte nào của lần truy cập nằm trong khoảng.
+#       execute luôn đọc là 0: breakpoint lệnh dùng Breakpoints.py.
+#   icount (type 3): khớp sau khi retire đủ count lệnh (chạy bằng run()), dùng để chạy
+#       N lệnh rồi dừng mà debugger không phải step từng lệnh. Đếm ở mọi privilege
+#       (bit u/s luôn đọc là 1).
+# action = 0: exception Breakpoint, action = 1: dừng hart (vào debug mode).
+#
+# Mỗi lần ghi tdata1/tdata2, các chain đang bật được dịch thành Watch (khoảng địa chỉ
+# [lo, hi)) và cài vào ISS bằng set_watchpoints(): chỉ load/store vào trang có watchpoint
+# mới phải so khớp.
+
+TRIGGER_COUNT = 4
+
+TYPE_SHIFT = 28
+TYPE_NONE = 0
+TYPE_MCONTROL = 2
+TYPE_ICOUNT = 3
+TYPE_DISABLED = 15
+DMODE = 1 << 27
+
+# tdata1 khi type = mcontrol (RV32)
+MCONTROL_MASKMAX_SHIFT = 21
+MCONTROL_HIT = 1 << 20
+MCONTROL_ACTION_SHIFT = 12
+MCONTROL_CHAIN = 1 << 11
+MCONTROL_MATCH_SHIFT = 7
+MCONTROL_M = 1 << 6
+MCONTROL_S = 1 << 4
+MCONTROL_U = 1 << 3
+MCONTROL_EXECUTE = 1 << 2
+MCONTROL_STORE = 1 << 1
+MCONTROL_LOAD = 1 << 0
+MCONTROL_MASKMAX = 31    # NAPOT tới 2^31 byte
+
+MATCH_EQUAL = 0
+MATCH_NAPOT = 1
+MATCH_GE = 2
+MATCH_LT = 3
+
+# tdata1 khi type = icount
+ICOUNT_HIT = 1 << 24
+ICOUNT_COUNT_SHIFT = 10
+ICOUNT_COUNT_MASK = 0x3FFF
+ICOUNT_M = 1 << 9
+ICOUNT_S = 1 << 7
+ICOUNT_U = 1 << 6
+
+ACTION_BREAKPOINT = 0
+ACTION_DEBUG = 1
+
+
+class Trigger:
+    """Một trigger (tdata1/tdata2); chỉ ghi được qua TriggerModule."""
+
+    def __init__(self, index):
+        self.index = index
+        self.tdata1 = TData1()
+        self.tdata2 = TData2()
+        self.count = 0  # icount: số lệnh còn lại
+
+    @property
+    def type(self):
+        return int(self.tdata1.read(), 2) >> TYPE_SHIFT
+
+    @property
+    def halts(self):
+        return self.action == ACTION_DEBUG
+
+    @property
+    def action(self):
+        value = int(self.tdata1.read(), 2)
+        if self.type == TYPE_ICOUNT:
+            return value & 0x3F
+        return (value >> MCONTROL_ACTION_SHIFT) & 0xF
+
+    def read_tdata1(self):
+        value = int(self.tdata1.read(), 2)
+        if value >> TYPE_SHIFT == TYPE_ICOUNT:
+            value = (value & ~(ICOUNT_COUNT_MASK << ICOUNT_COUNT_SHIFT)) | (self.count << ICOUNT_COUNT_SHIFT)
+        return value
+
+    def write_tdata1(self, value):
+        """Ghi tdata1 (WARL): field không hỗ trợ bị bỏ, type không hỗ trợ -> 0 (không có trigger)."""
+        kind = (value >> TYPE_SHIFT) & 0xF
+        action = ACTION_DEBUG if value & DMODE and (value >> MCONTROL_ACTION_SHIFT) & 0xF == ACTION_DEBUG \
+            else ACTION_BREAKPOINT
+        if kind == TYPE_MCONTROL:
+            value &= (DMODE | MCONTROL_HIT | MCONTROL_CHAIN | (0x3 << MCONTROL_MATCH_SHIFT) |
+                      MCONTROL_M | MCONTROL_S | MCONTROL_U | MCONTROL_STORE | MCONTROL_LOAD)
+            value |= (TYPE_MCONTROL << TYPE_SHIFT) | (MCONTROL_MASKMAX << MCONTROL_MASKMAX_SHIFT)
+            value |= action << MCONTROL_ACTION_SHIFT
+        elif kind == TYPE_ICOUNT:
+            action = ACTION_DEBUG if value & DMODE and value & 0x3F == ACTION_DEBUG else ACTION_BREAKPOINT
+            self.count = (value >> ICOUNT_COUNT_SHIFT) & ICOUNT_COUNT_MASK
+            value &= DMODE | ICOUNT_HIT | (ICOUNT_COUNT_MASK << ICOUNT_COUNT_SHIFT) | ICOUNT_M
+            value |= (TYPE_ICOUNT << TYPE_SHIFT) | ICOUNT_S | ICOUNT_U | action
+        elif kind == TYPE_DISABLED:
+            value = TYPE_DISABLED << TYPE_SHIFT
+        else:
+            value = 0
+        self.tdata1.write(f"{value:032b}")
+
+    def fire(self):
+        """Đặt bit hit trong tdata1."""
+        value = int(self.tdata1.read(), 2)
+        value |= ICOUNT_HIT if value >> TYPE_SHIFT == TYPE_ICOUNT else MCONTROL_HIT
+        self.tdata1.write(f"{value:032b}")
+
+    def address_range(self):
+        """Khoảng [lo, hi) mà trigger mcontrol so khớp."""
+        value = int(self.tdata1.read(), 2)
+        address = int(self.tdata2.read(), 2)
+        match = (value >> MCONTROL_MATCH_SHIFT) & 0x3
+        if match == MATCH_EQUAL:
+            return address, address + 1
+        if match == MATCH_NAPOT:
+            ones = 0
+            while ones < MCONTROL_MASKMAX - 1 and (address >> ones) & 1:
+                ones += 1
+            size = 1 << (ones + 1)
+            base = address & ~(size - 1)
+            return base, base + size
+        if match == MATCH_GE:
+            return address, 1 << 32
+        return 0, address
+
+    def describe(self):
+        value = self.read_tdata1()
+        kind = value >> TYPE_SHIFT
+        hit = " hit" if value & (ICOUNT_HIT if kind == TYPE_ICOUNT else MCONTROL_HIT) else ""
+        action = "halt" if self.halts else "exception"
+        if kind == TYPE_ICOUNT:
+            return f"[{self.index}] icount count={self.count} action={action}{hit}"
+        if kind == TYPE_MCONTROL:
+            access = ("r" if value & MCONTROL_LOAD else "") + ("w" if value & MCONTROL_STORE else "")
+            match = ("==", "napot", ">=", "<")[(value >> MCONTROL_MATCH_SHIFT) & 0x3]
+            chain = " chain" if value & MCONTROL_CHAIN else ""
+            return (f"[{self.index}] mcontrol {access or '-'} {match} 0x{int(self.tdata2.read(), 2):08x}"
+                    f"{chain} action={action}{hit}")
+        return f"[{self.index}] {'disabled' if kind == TYPE_DISABLED else 'none'}"
+
+    def __repr__(self):
+        return f"Trigger({self.describe()})"
+
+
+class Watch:
+    """Chain mcontrol đã dịch: khoảng [lo, hi), loại truy cập và privilege khớp."""
+    __slots__ = ("triggers", "lo", "hi", "load", "store", "privs")
+
+    def __init__(self, triggers, lo, hi, load, store, privs):
+        self.triggers = triggers
+        self.lo = lo
+        self.hi = hi
+        self.load = load
+        self.store = store
+        self.privs = privs  # bit 0: U-mode, bit 1: S-mode
+
+    @property
+    def halts(self):
+        return self.triggers[-1].halts  # action của trigger cuối chain
+
+    def matches(self, iss, addr, size, store):
+        return ((self.store if store else self.load) and addr < self.hi and addr + size > self.lo
+                and (self.privs >> iss.privilege_level) & 1)
+
+    def fire(self):
+        for trigger in self.triggers:
+            trigger.fire()
+
+    def __repr__(self):
+        return f"Watch(0x{self.lo:08x}..0x{self.hi:08x}, load={self.load}, store={self.store})"
+
+
+def compile_chain(chain):
+    """Dịch một chain trigger mcontrol thành Watch, None nếu chain không so khớp gì."""
+    lo, hi = 0, 1 << 32
+    load = store = True
+    privs = 0b11
+    for trigger in chain:
+        if trigger.type != TYPE_MCONTROL:
+            return None
+        value = int(trigger.tdata1.read(), 2)
+        t_lo, t_hi = trigger.address_range()
+        lo, hi = max(lo, t_lo), min(hi, t_hi)
+        load = load and bool(value & MCONTROL_LOAD)
+        store = store and bool(value & MCONTROL_STORE)
+        privs &= (1 if value & MCONTROL_U else 0) | (2 if value & MCONTROL_S else 0)
+    if lo >= hi or not (load or store) or not privs:
+        return None
+    return Watch(tuple(chain), lo, hi, load, store, privs)
+
+
+class TriggerModule:
+    """tselect/tdata1/tdata2 của một hart; cập nhật watchpoint và icount của ISS sau mỗi lần ghi."""
+
+    def __init__(self, iss, count=TRIGGER_COUNT):
+        self.iss = iss
+        self.tselect = TSelect()
+        self.triggers = [Trigger(i) for i in range(count)]
+
+    def selected(self):
+        return self.triggers[int(self.tselect.read(), 2)]
+
+    def read_csr(self, name):
+        if name == "tselect":
+            return int(self.tselect.read(), 2)
+        if name == "tdata1":
+            return self.selected().read_tdata1()
+        if name == "tdata2":
+            return int(self.selected().tdata2.read(), 2)
+        raise ValueError(f"Unknown trigger CSR: {name}")
+
+    def write_csr(self, name, value):
+        if isinstance(name, int):
+            name = TRIGGER_CSR_ADDRESSES[name]
+        value &= 0xFFFFFFFF
+        if name == "tselect":
+            if value < len(self.triggers):  # WARL: index không tồn tại thì giữ nguyên
+                self.tselect.write(f"{value:032b}")
+            return
+        trigger = self.selected()
+        if name == "tdata1":
+            trigger.write_tdata1(value)
+        elif name == "tdata2":
+            trigger.tdata2.write(f"{value:032b}")
+        else:
+            raise ValueError(f"Unknown trigger CSR: {name}")
+        self.update()
+
+    def update(self):
+        """Dịch các chain đang bật thành Watch và cài vào ISS cùng với icount trigger."""
+        watches = []
+        chain = []
+        icount = None
+        for trigger in self.triggers:
+            kind = trigger.type
+            if kind == TYPE_ICOUNT:
+                if icount is None and trigger.count:
+                    icount = trigger
+                chain = []
+                continue
+            if kind != TYPE_MCONTROL:
+                chain = []
+                continue
+            chain.append(trigger)
+            if int(trigger.tdata1.read(), 2) & MCONTROL_CHAIN and trigger.index + 1 < len(self.triggers):
+                continue
+            watch = compile_chain(chain)
+            if watch is not None:
+                watches.append(watch)
+            chain = []
+        self.iss.set_watchpoints(watches)
+        self.iss.icount_trigger = icount
+
+    # Tiện ích cho debugger: tự chọn trigger trống và ghi tdata1/tdata2
+
+    def free_triggers(self):
+        return [t.index for t in self.triggers if t.type in (TYPE_NONE, TYPE_DISABLED)]
+
+    def _program(self, index, tdata1, tdata2=0):
+        self.write_csr("tselect", index)
+        self.write_csr("tdata2", tdata2)
+        self.write_csr("tdata1", tdata1)
+
+    def watch(self, start, end=None, load=False, store=True, action=ACTION_DEBUG):
+        """
+        Watchpoint cho [start, end) (mặc định 1 byte). Dùng một trigger (== hoặc NAPOT) nếu
+        được, ngược lại hai trigger liên tiếp >= start chain < end. Trả về danh sách index.
+        """
+        end = start + 1 if end is None else end
+        if end <= start:
+            raise ValueError("Watch range is empty")
+        flags = (DMODE | (action << MCONTROL_ACTION_SHIFT) | MCONTROL_S | MCONTROL_U |
+                 (MCONTROL_LOAD if load else 0) | (MCONTROL_STORE if store else 0) |
+                 (TYPE_MCONTROL << TYPE_SHIFT))
+        free = self.free_triggers()
+        size = end - start
+        if size == 1 or (size & (size - 1) == 0 and start % size == 0):
+            if not free:
+                raise ValueError("No free trigger")
+            if size == 1:
+                self._program(free[0], flags | (MATCH_EQUAL << MCONTROL_MATCH_SHIFT), start)
+            else:
+                self._program(free[0], flags | (MATCH_NAPOT << MCONTROL_MATCH_SHIFT), start | (size // 2 - 1))
+            return [free[0]]
+        for index in free:
+            if index + 1 in free:
+                self._program(index, flags | MCONTROL_CHAIN | (MATCH_GE << MCONTROL_MATCH_SHIFT), start)
+                self._program(index + 1, flags | (MATCH_LT << MCONTROL_MATCH_SHIFT), end)
+                return [index, index + 1]
+        raise ValueError("No two adjacent free triggers for a range watchpoint")
+
+    def icount(self, count, action=ACTION_DEBUG):
+        """Dừng sau count lệnh (1..16383); trả về index trigger."""
+        if not 0 < count <= ICOUNT_COUNT_MASK:
+            raise ValueError(f"icount must be between 1 and {ICOUNT_COUNT_MASK}")
+        index = next((t.index for t in self.triggers if t.type == TYPE_ICOUNT), None)
+        if index is None:
+            free = self.free_triggers()
+            if not free:
+                raise ValueError("No free trigger")
+            index = free[0]
+        self._program(index, (TYPE_ICOUNT << TYPE_SHIFT) | DMODE | (count << ICOUNT_COUNT_SHIFT) | action)
+        return index
+
+    def clear(self, index):
+        """Tắt trigger index (và phần còn lại của chain nếu trigger trước đó chain vào nó)."""
+        chained = [index]
+        if index > 0 and self.triggers[index - 1].type == TYPE_MCONTROL and \
+                int(self.triggers[index - 1].tdata1.read(), 2) & MCONTROL_CHAIN:
+            chained.append(index - 1)
+        if self.triggers[index].type == TYPE_MCONTROL and int(self.triggers[index].tdata1.read(), 2) & MCONTROL_CHAIN:
+            chained.append(index + 1)
+        for i in chained:
+            self._program(i, 0)
+
+    def describe(self):
+        return [trigger.describe() for trigger in self.triggers]
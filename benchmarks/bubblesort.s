@@ -0,0 +1,42 @@
+# Bubble sort of 100 pseudo-random words
+.text
+    lui x8, 3
+    addi x5, x0, 0
+    addi x6, x0, 100
+    addi x7, x0, 7
+    addi x11, x8, 0
+gen:
+    slli x12, x7, 2
+    add x7, x7, x12
+    addi x7, x7, 1
+    andi x7, x7, 2047
+    sw x7, 0(x11)
+    addi x11, x11, 4
+    addi x5, x5, 1
+    blt x5, x6, gen
+    addi x5, x6, -1
+outer:
+    addi x11, x8, 0
+    slli x13, x5, 2
+    add x13, x13, x8
+inner:
+    lw x14, 0(x11)
+    lw x15, 4(x11)
+    bge x15, x14, noswap
+    sw x15, 0(x11)
+    sw x14, 4(x11)
+noswap:
+    addi x11, x11, 4
+    blt x11, x13, inner
+    addi x5, x5, -1
+    blt x0, x5, outer
+    addi x10, x0, 0
+    addi x5, x0, 0
+    addi x11, x8, 0
+csum:
+    lw x14, 0(x11)
+    xor x14, x14, x5
+    add x10, x10, x14
+    addi x11, x11, 4
+    addi x5, x5, 1
+    blt x5, x6, csum
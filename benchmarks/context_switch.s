@@ -0,0 +1,41 @@
+# CSR-heavy context switch: every ecall saves/restores registers through sscratch
+# and reads/writes scause, sepc, stval and sstatus; x10 = sum of trap causes
+.text
+    j start
+handler:
+    csrrw x31, sscratch, x31
+    sw x1, 0(x31)
+    sw x2, 4(x31)
+    sw x3, 8(x31)
+    sw x4, 12(x31)
+    sw x5, 16(x31)
+    csrrw x1, scause, x0
+    csrrw x2, sepc, x0
+    csrrw x3, stval, x0
+    csrrw x4, sstatus, x0
+    csrrw x0, sstatus, x4
+    addi x2, x2, 4
+    csrrw x0, sepc, x2
+    csrrw x0, scause, x1
+    lw x5, 64(x31)
+    add x5, x5, x1
+    sw x5, 64(x31)
+    lw x1, 0(x31)
+    lw x2, 4(x31)
+    lw x3, 8(x31)
+    lw x4, 12(x31)
+    lw x5, 16(x31)
+    csrrw x31, sscratch, x31
+    sret
+start:
+    addi x29, x0, 4
+    csrrw x0, stvec, x29
+    lui x28, 3
+    csrrw x0, sscratch, x28
+    addi x5, x0, 0
+    addi x6, x0, 1500
+cloop:
+    ecall
+    addi x5, x5, 1
+    blt x5, x6, cloop
+    lw x10, 64(x28)
@@ -0,0 +1,46 @@
+# Bitwise CRC-32 (poly 0xEDB88320, init 0) over 256 pseudo-random words
+.text
+    lui x8, 3
+    addi x5, x0, 0
+    addi x6, x0, 256
+    addi x17, x0, 5
+    addi x11, x8, 0
+gen:
+    slli x12, x17, 2
+    add x17, x17, x12
+    addi x17, x17, 3
+    andi x17, x17, 2047
+    slli x18, x17, 11
+    or x18, x18, x17
+    slli x19, x17, 20
+    or x18, x18, x19
+    sw x18, 0(x11)
+    addi x11, x11, 4
+    addi x5, x5, 1
+    blt x5, x6, gen
+    lui x7, 0xEDB88
+    addi x7, x7, 800
+    addi x10, x0, 0
+    addi x5, x0, 0
+    addi x11, x8, 0
+crcword:
+    lw x12, 0(x11)
+    addi x13, x0, 4
+crcbyte:
+    andi x14, x12, 255
+    xor x10, x10, x14
+    srli x12, x12, 8
+    addi x15, x0, 8
+crcbit:
+    andi x16, x10, 1
+    srli x10, x10, 1
+    beq x16, x0, crcnext
+    xor x10, x10, x7
+crcnext:
+    addi x15, x15, -1
+    bne x15, x0, crcbit
+    addi x13, x13, -1
+    bne x13, x0, crcbyte
+    addi x11, x11, 4
+    addi x5, x5, 1
+    blt x5, x6, crcword
@@ -0,0 +1,28 @@
+# Dhrystone-style integer mix: ALU, record load/store, compare and branch
+.text
+    addi x10, x0, 0
+    addi x5, x0, 0
+    addi x6, x0, 2000
+    lui x8, 2
+loop:
+    addi x11, x5, 7
+    slli x12, x11, 3
+    xor x13, x12, x5
+    andi x13, x13, 1023
+    sw x13, 0(x8)
+    sw x11, 4(x8)
+    lw x14, 0(x8)
+    lw x15, 4(x8)
+    sub x16, x14, x15
+    slt x17, x16, x0
+    beq x17, x0, positive
+    sub x16, x0, x16
+positive:
+    add x10, x10, x16
+    srli x18, x14, 2
+    or x19, x18, x15
+    add x10, x10, x19
+    sltu x20, x14, x15
+    add x10, x10, x20
+    addi x5, x5, 1
+    blt x5, x6, loop
@@ -0,0 +1,19 @@
+# Trap-heavy loop: 2000 ecalls, the handler skips the ecall and counts traps in x10
+.text
+    j start
+handler:
+    csrrw x30, sepc, x0
+    addi x30, x30, 4
+    csrrw x0, sepc, x30
+    addi x10, x10, 1
+    sret
+start:
+    addi x29, x0, 4
+    csrrw x0, stvec, x29
+    addi x10, x0, 0
+    addi x5, x0, 0
+    addi x6, x0, 2000
+eloop:
+    ecall
+    addi x5, x5, 1
+    blt x5, x6, eloop
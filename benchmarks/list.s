@@ -0,0 +1,33 @@
+# CoreMark-like list kernel: build a 200-node linked list, walk it 50 times
+.text
+    lui x8, 4
+    addi x5, x0, 0
+    addi x6, x0, 200
+    addi x7, x0, 1234
+    addi x9, x8, 0
+build:
+    slli x11, x7, 2
+    add x7, x7, x11
+    addi x7, x7, 17
+    andi x7, x7, 1023
+    sw x7, 0(x9)
+    addi x11, x9, 8
+    sw x11, 4(x9)
+    addi x9, x9, 8
+    addi x5, x5, 1
+    blt x5, x6, build
+    sw x0, -4(x9)
+    addi x10, x0, 0
+    addi x20, x0, 0
+    addi x21, x0, 50
+outer:
+    addi x9, x8, 0
+walk:
+    lw x11, 0(x9)
+    add x10, x10, x11
+    slti x12, x11, 512
+    add x10, x10, x12
+    lw x9, 4(x9)
+    bne x9, x0, walk
+    addi x20, x20, 1
+    blt x20, x21, outer
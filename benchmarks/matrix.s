@@ -0,0 +1,75 @@
+# CoreMark-like matrix kernel: 8x8 matrix multiply with shift-add multiplication
+.text
+    lui x8, 5
+    addi x9, x8, 256
+    addi x18, x9, 256
+    addi x20, x0, 8
+    addi x5, x0, 0
+initi:
+    addi x6, x0, 0
+initj:
+    slli x11, x6, 1
+    add x11, x11, x5
+    andi x11, x11, 15
+    slli x12, x5, 1
+    add x12, x12, x5
+    add x12, x12, x6
+    andi x12, x12, 15
+    slli x13, x5, 5
+    slli x14, x6, 2
+    add x13, x13, x14
+    add x14, x8, x13
+    sw x11, 0(x14)
+    add x14, x9, x13
+    sw x12, 0(x14)
+    addi x6, x6, 1
+    blt x6, x20, initj
+    addi x5, x5, 1
+    blt x5, x20, initi
+    addi x10, x0, 0
+    addi x25, x0, 0
+    addi x26, x0, 4
+rep:
+    addi x5, x0, 0
+mi:
+    addi x6, x0, 0
+mj:
+    addi x7, x0, 0
+    addi x19, x0, 0
+mk:
+    slli x11, x5, 5
+    slli x12, x7, 2
+    add x11, x11, x12
+    add x11, x11, x8
+    lw x13, 0(x11)
+    slli x11, x7, 5
+    slli x12, x6, 2
+    add x11, x11, x12
+    add x11, x11, x9
+    lw x14, 0(x11)
+    addi x15, x0, 0
+    beq x14, x0, muldone
+mul:
+    andi x16, x14, 1
+    beq x16, x0, mulskip
+    add x15, x15, x13
+mulskip:
+    slli x13, x13, 1
+    srli x14, x14, 1
+    bne x14, x0, mul
+muldone:
+    add x19, x19, x15
+    addi x7, x7, 1
+    blt x7, x20, mk
+    slli x11, x5, 5
+    slli x12, x6, 2
+    add x11, x11, x12
+    add x11, x11, x18
+    sw x19, 0(x11)
+    add x10, x10, x19
+    addi x6, x6, 1
+    blt x6, x20, mj
+    addi x5, x5, 1
+    blt x5, x20, mi
+    addi x25, x25, 1
+    blt x25, x26, rep
@@ -0,0 +1,42 @@
+# memcpy: copy 1 KiB word by word (unrolled x4) 20 times, then checksum the copy
+.text
+    lui x8, 6
+    lui x9, 7
+    addi x5, x0, 0
+    addi x6, x0, 256
+    addi x11, x8, 0
+fill:
+    slli x12, x5, 1
+    add x12, x12, x5
+    sw x12, 0(x11)
+    addi x11, x11, 4
+    addi x5, x5, 1
+    blt x5, x6, fill
+    addi x20, x0, 0
+    addi x21, x0, 20
+again:
+    addi x11, x8, 0
+    addi x12, x9, 0
+    addi x13, x8, 1024
+copy:
+    lw x14, 0(x11)
+    lw x15, 4(x11)
+    lw x16, 8(x11)
+    lw x17, 12(x11)
+    sw x14, 0(x12)
+    sw x15, 4(x12)
+    sw x16, 8(x12)
+    sw x17, 12(x12)
+    addi x11, x11, 16
+    addi x12, x12, 16
+    blt x11, x13, copy
+    addi x20, x20, 1
+    blt x20, x21, again
+    addi x10, x0, 0
+    addi x11, x9, 0
+    addi x13, x9, 1024
+sum:
+    lw x14, 0(x11)
+    add x10, x10, x14
+    addi x11, x11, 4
+    blt x11, x13, sum
@@ -0,0 +1,75 @@
+# Quicksort (Lomuto partition, explicit stack instead of recursion) of 300 words
+.text
+    lui x8, 3
+    addi x5, x0, 0
+    addi x6, x0, 300
+    addi x7, x0, 11
+    addi x11, x8, 0
+gen:
+    slli x12, x7, 2
+    add x7, x7, x12
+    addi x7, x7, 1
+    andi x7, x7, 2047
+    sw x7, 0(x11)
+    addi x11, x11, 4
+    addi x5, x5, 1
+    blt x5, x6, gen
+    lui x27, 9
+    lui x28, 9
+    addi x12, x0, 0
+    addi x13, x6, -1
+    sw x12, 0(x28)
+    sw x13, 4(x28)
+    addi x28, x28, 8
+qs:
+    beq x28, x27, qsdone
+    addi x28, x28, -8
+    lw x12, 0(x28)
+    lw x13, 4(x28)
+    bge x12, x13, qs
+    slli x14, x13, 2
+    add x14, x14, x8
+    lw x15, 0(x14)
+    addi x16, x12, -1
+    addi x17, x12, 0
+part:
+    bge x17, x13, partdone
+    slli x18, x17, 2
+    add x18, x18, x8
+    lw x19, 0(x18)
+    blt x15, x19, partnext
+    addi x16, x16, 1
+    slli x20, x16, 2
+    add x20, x20, x8
+    lw x21, 0(x20)
+    sw x19, 0(x20)
+    sw x21, 0(x18)
+partnext:
+    addi x17, x17, 1
+    j part
+partdone:
+    addi x16, x16, 1
+    slli x20, x16, 2
+    add x20, x20, x8
+    lw x21, 0(x20)
+    sw x15, 0(x20)
+    sw x21, 0(x14)
+    addi x22, x16, -1
+    sw x12, 0(x28)
+    sw x22, 4(x28)
+    addi x22, x16, 1
+    sw x22, 8(x28)
+    sw x13, 12(x28)
+    addi x28, x28, 16
+    j qs
+qsdone:
+    addi x10, x0, 0
+    addi x5, x0, 0
+    addi x11, x8, 0
+csum:
+    lw x14, 0(x11)
+    xor x14, x14, x5
+    add x10, x10, x14
+    addi x11, x11, 4
+    addi x5, x5, 1
+    blt x5, x6, csum
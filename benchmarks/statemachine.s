@@ -0,0 +1,41 @@
+# CoreMark-like state machine: 4-state scanner over a pseudo-random symbol stream
+.text
+    addi x5, x0, 0
+    addi x6, x0, 2000
+    addi x7, x0, 99
+    addi x8, x0, 0
+    addi x10, x0, 0
+sm:
+    slli x11, x7, 2
+    add x7, x7, x11
+    addi x7, x7, 13
+    andi x7, x7, 2047
+    srli x12, x7, 3
+    andi x12, x12, 3
+    beq x8, x0, s0
+    addi x13, x0, 1
+    beq x8, x13, s1
+    addi x13, x0, 2
+    beq x8, x13, s2
+    addi x8, x0, 0
+    j next
+s0:
+    beq x12, x0, next
+    addi x8, x0, 1
+    j next
+s1:
+    addi x13, x0, 2
+    blt x12, x13, next
+    addi x8, x0, 2
+    j next
+s2:
+    addi x13, x0, 3
+    beq x12, x13, s2to3
+    addi x8, x0, 0
+    j next
+s2to3:
+    addi x8, x0, 3
+next:
+    add x10, x10, x8
+    addi x5, x5, 1
+    blt x5, x6, sm
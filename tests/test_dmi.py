@@ -0,0 +1,92 @@
+import pytest
+
+import DMI
+import RISCV_asembler as asm
+from DMI import (
+    ABSTRACTCS, ABSTRACTCS_CMDERR_SHIFT, CMDERR_EXCEPTION, CMDERR_NONE, COMMAND, COMMAND_POSTEXEC,
+    COMMAND_SIZE_SHIFT, COMMAND_TRANSFER, COMMAND_WRITE, DATA0, DMCONTROL, DMCONTROL_DMACTIVE,
+    DMCONTROL_HALTREQ, DMCONTROL_RESUMEREQ, DMSTATUS, DMSTATUS_ALLHALTED, DMSTATUS_ALLRESUMEACK,
+    DMSTATUS_ALLRUNNING, EBREAK, PROGBUF0, REGNO_GPR, SIZE_WORD,
+)
+from DebugModule import DebugModule
+from ISS import RISCV_ISS
+
+SOURCE = """.text
+_start:
+  addi x1, x0, 5
+  lui x2, 3
+  sw x1, 0(x2)
+  lw x3, 0(x2)
+  addi x4, x0, 7
+"""
+
+
+def word(*args):
+    return int(asm.encode_i_type(*args), 2)
+
+
+@pytest.fixture
+def dmi():
+    iss = RISCV_ISS(0x10000)
+    iss.verbose = False
+    iss.load_image(asm.assemble_string(SOURCE))
+    dmi = DebugModule(iss).dmi
+    dmi.write(DMCONTROL, DMCONTROL_DMACTIVE | DMCONTROL_HALTREQ)
+    assert dmi.read(DMSTATUS) & DMSTATUS_ALLHALTED
+    return dmi
+
+
+def cmderr(dmi):
+    return (dmi.read(ABSTRACTCS) >> ABSTRACTCS_CMDERR_SHIFT) & 0x7
+
+
+def write_gpr(dmi, number, value):
+    dmi.write(DATA0, value)
+    dmi.write(COMMAND, COMMAND_TRANSFER | COMMAND_WRITE | (SIZE_WORD << COMMAND_SIZE_SHIFT) | (REGNO_GPR + number))
+
+
+def read_gpr(dmi, number):
+    dmi.write(COMMAND, COMMAND_TRANSFER | (SIZE_WORD << COMMAND_SIZE_SHIFT) | (REGNO_GPR + number))
+    return dmi.read(DATA0)
+
+
+def test_access_register_round_trip(dmi):
+    write_gpr(dmi, 9, 0x89ABCDEF)
+    assert read_gpr(dmi, 9) == 0x89ABCDEF
+    assert dmi.iss.regs[9] == 0x89ABCDEF
+    assert cmderr(dmi) == CMDERR_NONE
+
+
+def test_system_bus_memory_round_trip(dmi):
+    words = [(i * 0x01010101) ^ 0xA5A5A5A5 for i in range(64)]
+    DMI.write_memory(dmi, 0x4000, words)
+    assert DMI.read_memory(dmi, 0x4000, len(words)) == words
+    with pytest.raises(ValueError):
+        DMI.read_memory(dmi, 0xFFFFFF00, 4)
+
+
+def test_progbuf_postexec(dmi):
+    write_gpr(dmi, 1, 41)
+    dmi.write(PROGBUF0, word("addi", 1, 1, 1))
+    dmi.write(PROGBUF0 + 1, EBREAK)
+    dmi.write(COMMAND, COMMAND_POSTEXEC)
+    assert cmderr(dmi) == CMDERR_NONE
+    assert read_gpr(dmi, 1) == 42
+
+
+def test_progbuf_fault_sets_cmderr_exception(dmi):
+    write_gpr(dmi, 2, 0xFFFF0000)
+    dmi.write(PROGBUF0, word("lw", 1, 2, 0))
+    dmi.write(PROGBUF0 + 1, EBREAK)
+    dmi.write(COMMAND, COMMAND_POSTEXEC)
+    assert cmderr(dmi) == CMDERR_EXCEPTION
+    dmi.write(ABSTRACTCS, CMDERR_EXCEPTION << ABSTRACTCS_CMDERR_SHIFT)  # W1C
+    assert cmderr(dmi) == CMDERR_NONE
+
+
+def test_resume_runs_hart(dmi):
+    dmi.write(DMCONTROL, DMCONTROL_DMACTIVE | DMCONTROL_RESUMEREQ)
+    status = dmi.read(DMSTATUS)
+    assert status & DMSTATUS_ALLRUNNING and status & DMSTATUS_ALLRESUMEACK
+    dmi.run()
+    assert dmi.iss.regs[3] == 5 and dmi.iss.regs[4] == 7
@@ -0,0 +1,123 @@
+import socket
+import struct
+import threading
+
+import pytest
+
+import RISCV_asembler as asm
+from DebugModule import DebugModule
+from GdbServer import GdbServer, REG_PC, checksum
+from ISS import RISCV_ISS
+
+SOURCE = """.text
+_start:
+  addi x1, x0, 5
+  lui x2, 3
+  sw x1, 0(x2)
+  lw x3, 0(x2)
+  addi x4, x0, 7
+"""
+
+
+class RspClient:
+    """Client GDB remote protocol tối giản (có ack) nói chuyện với GdbServer qua socketpair."""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.buffer = b""
+
+    def _read(self, count=1):
+        while len(self.buffer) < count:
+            data = self.sock.recv(4096)
+            assert data, "server closed the connection"
+            self.buffer += data
+        data, self.buffer = self.buffer[:count], self.buffer[count:]
+        return data
+
+    def request(self, payload):
+        if isinstance(payload, str):
+            payload = payload.encode()
+        self.sock.sendall(b"$" + payload + b"#%02x" % checksum(payload))
+        assert self._read() == b"+"
+        assert self._read() == b"$"
+        reply = b""
+        while not reply.endswith(b"#"):
+            reply += self._read()
+        reply = reply[:-1]
+        assert int(self._read(2), 16) == checksum(reply)
+        self.sock.sendall(b"+")
+        return reply.decode("latin-1")
+
+
+@pytest.fixture
+def gdb():
+    iss = RISCV_ISS(0x10000)
+    iss.verbose = False
+    image = asm.assemble_string(SOURCE)
+    iss.load_image(image)
+    server = GdbServer(DebugModule(iss))
+    ours, theirs = socket.socketpair()
+    ours.settimeout(5)  # Server chết giữa chừng -> test lỗi thay vì treo
+    thread = threading.Thread(target=server.serve_connection, args=(theirs,), daemon=True)
+    thread.start()
+    client = RspClient(ours)
+    yield client, iss, image
+    ours.sendall(b"$k#6b")
+    thread.join(5)
+    ours.close()
+    theirs.close()
+
+
+def reg(value):
+    return struct.pack("<I", value).hex()
+
+
+def test_registers_round_trip(gdb):
+    client, iss, _ = gdb
+    assert len(client.request("g")) == 33 * 8
+    assert client.request("P5=" + reg(0xCAFEF00D)) == "OK"
+    assert client.request("p5") == reg(0xCAFEF00D)
+    assert iss.regs[5] == 0xCAFEF00D
+    assert client.request(f"P{REG_PC:x}=" + reg(8)) == "OK"
+    assert client.request(f"p{REG_PC:x}") == reg(8)
+
+
+def test_memory_round_trip(gdb):
+    client, iss, _ = gdb
+    assert client.request("M4000,4:efbeadde") == "OK"
+    assert client.request("m4000,4") == "efbeadde"
+    # X: '#', '$', '}' được escape bằng '}' + (byte ^ 0x20)
+    assert client.request(b"X4010,3:}\x03}\x04}]") == "OK"
+    assert bytes(iss.memory[0x4010:0x4013]) == b"#$}"
+    assert client.request("m4010,3") == "23247d"
+
+
+def test_breakpoint_step_and_continue(gdb):
+    client, iss, image = gdb
+    addr = image.entry + 8
+    assert client.request(f"Z0,{addr:x},4") == "OK"
+    assert client.request("c") == "T05swbreak:;"
+    assert client.request(f"p{REG_PC:x}") == reg(addr)
+    assert client.request(f"z0,{addr:x},4") == "OK"
+    assert client.request("s") == "T05"
+    assert client.request(f"p{REG_PC:x}") == reg(addr + 4)
+    assert client.request("c") == "W00"
+    assert iss.regs[3] == 5 and iss.regs[4] == 7
+
+
+def test_watchpoint_removal_matches_kind(gdb):
+    client, _, _ = gdb
+    assert client.request("Z2,3000,4") == "OK"
+    assert client.request("c") == "T05watch:3000;"
+    assert client.request("z3,3000,4") == "E01"  # Không có read watchpoint ở 0x3000
+    assert client.request("z2,3000,4") == "OK"
+    assert client.request("z2,3000,4") == "E01"
+
+
+def test_malformed_packets_return_e01(gdb):
+    client, _, _ = gdb
+    assert client.request("qXfer:features:read:target.xml:zz,10") == "E01"
+    assert client.request("qXfer:features:read:target.xml:0,10")[0] == "m"
+    assert client.request("mzz,4") == "E01"
+    assert client.request("mfffffff0,100") == "E01"
+    assert client.request("Pzz") == "E01"
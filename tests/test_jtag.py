@@ -0,0 +1,87 @@
+import socket
+import threading
+
+import pytest
+
+import DMI
+import RISCV_asembler as asm
+from DMI import (
+    COMMAND, COMMAND_SIZE_SHIFT, COMMAND_TRANSFER, COMMAND_WRITE, DATA0, DMCONTROL, DMCONTROL_DMACTIVE,
+    DMCONTROL_HALTREQ, DMCONTROL_RESUMEREQ, DMSTATUS, DMSTATUS_ALLHALTED, DMSTATUS_ALLRUNNING, REGNO_GPR,
+    SIZE_WORD,
+)
+from DebugModule import DebugModule
+from ISS import RISCV_ISS
+from Jtag import DTMCS_VALUE, IDCODE_VALUE, JtagClient, JtagServer
+
+SOURCE = """.text
+_start:
+  addi x1, x0, 5
+  lui x2, 3
+  sw x1, 0(x2)
+  lw x3, 0(x2)
+  addi x4, x0, 7
+"""
+
+
+@pytest.fixture
+def jtag():
+    iss = RISCV_ISS(0x10000)
+    iss.verbose = False
+    iss.load_image(asm.assemble_string(SOURCE))
+    server = JtagServer(DebugModule(iss))
+    listener = socket.create_server(("127.0.0.1", 0))
+    port = listener.getsockname()[1]
+
+    def serve():
+        conn, _ = listener.accept()
+        with conn:
+            server.serve_connection(conn)
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    client = JtagClient(port=port)
+    client.sock.settimeout(5)  # Server chết giữa chừng -> test lỗi thay vì treo
+    client.write(DMCONTROL, DMCONTROL_DMACTIVE)  # Như OpenOCD khi khởi tạo: DM ra khỏi reset
+    yield client, iss
+    client.close()
+    thread.join(5)
+    listener.close()
+    assert not thread.is_alive()
+
+
+def test_idcode_and_dtmcs(jtag):
+    client, _ = jtag
+    assert client.idcode() == IDCODE_VALUE
+    assert client.dtmcs() == DTMCS_VALUE
+
+
+def test_dmi_register_round_trip(jtag):
+    client, iss = jtag
+    client.write(DMCONTROL, DMCONTROL_DMACTIVE | DMCONTROL_HALTREQ)
+    assert client.read(DMSTATUS) & DMSTATUS_ALLHALTED
+    client.write(DATA0, 0x13579BDF)
+    client.write(COMMAND, COMMAND_TRANSFER | COMMAND_WRITE | (SIZE_WORD << COMMAND_SIZE_SHIFT) | (REGNO_GPR + 7))
+    client.write(DATA0, 0)
+    client.write(COMMAND, COMMAND_TRANSFER | (SIZE_WORD << COMMAND_SIZE_SHIFT) | (REGNO_GPR + 7))
+    assert client.read(DATA0) == 0x13579BDF
+    assert iss.regs[7] == 0x13579BDF
+
+
+def test_memory_round_trip(jtag):
+    client, _ = jtag
+    words = [(i << 24) | (i * 0x10203) for i in range(100)]
+    DMI.write_memory(client, 0x5000, words)
+    assert DMI.read_memory(client, 0x5000, len(words)) == words
+    assert DMI.read_memory(client, 0x0, 5) == asm.assemble_string(SOURCE).words()
+
+
+def test_resume_runs_hart(jtag):
+    client, iss = jtag
+    client.write(DMCONTROL, DMCONTROL_DMACTIVE | DMCONTROL_RESUMEREQ)
+    # Hart chạy giữa các packet; chương trình kết thúc ở word 0
+    for _ in range(100):
+        if not client.read(DMSTATUS) & DMSTATUS_ALLRUNNING:
+            break
+    assert iss.halted
+    assert (iss.regs[3], iss.regs[4]) == (5, 7)
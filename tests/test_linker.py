@@ -0,0 +1,114 @@
+import pytest
+
+import Linker
+import RISCV_asembler as asm
+from ISS import RISCV_ISS
+
+# main.s tham chiếu symbol của lib.s bằng mọi kiểu relocation và ngược lại (j back)
+MAIN = """.text
+_start:
+  la x5, val
+  lw x6, 0(x5)
+  lui x7, val
+  addi x7, x7, val
+  lw x8, 4(x7)
+  lui x9, other
+  lw x10, other(x9)
+  sw x6, other(x9)
+  lw x12, other(x9)
+  li x11, f
+  beq x0, x0, g
+back:
+  jal x1, f
+.data
+count: .word 3
+"""
+
+LIB = """.text
+g:
+  addi x14, x0, 9
+  j back
+f:
+  addi x13, x0, 5
+.data
+  .word 1
+val: .word 42, 43
+other: .word 7
+"""
+
+
+def link_pair(memory_map=None):
+    return Linker.link([asm.assemble_object(MAIN, "main.s"), asm.assemble_object(LIB, "lib.s")], memory_map)
+
+
+def test_objects_cover_every_relocation_kind():
+    main, lib = asm.assemble_object(MAIN, "main.s"), asm.assemble_object(LIB, "lib.s")
+    assert not main.errors and not lib.errors
+    kinds = {kind for _, kind, _ in main.relocations + lib.relocations}
+    assert kinds == set(asm.RELOCATION_KINDS)
+
+
+def test_link_matches_concatenated_source():
+    whole = asm.assemble_string(MAIN + LIB)
+    assert not whole.errors
+    linked = link_pair()
+    assert linked.text == whole.text
+    assert linked.data == whole.data
+    assert linked.symbols == whole.symbols
+    assert (linked.text_base, linked.data_base, linked.entry) == (whole.text_base, whole.data_base, whole.entry)
+
+
+@pytest.mark.parametrize("memory_map", [
+    {},
+    {".text": 0x100},
+    {".text": 0x100, ".data": 0x37F0},  # %lo âm: lui phải làm tròn %hi lên
+])
+def test_relocations_run_at_section_base(memory_map):
+    image = link_pair(memory_map)
+    iss = RISCV_ISS(0x10000)
+    iss.verbose = False
+    iss.load_image(image)
+    iss.run(100)
+    regs, symbols = iss.regs, image.symbols
+    assert regs[5] == regs[7] == symbols["val"]
+    assert (regs[6], regs[8], regs[10], regs[12]) == (42, 43, 7, 42)
+    assert regs[11] == symbols["f"]
+    assert (regs[13], regs[14]) == (5, 9)  # beq sang lib.s, j về main.s, jal tới f
+    assert regs[1] == symbols["back"] + 4
+
+
+def test_link_errors():
+    with pytest.raises(Linker.LinkError):
+        Linker.link([asm.assemble_object(".text\n j nowhere\n", "a.s")])
+    with pytest.raises(Linker.LinkError):
+        Linker.link([asm.assemble_object(".text\nx:\n", "a.s"), asm.assemble_object(".text\nx:\n", "b.s")])
+
+
+def test_object_cache_counts(tmp_path):
+    main, lib = tmp_path / "main.s", tmp_path / "lib.s"
+    main.write_text(MAIN)
+    lib.write_text(LIB)
+    paths = [str(main), str(lib)]
+    directory = str(tmp_path / "cache")
+
+    cache = Linker.ObjectCache(directory)
+    first = Linker.build(paths, cache)
+    assert (cache.assembled, cache.reused) == (2, 0)
+    Linker.build(paths, cache)
+    assert (cache.assembled, cache.reused) == (2, 2)
+
+    # Cache mới trên cùng thư mục: đọc lại object từ đĩa, không dịch
+    cache = Linker.ObjectCache(directory)
+    assert Linker.build(paths, cache).text == first.text
+    assert (cache.assembled, cache.reused) == (0, 2)
+
+    # Chỉ file bị sửa được dịch lại
+    lib.write_text(LIB.replace("addi x14, x0, 9", "addi x14, x0, 10"))
+    cache = Linker.ObjectCache(directory)
+    Linker.build(paths, cache)
+    assert (cache.assembled, cache.reused) == (1, 1)
+
+    # Cùng nội dung dưới tên khác dùng lại object nhưng giữ tên mới
+    obj = cache.get_source(MAIN, "copy.s")
+    assert obj.name == "copy.s"
+    assert (cache.assembled, cache.reused) == (1, 2)